@@ -0,0 +1,59 @@
+'''
+Cost of building models from bulk responses: parsing the JSON and matching
+each object in the constructors, against the installed fast decoder and `from_page`
+
+    python bench/bench_decode.py
+'''
+import json, timeit
+
+from SlyTwitter import twitter, twitter_v2
+from SlyTwitter.common import loads
+
+def v1_users(n: int) -> str:
+    return json.dumps([{'id': i, 'screen_name': F'user{i}', 'name': F'User {i}', 'location': 'Somewhere',
+        'url': None, 'description': 'Benchmarking model construction', 'verified': False, 'protected': False,
+        'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'profile_image_url_https': 'https://pbs.twimg.com/a.png'}
+        for i in range(1, n+1)])
+
+def v1_tweets(n: int) -> str:
+    return json.dumps([{'id': i, 'full_text': F'tweet number {i}', 'user': {'screen_name': F'user{i}'}}
+        for i in range(1, n+1)])
+
+def v2_users(n: int) -> str:
+    return json.dumps({'data': [{'id': str(i), 'username': F'user{i}', 'name': F'User {i}',
+        'public_metrics': {'followers_count': i, 'following_count': 1, 'tweet_count': 2, 'listed_count': 0}}
+        for i in range(1, n+1)], 'meta': {'result_count': n}})
+
+def v2_tweets(n: int) -> str:
+    return json.dumps({'data': [{'id': str(i), 'text': F'tweet number {i}', 'author_id': '1'}
+        for i in range(1, n+1)], 'includes': {'users': [{'id': '1', 'username': 'a', 'name': 'A'}]}})
+
+CASES = {
+    'v1 users/lookup': (v1_users,
+        lambda body: [twitter.User(u) for u in json.loads(body)],
+        lambda body: twitter.User.from_page(loads(body))),
+    'v1 timeline': (v1_tweets,
+        lambda body: [twitter.Tweet(t) for t in json.loads(body)],
+        lambda body: twitter.Tweet.from_page(loads(body))),
+    'v2 followers page': (v2_users,
+        lambda body: (page := json.loads(body), includes := twitter_v2.Includes(page),
+            [twitter_v2.User(u, includes) for u in page['data']]),
+        lambda body: (page := loads(body), twitter_v2.User.from_page(page['data'], twitter_v2.Includes(page)))),
+    'v2 tweets page': (v2_tweets,
+        lambda body: (page := json.loads(body), includes := twitter_v2.Includes(page),
+            [twitter_v2.Tweet(t, includes) for t in page['data']]),
+        lambda body: (page := loads(body), twitter_v2.Tweet.from_page(page['data'], twitter_v2.Includes(page)))),
+}
+
+if __name__ == '__main__':
+    print(F'decoder: {loads.__module__}.{loads.__qualname__}')
+    for name, (make_body, before, after) in CASES.items():
+        for items in [100, 1000]:
+            body = make_body(items)
+            number = max(1, 20_000 // items)
+            results = []
+            for label, build in [('constructors', before), ('from_page', after)]:
+                seconds = min(timeit.repeat(lambda: build(body), number=number, repeat=5)) / number
+                results.append(seconds)
+                print(F'{name:<20} {items:>5} items  {label:<13} {seconds/items*1e6:>8.2f} µs/item')
+            print(F'{"":<34}{results[0]/results[1]:>18.1f}x faster')
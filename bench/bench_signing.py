@@ -0,0 +1,36 @@
+'''
+Per-request cost of OAuth1 signing, with SlyAPI's `OAuth1` and with `OAuth1Signer`
+
+    python bench/bench_signing.py
+'''
+import base64, os, timeit
+
+from SlyAPI.oauth1 import OAuth1, OAuth1App, OAuth1User
+from SlyAPI.web import Method, Request
+
+from SlyTwitter.signing import OAuth1Signer
+
+AUTH = OAuth1(
+    OAuth1App('consumer-key', 'consumer-secret', 'https://request', 'https://authorize', 'https://access'),
+    OAuth1User('user-key', 'user-secret'))
+
+def tweet_request() -> Request:
+    return Request(Method.POST, 'https://api.twitter.com/1.1/statuses/update.json',
+        data={'status': 'Benchmarking request signing, with some ünïcödé and spaces.'})
+
+def append_request(size: int) -> Request:
+    chunk = base64.b64encode(os.urandom(size)).decode('ascii')
+    return Request(Method.POST, 'https://upload.twitter.com/1.1/media/upload.json',
+        data={'command': 'APPEND', 'media_id': '1234567890', 'segment_index': '0', 'media': chunk})
+
+def bench(name: str, make_request, number: int):
+    signer = OAuth1Signer(AUTH)
+    request = make_request()
+    for label, sign in [('SlyAPI', lambda: AUTH.app.sign(request, AUTH.user)), ('OAuth1Signer', lambda: signer.sign(request))]:
+        seconds = min(timeit.repeat(sign, number=number, repeat=5)) / number
+        print(F'{name:<24} {label:<14} {seconds*1e6:>12.1f} µs/request')
+
+if __name__ == '__main__':
+    bench('statuses/update', tweet_request, 2000)
+    bench('APPEND 64 KiB base64', lambda: append_request(64*1024), 20)
+    bench('APPEND 1 MiB base64', lambda: append_request(1024*1024), 3)
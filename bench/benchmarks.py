@@ -0,0 +1,177 @@
+'''
+Benchmarks against a local mock twitter API
+
+    python bench/benchmarks.py [--quick] [--out bench/results] [--compare RESULTS.json]
+
+The mock server runs in its own process, so its work is not counted.
+Results are saved as JSON in the output directory, and compared with the
+latest earlier results there, or with --compare.
+'''
+import argparse, asyncio, glob, json, multiprocessing, os, platform, time, tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+from SlyAPI.oauth1 import OAuth1, OAuth1App, OAuth1User
+from SlyAPI.oauth2 import OAuth2, OAuth2App, OAuth2User
+
+from SlyTwitter import Twitter, TwitterV2
+from SlyTwitter.mock import MockTwitter
+from SlyTwitter.twitter_upload import AppendEncoding
+
+import bench_signing
+
+V1_AUTH = OAuth1(
+    OAuth1App('key', 'secret', 'https://request', 'https://authorize', 'https://access'),
+    OAuth1User('key', 'secret'))
+V2_AUTH = OAuth2(
+    OAuth2App('id', 'secret', 'https://authorize', 'https://token'),
+    OAuth2User('token', 'refresh', datetime.max))
+
+MIB = 1024 * 1024
+
+def _serve(options: dict[str, Any], urls: 'multiprocessing.Queue[str]'):
+    async def main():
+        mock = MockTwitter(**options)
+        urls.put(await mock.start())
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+class MockProcess:
+    '''A `MockTwitter` serving from another process'''
+    def __init__(self, **options: Any):
+        self.options = options
+
+    def __enter__(self) -> str:
+        urls: 'multiprocessing.Queue[str]' = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=(self.options, urls), daemon=True)
+        self.process.start()
+        self.url = urls.get(timeout=30)
+        return self.url
+
+    def __exit__(self, *_):
+        self.process.terminate()
+        self.process.join()
+
+def point(url: str, *clients: Any):
+    mock = MockTwitter()
+    mock.url = url
+    mock.point(*clients)
+
+async def measure(run: Callable[[], Awaitable[float]]) -> tuple[float, float, float]:
+    '''Run a benchmark, returning its amount of work, the seconds it took, and peak traced MiB.'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        work = await run()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return work, elapsed, peak / MIB
+
+async def bench_upload(results: dict[str, Any], quick: bool):
+    sizes = [1, 8] if quick else [1, 8, 32, 128]
+    with MockProcess(latency=0.002) as url:
+        twitter = Twitter(V1_AUTH)
+        point(url, twitter)
+        for size in sizes:
+            data = os.urandom(size * MIB)
+            for encoding in AppendEncoding:
+                for concurrency in [1, 4]:
+                    async def upload():
+                        await twitter.upload_media((data, 'mp4'), concurrency=concurrency, encoding=encoding)
+                        return size
+                    mib, seconds, peak = await measure(upload)
+                    results[F'upload {size} MiB {encoding.name.lower()} x{concurrency}'] = \
+                        { 'value': mib / seconds, 'unit': 'MiB/s', 'peak_mib': peak }
+
+async def bench_pagination(results: dict[str, Any], quick: bool):
+    followers = 20_000 if quick else 200_000
+    with MockProcess(followers=followers, latency=0.002) as url:
+        twitter, twitter_v2 = Twitter(V1_AUTH), TwitterV2(V2_AUTH)
+        point(url, twitter, twitter_v2)
+        me = await twitter_v2.me()
+        for prefetch in [False, True]:
+            async def v2_followers():
+                count = 0
+                async for _ in await twitter_v2.all_followers_of(me, prefetch=prefetch):
+                    count += 1
+                return count
+            items, seconds, peak = await measure(v2_followers)
+            results[F'v2 followers {"prefetch" if prefetch else "sequential"}'] = \
+                { 'value': items / seconds, 'unit': 'items/s', 'peak_mib': peak }
+
+        async def v1_follower_ids():
+            return len(await twitter.follower_ids(1))
+        items, seconds, peak = await measure(v1_follower_ids)
+        results['v1 follower ids'] = { 'value': items / seconds, 'unit': 'items/s', 'peak_mib': peak }
+
+async def bench_lookup(results: dict[str, Any], quick: bool):
+    calls = 200 if quick else 1000
+    with MockProcess(latency=0.005) as url:
+        twitter = Twitter(V1_AUTH)
+        batched = TwitterV2(V2_AUTH, batch_window=0.0)
+        point(url, twitter, batched)
+        for concurrency in [1, 16, 64]:
+            async def check_follows():
+                semaphore = asyncio.Semaphore(concurrency)
+                async def check(i: int):
+                    async with semaphore:
+                        await twitter.check_follow(F'@user{i}', '@user1')
+                await asyncio.gather(*(check(i) for i in range(calls)))
+                return calls
+            requests, seconds, peak = await measure(check_follows)
+            results[F'check_follow x{concurrency}'] = { 'value': requests / seconds, 'unit': 'req/s', 'peak_mib': peak }
+
+        async def batched_users():
+            await asyncio.gather(*(batched.user(F'user{i}') for i in range(calls)))
+            return calls
+        lookups, seconds, peak = await measure(batched_users)
+        results['v2 user, batched'] = { 'value': lookups / seconds, 'unit': 'lookups/s', 'peak_mib': peak }
+
+def bench_sign(results: dict[str, Any]):
+    import timeit
+    signer = bench_signing.OAuth1Signer(bench_signing.AUTH)
+    request = bench_signing.tweet_request()
+    seconds = min(timeit.repeat(lambda: signer.sign(request), number=2000, repeat=5)) / 2000
+    results['sign statuses/update'] = { 'value': seconds * 1e6, 'unit': 'µs', 'peak_mib': None }
+
+def compare(results: dict[str, Any], previous_path: str | None):
+    previous: dict[str, Any] = {}
+    if previous_path is not None:
+        with open(previous_path, 'r', encoding='utf8') as f:
+            previous = json.load(f)['results']
+        print(F'compared with {previous_path}')
+    for name, result in results.items():
+        line = F"{name:<36} {result['value']:>12.1f} {result['unit']:<10}"
+        if result['peak_mib'] is not None:
+            line += F" peak {result['peak_mib']:>8.1f} MiB"
+        if name in previous and previous[name]['value']:
+            change = (result['value'] - previous[name]['value']) / previous[name]['value']
+            line += F"  {change:+.1%}"
+        print(line)
+
+async def main(args: argparse.Namespace):
+    results: dict[str, Any] = {}
+    await bench_upload(results, args.quick)
+    await bench_pagination(results, args.quick)
+    await bench_lookup(results, args.quick)
+    bench_sign(results)
+
+    os.makedirs(args.out, exist_ok=True)
+    earlier = sorted(glob.glob(os.path.join(args.out, '*.json')))
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    path = os.path.join(args.out, F'{stamp}.json')
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump({ 'time': stamp, 'quick': args.quick, 'python': platform.python_version(),
+                    'machine': platform.machine(), 'results': results }, f, indent=2)
+
+    compare(results, args.compare or (earlier[-1] if earlier else None))
+    print(F'saved {path}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast check')
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(__file__), 'results'))
+    parser.add_argument('--compare', help='results to compare with, instead of the latest earlier ones')
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,13 @@
 from .twitter import Twitter as Twitter
 from .twitter_v2 import TwitterV2 as TwitterV2
+from .cache import ResponseCache as ResponseCache
+from .ratelimit import RateLimiter as RateLimiter
+from .media_cache import MediaCache as MediaCache, MemoryMediaStore as MemoryMediaStore, FileMediaStore as FileMediaStore
+from .columnar import ColumnarWriter as ColumnarWriter, write_columns as write_columns, load_columns as load_columns
+from .graph import FollowSnapshot as FollowSnapshot, take_snapshot as take_snapshot
+from .snapshots import SnapshotStore as SnapshotStore, sync_follows as sync_follows
+from .session import TwitterSession as TwitterSession
+from .pool import TwitterPool as TwitterPool
+from .timelines import WatermarkStore as WatermarkStore, TimelinePoller as TimelinePoller
+from .instrument import Instrument as Instrument, Instruments as Instruments, Metrics as Metrics
 from SlyAPI import OAuth1 as OAuth1, OAuth2 as OAuth2
\ No newline at end of file
@@ -0,0 +1,127 @@
+'''
+Cache for responses from read endpoints
+'''
+import asyncio, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from SlyAPI.web import ApiError
+
+from .common import TwitterError
+
+T = TypeVar('T')
+
+def _not_found(errors: Any) -> bool:
+    '''Whether a v2 error payload, or one from `BatchLoader`, only says things were not found'''
+    match errors:
+        case { 'title': 'Not Found Error' } | { 'detail': 'Not found' }:
+            return True
+        case [_, *_]:
+            return all(_not_found(error) for error in errors)
+        case _:
+            return False
+
+def is_missing(error: BaseException) -> bool:
+    '''
+    Whether an error means that the thing looked up does not exist, rather
+    than that it could not be read, such as a suspended user
+    '''
+    match error:
+        case ApiError(status=404):
+            return True
+        case TwitterError():
+            return _not_found(error._obj)
+        case _:
+            return False
+
+def _retrieve(task: 'asyncio.Task[Any]'):
+    if not task.cancelled():
+        task.exception() # mark as retrieved, in case every caller gave up
+
+class ResponseCache:
+    '''
+    TTL and LRU cache in front of read endpoints.
+    Each endpoint can have its own TTL, lookups of missing things are
+    cached for `negative_ttl`, and concurrent lookups of the same key share
+    one request.
+    '''
+    max_entries: int
+    ttls: dict[str, float]
+    default_ttl: float
+    negative_ttl: float
+
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+
+    _entries: OrderedDict[tuple[str, Hashable], tuple[float, object, BaseException | None]]
+    _in_flight: dict[tuple[str, Hashable], 'asyncio.Task[Any]']
+
+    def __init__(self, max_entries: int = 10_000, ttls: dict[str, float] | None = None,
+            default_ttl: float = 5*60, negative_ttl: float = 60):
+        '''`ttls` are in seconds by endpoint, such as `'friendships/show'` or `'users/by/username'`.'''
+        self.max_entries = max_entries
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return F"{len(self)} entries, {self.hits} hits, {self.misses} misses, {self.coalesced} coalesced"
+
+    def _store(self, key: tuple[str, Hashable], value: object, error: BaseException | None):
+        ttl = self.negative_ttl if error is not None else self.ttls.get(key[0], self.default_ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, endpoint: str, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        '''Get a cached response, or `fetch` it if there is none or it has expired.'''
+        full_key = (endpoint, key)
+        if (entry := self._entries.get(full_key)) is not None:
+            expires_at, value, error = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(full_key)
+                if error is not None:
+                    raise error
+                return value # type: ignore
+            del self._entries[full_key]
+
+        if (in_flight := self._in_flight.get(full_key)) is None:
+            self.misses += 1
+            in_flight = self._in_flight[full_key] = asyncio.ensure_future(self._fetch(full_key, fetch))
+            in_flight.add_done_callback(_retrieve)
+        else:
+            self.coalesced += 1
+        # one caller giving up should not cancel the request for the rest
+        return await asyncio.shield(in_flight)
+
+    async def _fetch(self, full_key: tuple[str, Hashable], fetch: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value = await fetch()
+        except Exception as e:
+            if is_missing(e):
+                self._store(full_key, None, e)
+            raise
+        finally:
+            del self._in_flight[full_key]
+        self._store(full_key, value, None)
+        return value
+
+    def invalidate(self, endpoint: str | None = None, key: Hashable = None):
+        '''Forget cached responses for one key, one endpoint, or everything.'''
+        if endpoint is None:
+            self._entries.clear()
+        elif key is not None:
+            self._entries.pop((endpoint, key), None)
+        else:
+            for full_key in [k for k in self._entries if k[0] == endpoint]:
+                del self._entries[full_key]
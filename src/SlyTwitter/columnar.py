@@ -0,0 +1,274 @@
+'''
+Writing large crawls of users to compact columns on disk
+'''
+import json, os, struct, sys
+from array import array
+from typing import Any, Callable, Generic, Iterator, Sequence, TypeVar, overload
+
+from .pagination import Paginated
+
+T = TypeVar('T')
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# fixed size, so the shape can be rewritten in place as rows are added
+NPY_HEADER_SIZE = 128
+NPY_INT64 = '<i8'
+META_FILE = 'meta.json'
+
+# string columns of users, by how to get them
+USER_COLUMNS: dict[str, Callable[[Any], str | None]] = {
+    'at': lambda user: user.at,
+    'display_name': lambda user: user.display_name,
+}
+
+def _npy_header(length: int) -> bytes:
+    header = F"{{'descr': '{NPY_INT64}', 'fortran_order': False, 'shape': ({length},), }}"
+    header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 3) + '\n'
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == 'big':
+        values = array('q', values)
+        values.byteswap()
+    return values
+
+class _Int64File:
+    '''Append-only .npy file of int64'''
+    path: str
+    length: int
+
+    def __init__(self, path: str, length: int):
+        self.path = path
+        self.length = length
+        if length == 0:
+            self._file = open(path, 'w+b')
+            self._file.write(_npy_header(0))
+        else:
+            self._file = open(path, 'r+b')
+            # anything past the last committed row is from an interrupted write
+            self._file.truncate(NPY_HEADER_SIZE + 8*length)
+            self._file.seek(0, os.SEEK_END)
+
+    def append(self, values: array):
+        self._file.write(_little_endian(values).tobytes())
+        self.length += len(values)
+
+    def last(self) -> int:
+        self._file.seek(-8, os.SEEK_END)
+        value, = struct.unpack('<q', self._file.read(8))
+        return value
+
+    def flush(self):
+        self._file.seek(0)
+        self._file.write(_npy_header(self.length))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+class _StringFile:
+    '''Strings packed one after another as UTF-8, with an int64 column of where each ends'''
+    _data: Any
+    _offsets: _Int64File
+
+    def __init__(self, path: str, rows: int):
+        self._offsets = _Int64File(path + '.offsets.npy', rows + 1 if rows else 0)
+        if rows == 0:
+            self._offsets.append(array('q', [0]))
+            self._data = open(path + '.utf8', 'w+b')
+        else:
+            end = self._offsets.last()
+            self._data = open(path + '.utf8', 'r+b')
+            self._data.truncate(end)
+            self._data.seek(0, os.SEEK_END)
+        self._end = self._offsets.last()
+
+    def append(self, values: list[str | None]):
+        encoded = [(v or '').encode('utf8') for v in values]
+        ends = array('q')
+        for text in encoded:
+            self._end += len(text)
+            ends.append(self._end)
+        self._data.write(b''.join(encoded))
+        self._offsets.append(ends)
+
+    def flush(self):
+        self._data.flush()
+        self._offsets.flush()
+
+    def close(self):
+        self._data.close()
+        self._offsets.close()
+
+class ColumnarWriter(Generic[T]):
+    '''
+    Writes items with an `id` to a directory of columns, a page at a time:
+    `id.npy` has the int64 IDs, and each string column has its UTF-8 text
+    packed in `<name>.utf8`, with `<name>.offsets.npy` holding where each row
+    ends. The .npy files load with `numpy.load`, memory mapped if wanted.
+
+    Only the current page is held in memory. Rows are committed by `commit`,
+    and opening an existing directory with `append` continues after the
+    last committed row.
+    '''
+    path: str
+    rows: int
+    columns: dict[str, Callable[[T], str | None]]
+    resume_token: str | None
+    done: bool
+
+    def __init__(self, path: str, columns: dict[str, Callable[[T], str | None]] | None = None, append: bool = False):
+        self.path = path
+        self.columns = USER_COLUMNS if columns is None else columns
+        self.rows = 0
+        self.resume_token = None
+        self.done = False
+        meta_path = os.path.join(path, META_FILE)
+        if append and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf8') as f:
+                meta = json.load(f)
+            if meta['columns'] != list(self.columns):
+                raise ValueError(F"Columns {list(self.columns)} do not match existing columns {meta['columns']}")
+            self.rows = meta['rows']
+            self.resume_token = meta['resume_token']
+            self.done = meta['done']
+        os.makedirs(path, exist_ok=True)
+        self._ids = _Int64File(os.path.join(path, 'id.npy'), self.rows)
+        self._strings = { name: _StringFile(os.path.join(path, name), self.rows) for name in self.columns }
+
+    def write(self, items: Sequence[T]):
+        '''Add a page of items.'''
+        self._ids.append(array('q', (item.id for item in items))) # type: ignore
+        for name, get in self.columns.items():
+            self._strings[name].append([get(item) for item in items])
+
+    def commit(self, resume_token: str | None, done: bool = False):
+        '''Make the rows written so far durable, along with where to continue from.'''
+        self._ids.flush()
+        for strings in self._strings.values():
+            strings.flush()
+        self.rows = self._ids.length
+        self.resume_token = resume_token
+        self.done = done
+        # write then rename, so a crash never leaves a partial file
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + '.tmp', 'w', encoding='utf8') as f:
+            json.dump({ 'rows': self.rows, 'columns': list(self.columns),
+                        'resume_token': resume_token, 'done': done }, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def close(self):
+        self._ids.close()
+        for strings in self._strings.values():
+            strings.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+async def write_columns(paginated: Paginated[T], path: str,
+        columns: dict[str, Callable[[T], str | None]] | None = None, append: bool = False) -> int:
+    '''
+    Write every item of a paginated iterator to columns, committing after
+    each page. If interrupted, pass the `resume_token` of `load_columns`
+    to the iterator, and `append` here, to continue where it stopped.
+    Returns the total number of rows.
+    '''
+    with ColumnarWriter(path, columns, append) as writer:
+        async for page in paginated.pages():
+            writer.write(page)
+            writer.commit(paginated.next_token, paginated.next_token is None)
+        if not writer.done: # no items on the last page
+            writer.commit(None, True)
+        return writer.rows
+
+class StringColumn(Sequence[str]):
+    '''Read-only column of strings packed as UTF-8'''
+    _data: bytes
+    _offsets: Sequence[int]
+
+    def __init__(self, data: bytes, offsets: Sequence[int]):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._data[self._offsets[index]:self._offsets[index+1]].decode('utf8')
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+def _read_int64(path: str, length: int, mmap: bool) -> Sequence[int]:
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        return numpy.load(path, mmap_mode='r' if mmap else None)[:length]
+    with open(path, 'rb') as f:
+        f.seek(len(NPY_MAGIC))
+        header_len, = struct.unpack('<H', f.read(2))
+        f.seek(len(NPY_MAGIC) + 2 + header_len)
+        values = array('q')
+        values.frombytes(f.read(8*length))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+class Columns:
+    '''
+    Columns written by a `ColumnarWriter`. IDs are a NumPy array if NumPy is
+    installed, otherwise an `array('q')`.
+    '''
+    ids: Sequence[int]
+    rows: int
+    resume_token: str | None
+    done: bool
+    _path: str
+    _names: list[str]
+
+    def __init__(self, path: str, mmap: bool = True):
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf8') as f:
+            meta = json.load(f)
+        self._path = path
+        self._names = meta['columns']
+        self.rows = meta['rows']
+        self.resume_token = meta['resume_token']
+        self.done = meta['done']
+        self.ids = _read_int64(os.path.join(path, 'id.npy'), self.rows, mmap)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> StringColumn:
+        '''Load a string column.'''
+        if name not in self._names:
+            raise KeyError(name)
+        base = os.path.join(self._path, name)
+        offsets = _read_int64(base + '.offsets.npy', self.rows + 1, False)
+        with open(base + '.utf8', 'rb') as f:
+            data = f.read(offsets[-1])
+        return StringColumn(data, offsets)
+
+    def id_set(self) -> set[int]:
+        return set(self.ids.tolist()) # type: ignore
+
+def load_columns(path: str, mmap: bool = True) -> Columns:
+    '''Open columns written by `write_columns`, with IDs memory mapped if NumPy is installed and `mmap` is set.'''
+    return Columns(path, mmap)
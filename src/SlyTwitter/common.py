@@ -1,5 +1,35 @@
-import re
-from typing import ParamSpec, TypeVar, Any
+import asyncio, json, re
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Generic, Iterable, Iterator, ParamSpec, Sequence, TypeVar, Any
+
+import aiohttp
+from SlyAPI import WebAPI
+from SlyAPI.auth import Auth
+from SlyAPI.oauth1 import OAuth1
+from SlyAPI.web import ApiError, Request
+
+from .instrument import Instruments, RequestEvent
+from .ratelimit import RateLimiter, endpoint_family
+from .session import TwitterSession
+from .signing import OAuth1Signer
+
+def _json_decoder() -> Callable[[str | bytes], Any]:
+    '''The fastest JSON decoder installed: orjson, msgspec, or the standard library's'''
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        return orjson.loads
+    try:
+        import msgspec
+    except ImportError:
+        pass
+    else:
+        return msgspec.json.decode
+    return json.loads
+
+loads = _json_decoder()
 
 RE_FILE_URL = re.compile(r'https?://[^\s]+\.(?P<extension>png|jpg|jpeg|gif|mp4|webp|webm)', re.IGNORECASE)
 
@@ -8,9 +38,255 @@ R = TypeVar('R')
 S = TypeVar('S')
 T = TypeVar('T')
 
+def batched(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    '''Split a sequence into batches of at most `size` items'''
+    for start in range(0, len(items), size):
+        yield items[start:start+size]
+
+async def gather_batches(batches: Iterable[S], fetch: Callable[[S], Awaitable[Iterable[R]]], concurrency: int) -> AsyncGenerator[R, None]:
+    '''
+    Run `fetch` on each batch, up to `concurrency` at once,
+    yielding the results of each batch as soon as it finishes.
+    '''
+    pending_batches = iter(batches)
+    running: set[asyncio.Task[Iterable[R]]] = set()
+    try:
+        while True:
+            while len(running) < concurrency and (batch := next(pending_batches, None)) is not None:
+                running.add(asyncio.ensure_future(fetch(batch)))
+            if not running:
+                break
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for result in task.result():
+                    yield result
+    finally:
+        for task in running:
+            task.cancel()
+
+class BulkResult(Generic[S, R]):
+    '''Outcome of one item of a bulk operation: its value, or the error it failed with'''
+    __slots__ = ('index', 'item', 'value', 'error')
+    index: int
+    item: S
+    value: R | None
+    error: BaseException | None
+
+    def __init__(self, index: int, item: S, value: R | None = None, error: BaseException | None = None):
+        self.index = index
+        self.item = item
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def unwrap(self) -> R:
+        '''The value, or raise the error.'''
+        if self.error is not None:
+            raise self.error
+        return self.value # type: ignore
+
+    def __repr__(self) -> str:
+        outcome = F"value={self.value!r}" if self.error is None else F"error={self.error!r}"
+        return F"BulkResult({self.index}, {self.item!r}, {outcome})"
+
+async def run_bulk(items: Iterable[S], action: Callable[[S], Awaitable[R]], concurrency: int,
+        ordered: bool = True) -> AsyncGenerator[BulkResult[S, R], None]:
+    '''
+    Run `action` on each item, up to `concurrency` at once, yielding a
+    `BulkResult` for each instead of stopping at the first error.
+    Results are yielded in the order of `items` if `ordered`, otherwise as
+    each finishes. When ordered, items more than a few batches ahead of the
+    first unfinished one wait to start, so finished results do not pile up.
+    '''
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least 1.")
+    pending = enumerate(items)
+    running: dict[asyncio.Task[R], tuple[int, S]] = {}
+    finished: dict[int, BulkResult[S, R]] = {}
+    next_index = 0 # next result to yield, when ordered
+    started = 0
+    try:
+        while True:
+            while len(running) < concurrency and (not ordered or started - next_index < 4*concurrency) \
+                    and (entry := next(pending, None)) is not None:
+                running[asyncio.ensure_future(action(entry[1]))] = entry
+                started += 1
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, item = running.pop(task)
+                if task.cancelled():
+                    result = BulkResult[S, R](index, item, error=asyncio.CancelledError())
+                elif (error := task.exception()) is not None:
+                    result = BulkResult[S, R](index, item, error=error)
+                else:
+                    result = BulkResult[S, R](index, item, task.result())
+                if ordered:
+                    finished[index] = result
+                else:
+                    yield result
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+    finally:
+        for task in running:
+            task.cancel()
+
 class TwitterError(Exception):
     _obj: object
 
     def __init__(self, errorobj: Any) -> None:
         super().__init__()
-        self._obj = errorobj
\ No newline at end of file
+        self._obj = errorobj
+
+class BatchError(Exception):
+    '''Some items of a batch operation failed'''
+    results: list[Any]
+
+    def __init__(self, results: list[Any]) -> None:
+        super().__init__()
+        self.results = results
+
+    @property
+    def errors(self) -> dict[int, BaseException]:
+        '''Errors by the index of the item that failed'''
+        return {i: r for i, r in enumerate(self.results) if isinstance(r, BaseException)}
+
+    def __str__(self) -> str:
+        errors = self.errors
+        return F"{len(errors)} of {len(self.results)} items failed: " + \
+            ', '.join(F"[{i}] {e!r}" for i, e in errors.items())
+
+
+class TwitterWebAPI(WebAPI):
+    '''
+    Base for twitter clients. Delays requests that would go over a rate limit,
+    and retries requests that were rate limited anyway.
+    Requests go through `session` if given, instead of a client of its own.
+    OAuth1 requests are signed with an `OAuth1Signer`.
+    Every request attempt, retry and rate limit wait is reported to `instruments`.
+    '''
+    rate_limits: RateLimiter
+    instruments: Instruments
+    _signer: OAuth1Signer | None
+
+    def __init__(self, auth: Auth, rate_limits: RateLimiter | None = None,
+            session: TwitterSession | aiohttp.ClientSession | None = None, instruments: Instruments | None = None) -> None:
+        if session is None:
+            super().__init__(auth)
+        else:
+            # skip opening a client, and never close the shared one
+            self.auth = auth
+            self._client = session.client if isinstance(session, TwitterSession) else session
+            self._client_close_semaphone = asyncio.Semaphore(0)
+        self.rate_limits = rate_limits if rate_limits is not None else RateLimiter()
+        self.instruments = instruments if instruments is not None else Instruments()
+        self._signer = OAuth1Signer(auth) if isinstance(auth, OAuth1) else None
+
+    async def _json_request(self, req: Request) -> Any:
+        return loads(await self._text_request(req))
+
+    async def _sign(self, request: Request) -> Request:
+        if self._signer is not None:
+            return self._signer.sign(request)
+        return await self.auth.sign(self._client, request)
+
+    async def _base_request(self, request: Request) -> str|None:
+        request.url = self.get_full_url(request.url)
+        family = endpoint_family(request.url)
+
+        # multipart bodies are not part of the OAuth1 signature base string,
+        # so sign the request without its body and attach it afterwards.
+        # they can only be sent once, so they are not retried after a 429.
+        form = None
+        if isinstance(request.data, aiohttp.FormData):
+            form = request.data
+            request.data = {}
+
+        instruments = self.instruments
+        attempt = 0
+        while True:
+            waited = await self.rate_limits.acquire(family)
+            if waited and instruments:
+                instruments.rate_limit_wait(family, waited)
+            signed = await self._sign(request)
+            if form is not None:
+                signed.data = form # type: ignore
+            event = None
+            if instruments:
+                event = RequestEvent(request.method.value, request.url, family, attempt)
+                instruments.request_start(event)
+            try:
+                async with signed.send(self._client) as resp:
+                    self.rate_limits.update(family, resp.status, resp.headers)
+                    if event is not None:
+                        event.status = resp.status
+                        event.request_bytes = int(resp.request_info.headers.get('Content-Length', 0))
+                        event.response_bytes = len(await resp.read()) # kept for .text()
+                    if resp.status != 429 or form is not None or attempt >= self.rate_limits.max_retries:
+                        if resp.status >= 400:
+                            raise await ApiError.from_resposnse(resp)
+                        elif resp.status == 204:
+                            return None
+                        else:
+                            return await resp.text()
+            except BaseException as e:
+                if event is not None:
+                    event.error = e
+                raise
+            finally:
+                if event is not None:
+                    event.finish()
+                    instruments.request_end(event)
+            attempt += 1
+            if instruments:
+                instruments.retry(family, attempt, None)
+
+    @asynccontextmanager
+    async def _open_stream(self, request: Request, connect_timeout: float | None = None,
+            read_timeout: float | None = None) -> AsyncIterator[aiohttp.ClientResponse]:
+        '''
+        Send a request, and give its response as soon as it starts, to read
+        a body that may never end. Unlike other requests, it has no overall
+        time limit, and is not retried. Connecting, TLS included, gives up after
+        `connect_timeout`, and any wait for data, from the response headers on,
+        after `read_timeout`.
+        Raises `ApiError` if it failed.
+        '''
+        request.url = self.get_full_url(request.url)
+        family = endpoint_family(request.url)
+        instruments = self.instruments
+        waited = await self.rate_limits.acquire(family)
+        if waited and instruments:
+            instruments.rate_limit_wait(family, waited)
+        signed = await self._sign(request)
+        event = None
+        if instruments:
+            event = RequestEvent(request.method.value, request.url, family, 0)
+            instruments.request_start(event)
+        timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        try:
+            async with self._client.request(signed.method.value, signed.url, params=signed.query_params or None,
+                    headers=signed.headers or None, timeout=timeout) as resp:
+                self.rate_limits.update(family, resp.status, resp.headers)
+                if event is not None:
+                    event.status = resp.status
+                if resp.status >= 400:
+                    raise await ApiError.from_resposnse(resp)
+                try:
+                    yield resp
+                finally:
+                    if event is not None:
+                        event.response_bytes = resp.content.total_bytes
+        except BaseException as e:
+            if event is not None:
+                event.error = e
+            raise
+        finally:
+            if event is not None:
+                event.finish()
+                instruments.request_end(event)
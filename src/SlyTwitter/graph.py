@@ -0,0 +1,153 @@
+'''
+Snapshots of who a user follows and is followed by, and set operations on them
+'''
+import asyncio, time
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterable, Iterator
+
+from .pagination import Paginated
+from .twitter import Following, Twitter, User
+from .twitter_v2 import TwitterV2, User as UserV2
+
+def sorted_ids(ids: Iterable[int]) -> array:
+    '''Sorted array of unique int64 IDs, as used by the other set operations'''
+    return array('q', sorted(set(ids)))
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def contains(ids: array, id_: int) -> bool:
+    '''Whether a sorted array of IDs has an ID.'''
+    i = bisect_left(ids, id_)
+    return i < len(ids) and ids[i] == id_
+
+def intersect(a: array, b: array) -> array:
+    '''IDs in both of two sorted arrays, sorted.'''
+    if (np := _numpy()) is not None:
+        both = np.intersect1d(np.frombuffer(a, np.int64), np.frombuffer(b, np.int64), assume_unique=True)
+        return array('q', both.tobytes())
+    if len(b) < len(a):
+        a, b = b, a
+    b_set = set(b)
+    return array('q', (id_ for id_ in a if id_ in b_set))
+
+def difference(a: array, b: array) -> array:
+    '''IDs in the first sorted array but not the second, sorted.'''
+    if (np := _numpy()) is not None:
+        only_a = np.setdiff1d(np.frombuffer(a, np.int64), np.frombuffer(b, np.int64), assume_unique=True)
+        return array('q', only_a.tobytes())
+    b_set = set(b)
+    return array('q', (id_ for id_ in a if id_ not in b_set))
+
+async def _collect_ids(paginated: Paginated[Any]) -> array:
+    ids = array('q')
+    async for page in paginated.pages():
+        ids.extend(item if isinstance(item, int) else item.id for item in page)
+    return sorted_ids(ids)
+
+class FollowDiff:
+    '''Changes between two snapshots of the same user, as sorted arrays of IDs'''
+    new_followers: array
+    lost_followers: array
+    followed: array
+    unfollowed: array
+
+    def __init__(self, old: 'FollowSnapshot', new: 'FollowSnapshot'):
+        self.new_followers = difference(new.followers, old.followers)
+        self.lost_followers = difference(old.followers, new.followers)
+        self.followed = difference(new.following, old.following)
+        self.unfollowed = difference(old.following, new.following)
+
+    def __bool__(self) -> bool:
+        return any((self.new_followers, self.lost_followers, self.followed, self.unfollowed))
+
+class FollowSnapshot:
+    '''
+    Everyone one user follows and is followed by at one time, as sorted
+    arrays of IDs. Relationships with any other user can be answered from
+    it without a request. Arrays given are assumed to be sorted and unique
+    already, and other iterables are sorted.
+    '''
+    user: User
+    followers: array
+    following: array
+    taken_at: float # unix time
+
+    def __init__(self, user: User, followers: Iterable[int], following: Iterable[int], taken_at: float | None = None):
+        self.user = user
+        self.followers = followers if isinstance(followers, array) else sorted_ids(followers)
+        self.following = following if isinstance(following, array) else sorted_ids(following)
+        self.taken_at = time.time() if taken_at is None else taken_at
+
+    def covers(self, user: User | UserV2) -> bool:
+        '''Whether this is a snapshot of a user.'''
+        if hasattr(user, 'id') and hasattr(self.user, 'id'):
+            return user.id == self.user.id
+        if hasattr(user, 'at') and hasattr(self.user, 'at'):
+            return user.at.lower() == self.user.at.lower()
+        return False
+
+    def follows(self, id_: int) -> bool:
+        return contains(self.following, id_)
+
+    def followed_by(self, id_: int) -> bool:
+        return contains(self.followers, id_)
+
+    def mutuals(self) -> array:
+        '''Users who follow and are followed by the user.'''
+        return intersect(self.followers, self.following)
+
+    def not_following_back(self) -> array:
+        '''Users followed by the user who do not follow them back.'''
+        return difference(self.following, self.followers)
+
+    def not_followed_back(self) -> array:
+        '''Followers of the user who the user does not follow back.'''
+        return difference(self.followers, self.following)
+
+    def check_follow(self, other: User | UserV2 | int) -> Following:
+        '''Relationship between the user and another user, by ID.'''
+        other = _v1_user(other if not isinstance(other, int) else User(other))
+        return Following.between(self.user, other, self.follows(other.id), self.followed_by(other.id))
+
+    def relationships(self) -> Iterator[Following]:
+        '''Relationship with every user who follows or is followed by the user, by ID.'''
+        followers, following = set(self.followers), set(self.following)
+        for id_ in sorted(followers | following):
+            yield Following.between(self.user, User(id_), id_ in following, id_ in followers)
+
+    def diff(self, newer: 'FollowSnapshot') -> FollowDiff:
+        '''What changed between this snapshot and a newer one.'''
+        return FollowDiff(self, newer)
+
+def _v1_user(user: User | UserV2) -> User:
+    if isinstance(user, User):
+        return user
+    v1_user = User(user.id) if hasattr(user, 'id') else User(user.at)
+    if hasattr(user, 'id') and hasattr(user, 'at'):
+        v1_user.at = user.at
+    return v1_user
+
+async def take_snapshot(api: Twitter | TwitterV2, user: User | UserV2 | int | str) -> FollowSnapshot:
+    '''
+    Fetch the IDs of everyone a user follows and is followed by, both at once.
+    With v1.1, this is 5000 IDs to a request, and with v2, 1000 users.
+    '''
+    if isinstance(user, (int, str)):
+        user = User(user)
+    match api:
+        case Twitter():
+            followers, following = api.follower_ids(_v1_user(user)), api.following_ids(_v1_user(user))
+        case TwitterV2():
+            if not hasattr(user, 'id'):
+                user = await api.user(user.at)
+            # only the ID is used
+            followers = await api.all_followers_of(user) # type: ignore
+            following = await api.all_followed_by(user) # type: ignore
+    follower_ids, following_ids = await asyncio.gather(_collect_ids(followers), _collect_ids(following))
+    return FollowSnapshot(_v1_user(user), follower_ids, following_ids)
@@ -0,0 +1,274 @@
+'''
+Instrumentation of requests, uploads and rate limit waits
+'''
+import bisect, time
+from typing import Any
+
+class RequestEvent:
+    '''One attempt at a request, from when it is sent until it is answered or fails'''
+    __slots__ = ('method', 'url', 'family', 'attempt', 'started', 'elapsed',
+                 'status', 'request_bytes', 'response_bytes', 'error', '_clock')
+    method: str
+    url: str
+    family: str
+    attempt: int # 0 for the first, then counting retries
+    started: float # unix time
+    elapsed: float | None # seconds, once finished
+    status: int | None # None if there was no response
+    request_bytes: int
+    response_bytes: int
+    error: BaseException | None
+
+    def __init__(self, method: str, url: str, family: str, attempt: int):
+        self.method = method
+        self.url = url
+        self.family = family
+        self.attempt = attempt
+        self.started = time.time()
+        self.elapsed = None
+        self.status = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.error = None
+        self._clock = time.perf_counter()
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._clock
+
+    def __repr__(self) -> str:
+        return F"RequestEvent({self.method} {self.family}, attempt {self.attempt}, status {self.status}, {self.elapsed}s)"
+
+class Instrument:
+    '''
+    Base for observers of what clients are doing. Override the events of
+    interest; the rest do nothing. Events are called synchronously on the
+    event loop, so they should be quick.
+    '''
+    def request_start(self, event: RequestEvent):
+        '''A request is about to be sent.'''
+
+    def request_end(self, event: RequestEvent):
+        '''A request was answered, or failed with `event.error`.'''
+
+    def retry(self, family: str, attempt: int, error: BaseException | None):
+        '''
+        A request or upload segment is being tried again, after a 429 if
+        `error` is None.
+        '''
+
+    def rate_limit_wait(self, family: str, seconds: float):
+        '''A request waited for its rate limit to reset.'''
+
+    def segment_sent(self, media_id: int, index: int, size: int, seconds: float):
+        '''An APPEND segment of `size` bytes was accepted.'''
+
+    def processing_wait(self, media_id: int, seconds: float):
+        '''Uploaded media will be polled for its processing status again after `seconds`.'''
+
+class Instruments:
+    '''
+    The instruments observing a client. With none, reporting an event costs
+    a single truth test, so clients check `if instruments:` before building one.
+    '''
+    __slots__ = ('_instruments',)
+    _instruments: list[Instrument]
+
+    def __init__(self, *instruments: Instrument):
+        self._instruments = list(instruments)
+
+    def __bool__(self) -> bool:
+        return bool(self._instruments)
+
+    def __len__(self) -> int:
+        return len(self._instruments)
+
+    def add(self, instrument: Instrument):
+        self._instruments.append(instrument)
+        return instrument
+
+    def remove(self, instrument: Instrument):
+        self._instruments.remove(instrument)
+
+    def request_start(self, event: RequestEvent):
+        for instrument in self._instruments:
+            instrument.request_start(event)
+
+    def request_end(self, event: RequestEvent):
+        for instrument in self._instruments:
+            instrument.request_end(event)
+
+    def retry(self, family: str, attempt: int, error: BaseException | None):
+        for instrument in self._instruments:
+            instrument.retry(family, attempt, error)
+
+    def rate_limit_wait(self, family: str, seconds: float):
+        for instrument in self._instruments:
+            instrument.rate_limit_wait(family, seconds)
+
+    def segment_sent(self, media_id: int, index: int, size: int, seconds: float):
+        for instrument in self._instruments:
+            instrument.segment_sent(media_id, index, size, seconds)
+
+    def processing_wait(self, media_id: int, seconds: float):
+        for instrument in self._instruments:
+            instrument.processing_wait(media_id, seconds)
+
+# upper bounds of latency buckets in seconds, roughly doubling from 1ms to 2 minutes
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    '''Counts of observed values in fixed buckets, with their count, sum, min and max'''
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+    bounds: tuple[float, ...]
+    counts: list[int] # one per bound, then one for larger values
+    count: int
+    total: float
+    min: float
+    max: float
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> float | None:
+        '''
+        Estimate of the value below which `q` of observations fall: the upper
+        bound of the bucket it falls in, clamped to the largest value seen.
+        '''
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def __repr__(self) -> str:
+        if not self.count:
+            return "Histogram(empty)"
+        return F"Histogram(n={self.count}, mean={self.mean:.4f}, p50={self.quantile(0.5)}, p99={self.quantile(0.99)}, max={self.max:.4f})"
+
+class Metrics(Instrument):
+    '''
+    Collects counters, and latency histograms by endpoint family, in memory.
+    Counters are `requests`, `errors`, `retries`, `request_bytes`,
+    `response_bytes`, `rate_limit_waits`, `rate_limit_wait_secs`,
+    `segments`, `segment_bytes` and `processing_waits`.
+    '''
+    counters: dict[str, float]
+    statuses: dict[tuple[str, int | None], int] # by family and status
+    latency: dict[str, Histogram] # by family
+    segment_latency: Histogram
+
+    def __init__(self):
+        self.counters = dict.fromkeys(('requests', 'errors', 'retries', 'request_bytes', 'response_bytes',
+            'rate_limit_waits', 'rate_limit_wait_secs', 'segments', 'segment_bytes', 'processing_waits'), 0)
+        self.statuses = {}
+        self.latency = {}
+        self.segment_latency = Histogram()
+
+    def request_end(self, event: RequestEvent):
+        counters = self.counters
+        counters['requests'] += 1
+        counters['request_bytes'] += event.request_bytes
+        counters['response_bytes'] += event.response_bytes
+        if event.error is not None:
+            counters['errors'] += 1
+        key = (event.family, event.status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if (histogram := self.latency.get(event.family)) is None:
+            histogram = self.latency[event.family] = Histogram()
+        histogram.observe(event.elapsed or 0.0)
+
+    def retry(self, family: str, attempt: int, error: BaseException | None):
+        self.counters['retries'] += 1
+
+    def rate_limit_wait(self, family: str, seconds: float):
+        self.counters['rate_limit_waits'] += 1
+        self.counters['rate_limit_wait_secs'] += seconds
+
+    def segment_sent(self, media_id: int, index: int, size: int, seconds: float):
+        self.counters['segments'] += 1
+        self.counters['segment_bytes'] += size
+        self.segment_latency.observe(seconds)
+
+    def processing_wait(self, media_id: int, seconds: float):
+        self.counters['processing_waits'] += 1
+
+    def summary(self) -> dict[str, Any]:
+        '''The counters, and latency by family, as plain values.'''
+        return {
+            **self.counters,
+            'latency': { family: { 'count': h.count, 'mean': h.mean, 'p50': h.quantile(0.5),
+                    'p90': h.quantile(0.9), 'p99': h.quantile(0.99), 'max': h.max }
+                for family, h in self.latency.items() },
+        }
+
+class OpenTelemetryInstrument(Instrument):
+    '''
+    Reports to OpenTelemetry: a span for each request, and the metrics
+    `twitter.request.duration`, `twitter.request.size`, `twitter.response.size`,
+    `twitter.retries`, `twitter.rate_limit.wait` and `twitter.upload.segment.size`.
+    Requires the `opentelemetry-api` package. Without a `tracer` or `meter`,
+    those of the global providers are used.
+    '''
+    def __init__(self, tracer: Any = None, meter: Any = None):
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetryInstrument requires the opentelemetry-api package.") from e
+        self._trace = trace
+        self.tracer = tracer if tracer is not None else trace.get_tracer('SlyTwitter')
+        meter = meter if meter is not None else metrics.get_meter('SlyTwitter')
+        self._duration = meter.create_histogram('twitter.request.duration', unit='s')
+        self._request_size = meter.create_histogram('twitter.request.size', unit='By')
+        self._response_size = meter.create_histogram('twitter.response.size', unit='By')
+        self._retries = meter.create_counter('twitter.retries')
+        self._rate_limit_wait = meter.create_histogram('twitter.rate_limit.wait', unit='s')
+        self._segment_size = meter.create_histogram('twitter.upload.segment.size', unit='By')
+
+    def request_end(self, event: RequestEvent):
+        attributes: dict[str, Any] = { 'http.method': event.method, 'twitter.endpoint': event.family }
+        if event.status is not None:
+            attributes['http.status_code'] = event.status
+        elapsed = event.elapsed or 0.0
+        self._duration.record(elapsed, attributes)
+        self._request_size.record(event.request_bytes, attributes)
+        self._response_size.record(event.response_bytes, attributes)
+
+        # the span is made after the fact, from the times in the event
+        start_ns = int(event.started * 1e9)
+        span = self.tracer.start_span(F'{event.method} {event.family}', start_time=start_ns,
+            attributes={ **attributes, 'http.url': event.url, 'twitter.attempt': event.attempt })
+        if event.error is not None:
+            span.record_exception(event.error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+        span.end(end_time=start_ns + int(elapsed * 1e9))
+
+    def retry(self, family: str, attempt: int, error: BaseException | None):
+        self._retries.add(1, { 'twitter.endpoint': family })
+
+    def rate_limit_wait(self, family: str, seconds: float):
+        self._rate_limit_wait.record(seconds, { 'twitter.endpoint': family })
+
+    def segment_sent(self, media_id: int, index: int, size: int, seconds: float):
+        self._segment_size.record(size)
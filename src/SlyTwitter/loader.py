@@ -0,0 +1,94 @@
+'''
+Merging single lookups into batched requests
+'''
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Mapping, TypeVar
+
+from .common import TwitterError
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+class BatchLoader(Generic[K, V]):
+    '''
+    Collects keys looked up within `window` seconds of each other, or in the
+    same event loop iteration if `window` is 0, and fetches them in one
+    batch of up to `max_batch_size` unique keys. Each caller gets the result
+    for its own key.
+    '''
+    max_batch_size: int
+    window: float
+    batches: int = 0
+
+    _fetch: Callable[[list[K]], Awaitable[Mapping[K, V]]]
+    _queue: dict[K, 'asyncio.Future[V]']
+    _in_flight: dict[K, 'asyncio.Future[V]']
+    _timer: asyncio.Handle | None
+    _running: set['asyncio.Task[None]']
+
+    def __init__(self, fetch: Callable[[list[K]], Awaitable[Mapping[K, V]]], max_batch_size: int = 100, window: float = 0.0):
+        '''`fetch` gets a list of keys, and returns results by key. Keys it leaves out raise `TwitterError`.'''
+        if max_batch_size < 1:
+            raise ValueError("Batches must have at least one key.")
+        self._fetch = fetch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = {}
+        self._in_flight = {}
+        self._timer = None
+        self._running = set()
+
+    async def load(self, key: K) -> V:
+        '''Get the result for one key, batched with any others looked up soon.'''
+        future = self._queue.get(key) or self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._queue[key] = loop.create_future()
+            if len(self._queue) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                if self.window > 0:
+                    self._timer = loop.call_later(self.window, self._dispatch)
+                else:
+                    self._timer = loop.call_soon(self._dispatch)
+        # one caller giving up should not cancel the lookup for the rest
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, {}
+        if batch:
+            self.batches += 1
+            self._in_flight |= batch
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _forget(self, batch: dict[K, 'asyncio.Future[V]']):
+        for key in batch:
+            self._in_flight.pop(key, None)
+
+    async def _run(self, batch: dict[K, 'asyncio.Future[V]']):
+        try:
+            results = await self._fetch(list(batch))
+        except BaseException as e:
+            # including cancellation, such as at shutdown, so no caller waits forever
+            self._forget(batch)
+            for future in batch.values():
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                    future.exception() # mark as retrieved, if every caller gave up
+                else:
+                    future.cancel()
+            if isinstance(e, Exception):
+                return
+            raise
+        self._forget(batch)
+        for key, future in batch.items():
+            if key in results:
+                future.set_result(results[key])
+            else:
+                future.set_exception(TwitterError({'detail': 'Not found', 'value': key}))
+                future.exception()
@@ -0,0 +1,187 @@
+'''
+Cache of uploaded media, to skip uploading identical files again
+'''
+import hashlib, json, os, time
+from collections import OrderedDict
+from typing import AsyncGenerator, Protocol
+
+import aiofiles
+
+from .common import RE_FILE_URL
+
+# treat media as expired this many seconds early, so it does not expire between lookup and tweet
+EXPIRY_MARGIN_SECS = 10*60
+# for media uploaded without an expiry: twitter media ids last a day
+DEFAULT_EXPIRY_SECS = 24*60*60
+
+class MediaStore(Protocol):
+    '''Storage for a `MediaCache`: maps keys to (media id, expiry unix time)'''
+    def get(self, key: str) -> tuple[int, float|None] | None: ...
+    def put(self, key: str, media_id: int, expires_at: float|None) -> None: ...
+    def put_many(self, keys: list[str], media_id: int, expires_at: float|None) -> None: ...
+    def delete(self, key: str) -> None: ...
+
+class MemoryMediaStore:
+    '''In-memory store, evicting the least recently used entries'''
+    max_entries: int
+    _entries: OrderedDict[str, tuple[int, float|None]]
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> tuple[int, float|None] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, media_id: int, expires_at: float|None):
+        self._entries[key] = (media_id, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put_many(self, keys: list[str], media_id: int, expires_at: float|None):
+        for key in keys:
+            MemoryMediaStore.put(self, key, media_id, expires_at) # not a subclass's put, which may save each
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+class FileMediaStore(MemoryMediaStore):
+    '''Store kept in a JSON file, so that it survives restarts'''
+    path: str
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        super().__init__(max_entries)
+        self.path = path
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf8') as f:
+                for key, (media_id, expires_at) in json.load(f).items():
+                    super().put(key, media_id, expires_at)
+
+    def _save(self):
+        # write then rename, so a crash never leaves a partial file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def put(self, key: str, media_id: int, expires_at: float|None):
+        super().put(key, media_id, expires_at)
+        self._save()
+
+    def put_many(self, keys: list[str], media_id: int, expires_at: float|None):
+        # the whole file is rewritten, so only once
+        super().put_many(keys, media_id, expires_at)
+        self._save()
+
+    def delete(self, key: str):
+        if key in self._entries:
+            super().delete(key)
+            self._save()
+
+CONTENT_KEY_PREFIX = 'sha256:'
+
+def content_key(digest: 'hashlib._Hash') -> str:
+    return CONTENT_KEY_PREFIX + digest.hexdigest()
+
+async def hash_chunks(chunks: AsyncGenerator[bytes | memoryview, None], digest: 'hashlib._Hash') -> AsyncGenerator[bytes | memoryview, None]:
+    '''Pass chunks through, adding them to `digest` as they go by'''
+    try:
+        async for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+class MediaCache:
+    '''
+    Remembers uploaded media by content hash, and by URL or file path and
+    modification time, so the same file can be attached to many tweets
+    while uploading it only once. Media ids belong to the account that
+    uploaded them, so use a separate cache for each account.
+    '''
+    store: MediaStore
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, store: MediaStore | None = None):
+        self.store = store if store is not None else MemoryMediaStore()
+
+    @staticmethod
+    def source_key(file_: object) -> str | None:
+        '''Key for a URL or file path, checked before reading any content'''
+        match file_:
+            case str() if RE_FILE_URL.match(file_):
+                return 'url:' + file_
+            case str() if os.path.isfile(file_):
+                stat = os.stat(file_)
+                return F'path:{os.path.abspath(file_)}:{stat.st_mtime_ns}:{stat.st_size}'
+            case _:
+                return None
+
+    @staticmethod
+    async def hash_source(file_: object) -> str | None:
+        '''
+        Content key for sources that are cheap to read twice: bytes and local files.
+        URLs and async iterators are hashed as they are uploaded instead.
+        '''
+        match file_:
+            case (bytes() | bytearray() | memoryview() as data, str()):
+                return content_key(hashlib.sha256(data))
+            case str() if not RE_FILE_URL.match(file_) and os.path.isfile(file_):
+                digest = hashlib.sha256()
+                async with aiofiles.open(file_, 'rb') as f:
+                    while chunk := await f.read(1024*1024):
+                        digest.update(chunk)
+                return content_key(digest)
+            case _:
+                return None
+
+    def lookup(self, key: str) -> tuple[int, float|None] | None:
+        '''Get the id and expiry of unexpired media by key'''
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        _, expires_at = entry
+        if expires_at is not None and expires_at - EXPIRY_MARGIN_SECS < time.time():
+            self.store.delete(key)
+            return None
+        return entry
+
+    async def find(self, file_: object) -> tuple[tuple[int, float|None] | None, list[str]]:
+        '''
+        Look up a media source, first by URL or path, then by content.
+        Returns the cached media id and expiry, if any, and the keys that
+        were looked up, to remember after uploading on a miss.
+        '''
+        keys: list[str] = []
+        if (key := self.source_key(file_)) is not None:
+            keys.append(key)
+            if (entry := self.lookup(key)) is not None:
+                self.hits += 1
+                return entry, keys
+        if (key := await self.hash_source(file_)) is not None:
+            keys.append(key)
+            if (entry := self.lookup(key)) is not None:
+                self.hits += 1
+                if len(keys) > 1: # found by content, so remember the source too
+                    self.remember(keys[:-1], *entry)
+                return entry, keys
+        self.misses += 1
+        return None, keys
+
+    def remember(self, keys: list[str], media_id: int, expires_at: float|None):
+        '''
+        Remember uploaded media by each of `keys`, until it expires, or for
+        a day if its expiry is not known.
+        '''
+        if keys:
+            if expires_at is None:
+                expires_at = time.time() + DEFAULT_EXPIRY_SECS
+            self.store.put_many(keys, media_id, expires_at)
@@ -0,0 +1,308 @@
+'''
+Local stand-in for the twitter API, for benchmarks and tests without credentials
+'''
+import asyncio, base64, itertools, math, time, zlib
+from collections import Counter
+from typing import Any, Mapping
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from .ratelimit import endpoint_family
+
+USERNAME_PREFIX = 'user'
+
+def user_id_of(username: str) -> int:
+    '''ID of a mock user: `user123` is 123, and other names hash to an ID.'''
+    name = username.removeprefix('@').lower()
+    if name.startswith(USERNAME_PREFIX) and name[len(USERNAME_PREFIX):].isdigit():
+        return int(name[len(USERNAME_PREFIX):])
+    return zlib.crc32(name.encode('utf8')) + 1_000_000_000
+
+def follows(a: int, b: int) -> bool:
+    '''Whether one mock user follows another, the same every time.'''
+    return (a * 31 + b) % 4 != 0
+
+def v1_user(id_: int) -> dict[str, Any]:
+    return {
+        'id': id_, 'id_str': str(id_), 'screen_name': F'user{id_}', 'name': F'User {id_}',
+        'location': '', 'url': None, 'description': F'Mock user {id_}', 'verified': False,
+        'protected': False, 'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+        'profile_image_url_https': F'https://pbs.twimg.com/profile_images/{id_}.png',
+    }
+
+def v2_user(id_: int) -> dict[str, Any]:
+    return { 'id': str(id_), 'username': F'user{id_}', 'name': F'User {id_}' }
+
+class _Window:
+    '''Requests made to one endpoint family by one account in the current window'''
+    def __init__(self, reset: float):
+        self.reset = reset
+        self.used = 0
+
+class _Upload:
+    def __init__(self, total: int, category: str):
+        self.total = total
+        self.category = category
+        self.received = 0
+        self.finalized_at: float | None = None
+
+class MockTwitter:
+    '''
+    Serves a subset of twitter API v1.1, v2 and media upload endpoints locally.
+    Every request waits `latency` seconds. With a `rate_limit`, each account
+    may make that many requests to each endpoint in each `rate_window`
+    seconds, and gets `x-rate-limit-*` headers and 429s like twitter.
+    Chunked uploads take `processing_delay` seconds to process after FINALIZE.
+    Every user has `followers` followers and follows `following` users,
+    listed newest first.
+    '''
+    latency: float
+    rate_limit: int | None
+    rate_window: float
+    processing_delay: float
+    followers: int
+    following: int
+    url: str | None
+    requests: Counter[str] # by endpoint family
+
+    def __init__(self, latency: float = 0.0, rate_limit: int | None = None, rate_window: float = 900,
+            processing_delay: float = 0.0, followers: int = 10_000, following: int = 1_000):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.processing_delay = processing_delay
+        self.followers = followers
+        self.following = following
+        self.url = None
+        self.requests = Counter()
+        self._windows: dict[tuple[str, str], _Window] = {}
+        self._uploads: dict[int, _Upload] = {}
+        self._ids = itertools.count(1_500_000_000_000_000_000)
+        self._runner: web.AppRunner | None = None
+        # room for a 5 MB segment as base64
+        self.app = web.Application(middlewares=[self._middleware], client_max_size=16*1024*1024)
+        self.app.router.add_routes([
+            web.post('/1.1/statuses/update.json', self._update),
+            web.post('/1.1/statuses/destroy/{id}.json', self._tweet_action),
+            web.post('/1.1/statuses/retweet/{id}.json', self._tweet_action),
+            web.get('/1.1/friendships/show.json', self._friendship),
+            web.get('/1.1/users/show.json', self._user_v1),
+            web.get('/1.1/users/lookup.json', self._lookup_v1),
+            web.get('/1.1/followers/ids.json', self._ids_v1),
+            web.get('/1.1/friends/ids.json', self._ids_v1),
+            web.route('*', '/1.1/media/upload.json', self._upload),
+            web.post('/1.1/media/metadata/create.json', self._empty),
+            web.get('/2/users/me', self._me),
+            web.get('/2/users', self._users_v2),
+            web.get('/2/users/by', self._users_v2),
+            web.get('/2/users/by/username/{username}', self._user_by_username),
+            web.get('/2/users/{id}/followers', self._follows_v2),
+            web.get('/2/users/{id}/following', self._follows_v2),
+        ])
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        '''Start serving, and return the base URL.'''
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.url = F'http://{host}:{self._runner.addresses[0][1]}'
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    def point(self, *clients: Any):
+        '''Send the requests of `Twitter`, `TwitterV2` or `TwitterUpload` clients here.'''
+        from .twitter import Twitter
+        from .twitter_upload import TwitterUpload
+        from .twitter_v2 import TwitterV2
+        if self.url is None:
+            raise RuntimeError("The mock server has not started.")
+        for client in clients:
+            match client:
+                case Twitter():
+                    client.base_url = self.url + '/1.1'
+                    client._upload_api.base_url = self.url + '/1.1/' # type: ignore
+                case TwitterUpload():
+                    client.base_url = self.url + '/1.1/'
+                case TwitterV2():
+                    client.base_url = self.url + '/2/'
+                case _:
+                    raise TypeError(F"Not a twitter client: {client}")
+
+    # common behaviour
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        family = endpoint_family(request.path)
+        self.requests[family] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        headers: dict[str, str] = {}
+        if self.rate_limit is not None:
+            now = time.time()
+            key = (family, _account(request))
+            window = self._windows.get(key)
+            if window is None or window.reset <= now:
+                window = self._windows[key] = _Window(math.ceil(now + self.rate_window))
+            window.used += 1
+            headers = {
+                'x-rate-limit-limit': str(self.rate_limit),
+                'x-rate-limit-remaining': str(max(0, self.rate_limit - window.used)),
+                'x-rate-limit-reset': str(int(window.reset)),
+            }
+            if window.used > self.rate_limit:
+                return web.json_response({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]},
+                    status=429, headers=headers)
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    async def _empty(self, request: web.Request):
+        return web.Response(status=204)
+
+    # v1.1
+
+    async def _update(self, request: web.Request):
+        form = await _form(request)
+        return web.json_response({
+            'id': next(self._ids), 'text': form['status'], 'user': { 'screen_name': 'user1' },
+            'in_reply_to_status_id': int(form['in_reply_to_status_id']) if 'in_reply_to_status_id' in form else None,
+        })
+
+    async def _tweet_action(self, request: web.Request):
+        return web.json_response({ 'id': int(request.match_info['id']), 'text': '', 'user': { 'screen_name': 'user1' } })
+
+    async def _friendship(self, request: web.Request):
+        a = user_id_of(request.query['source_screen_name'])
+        b = user_id_of(request.query['target_screen_name'])
+        return web.json_response({ 'relationship': {
+            'source': { 'id': a, 'screen_name': F'user{a}', 'following': follows(a, b), 'followed_by': follows(b, a) },
+            'target': { 'id': b, 'screen_name': F'user{b}', 'following': follows(b, a), 'followed_by': follows(a, b) },
+        }})
+
+    async def _user_v1(self, request: web.Request):
+        if 'user_id' in request.query:
+            return web.json_response(v1_user(int(request.query['user_id'])))
+        return web.json_response(v1_user(user_id_of(request.query['screen_name'])))
+
+    async def _lookup_v1(self, request: web.Request):
+        ids = [int(id_) for id_ in request.query.get('user_id', '').split(',') if id_] + \
+              [user_id_of(at) for at in request.query.get('screen_name', '').split(',') if at]
+        return web.json_response([v1_user(id_) for id_ in ids])
+
+    async def _ids_v1(self, request: web.Request):
+        total = self.followers if 'followers' in request.path else self.following
+        count = int(request.query.get('count', 5000))
+        cursor = int(request.query.get('cursor', -1))
+        start = 0 if cursor == -1 else cursor
+        end = min(start + count, total)
+        return web.json_response({
+            'ids': list(range(total - start, total - end, -1)),
+            'next_cursor_str': str(end if end < total else 0),
+        })
+
+    async def _upload(self, request: web.Request):
+        form = await _form(request)
+        match form.get('command'):
+            case 'INIT':
+                media_id = next(self._ids)
+                self._uploads[media_id] = _Upload(int(form['total_bytes']), form.get('media_category', ''))
+                return web.json_response({ 'media_id': media_id, 'media_id_string': str(media_id), 'expires_after_secs': 86400 })
+            case 'APPEND':
+                upload = self._uploads.get(int(form['media_id']))
+                if upload is None:
+                    return _error(400, 'Invalid media_id')
+                data = form['media']
+                upload.received += len(base64.b64decode(data) if isinstance(data, str) else data)
+                return web.Response(status=204)
+            case 'FINALIZE':
+                media_id = int(form['media_id'])
+                upload = self._uploads.get(media_id)
+                if upload is None or upload.received != upload.total:
+                    return _error(400, 'Segments do not add up to the total size')
+                upload.finalized_at = time.time()
+                return web.json_response(self._status(media_id, upload))
+            case 'STATUS':
+                media_id = int(form['media_id'])
+                upload = self._uploads.get(media_id)
+                if upload is None or upload.finalized_at is None:
+                    return _error(400, 'Invalid media_id')
+                return web.json_response(self._status(media_id, upload))
+            case None if 'media' in form: # simple upload
+                media_id = next(self._ids)
+                return web.json_response({ 'media_id': media_id, 'media_id_string': str(media_id), 'expires_after_secs': 86400 })
+            case _:
+                return _error(400, 'Unknown command')
+
+    def _status(self, media_id: int, upload: _Upload) -> dict[str, Any]:
+        status: dict[str, Any] = { 'media_id': media_id, 'media_id_string': str(media_id), 'expires_after_secs': 86400 }
+        if self.processing_delay and upload.category != 'tweet_image':
+            assert upload.finalized_at is not None
+            remaining = upload.finalized_at + self.processing_delay - time.time()
+            if remaining > 0:
+                status['processing_info'] = {
+                    'state': 'in_progress', 'check_after_secs': math.ceil(remaining),
+                    'progress_percent': int(100 * (1 - remaining / self.processing_delay)) }
+            else:
+                status['processing_info'] = { 'state': 'succeeded', 'progress_percent': 100 }
+        return status
+
+    # v2
+
+    async def _me(self, request: web.Request):
+        return web.json_response({ 'data': v2_user(1) })
+
+    async def _user_by_username(self, request: web.Request):
+        return web.json_response({ 'data': v2_user(user_id_of(request.match_info['username'])) })
+
+    async def _users_v2(self, request: web.Request):
+        ids = [int(id_) for id_ in request.query.get('ids', '').split(',') if id_] + \
+              [user_id_of(at) for at in request.query.get('usernames', '').split(',') if at]
+        return web.json_response({ 'data': [v2_user(id_) for id_ in ids] })
+
+    async def _follows_v2(self, request: web.Request):
+        total = self.followers if request.path.endswith('followers') else self.following
+        count = int(request.query.get('max_results', 100))
+        start = int(request.query.get('pagination_token', 0))
+        end = min(start + count, total)
+        meta: dict[str, Any] = { 'result_count': end - start }
+        if end < total:
+            meta['next_token'] = str(end)
+        return web.json_response({
+            'data': [v2_user(id_) for id_ in range(total - start, total - end, -1)],
+            'meta': meta,
+        })
+
+def _account(request: web.Request) -> str:
+    '''The account a request was made by, from its OAuth1 token or bearer token'''
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        return auth.removeprefix('Bearer ')
+    for part in auth.removeprefix('OAuth ').split(', '):
+        if part.startswith('oauth_token='):
+            return part.removeprefix('oauth_token=').strip('"')
+    return ''
+
+async def _form(request: web.Request) -> Mapping[str, Any]:
+    '''Query and body parameters of a request, with file fields as bytes'''
+    params: dict[str, Any] = dict(request.query)
+    if request.content_type == 'multipart/form-data':
+        async for part in await request.multipart():
+            params[part.name] = await part.read() # type: ignore
+    elif request.can_read_body:
+        params |= dict(parse_qsl(await request.text()))
+    return params
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({ 'errors': [{ 'message': message }] }, status=status)
@@ -0,0 +1,90 @@
+'''
+Iterating paginated endpoints
+'''
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Generator, Generic, TypeVar
+
+T = TypeVar('T')
+
+# fetches the page for a token, or the first page for None,
+# and returns its items and the token for the next page
+PageFetcher = Callable[[str | None], Awaitable[tuple[list[T], str | None]]]
+
+class Paginated(Generic[T]):
+    '''
+    Async iterator over the items of a paginated endpoint.
+    Awaiting instances will return a list of all the items.
+    The next page is fetched while the current one is being consumed.
+
+    `resume_token` is the token of the first page not fully consumed yet.
+    If iteration is interrupted, for example by an error or rate limit,
+    passing it back continues from that page instead of starting over.
+    While a page is being consumed, `next_token` is the token of the page
+    after it, or None if it is the last.
+    '''
+    resume_token: str | None
+    next_token: str | None
+    done: bool
+    pages_fetched: int
+
+    _fetch: PageFetcher[T]
+    _limit: int | None
+    _prefetch: bool
+
+    def __init__(self, fetch: PageFetcher[T], resume_token: str | None = None,
+            limit: int | None = None, prefetch: bool = True):
+        self._fetch = fetch
+        self._limit = limit
+        self._prefetch = prefetch
+        self.resume_token = resume_token
+        self.next_token = None
+        self.done = False
+        self.pages_fetched = 0
+
+    async def _fetch_counted(self, token: str | None) -> tuple[list[T], str | None]:
+        page = await self._fetch(token)
+        self.pages_fetched += 1
+        return page
+
+    async def pages(self) -> AsyncGenerator[list[T], None]:
+        '''Iterate over whole pages of items.'''
+        count = 0
+        next_page: asyncio.Task[tuple[list[T], str | None]] | None = \
+            asyncio.ensure_future(self._fetch_counted(self.resume_token))
+        try:
+            while next_page is not None:
+                items, next_token = await next_page
+                next_page = None
+                if self._limit is not None:
+                    items = items[:self._limit - count]
+                count += len(items)
+                more = next_token is not None and (self._limit is None or count < self._limit)
+                if more and self._prefetch:
+                    next_page = asyncio.ensure_future(self._fetch_counted(next_token))
+                self.next_token = next_token if more else None
+                if items:
+                    yield items
+                # this page was consumed
+                self.resume_token = next_token
+                if not more:
+                    self.done = True
+                elif next_page is None:
+                    next_page = asyncio.ensure_future(self._fetch_counted(next_token))
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def _items(self) -> AsyncGenerator[T, None]:
+        async for page in self.pages():
+            for item in page:
+                yield item
+
+    def __aiter__(self) -> AsyncGenerator[T, None]:
+        return self._items()
+
+    async def _all(self) -> list[T]:
+        return [item async for item in self._items()]
+
+    def __await__(self) -> Generator[Any, None, list[T]]:
+        '''Yield all of the items as a list.'''
+        return self._all().__await__()
@@ -0,0 +1,123 @@
+'''
+Spreading requests over many accounts
+'''
+import itertools
+from typing import Awaitable, Callable, Collection, Mapping, Sequence, TypeVar
+
+from SlyAPI.oauth1 import OAuth1
+from SlyAPI.web import ApiError
+
+from .common import batched, gather_batches
+from .instrument import Instruments
+from .ratelimit import RateLimiter, endpoint_family
+from .session import TwitterSession
+from .twitter import USERS_PER_LOOKUP, Following, Twitter, User
+
+T = TypeVar('T')
+
+def _family(path: str) -> str:
+    return endpoint_family(F'{Twitter.base_url}/{path}')
+
+class TwitterPool:
+    '''
+    One `Twitter` client for each of many accounts, sharing one `TwitterSession`.
+    Posting goes through a chosen account with `account`. Reads that any account
+    can make go through the account with the most rate limit budget left for
+    that endpoint, spreading them evenly, and are retried on another account
+    if one is rate limited.
+    '''
+    clients: dict[str, Twitter]
+    session: TwitterSession
+    instruments: Instruments
+    requests: dict[str, int] # by account
+    _in_flight: dict[str, int]
+    _last_used: dict[str, int]
+    _owns_session: bool
+    _order: 'itertools.count[int]'
+
+    def __init__(self, auths: Mapping[str, OAuth1], session: TwitterSession | None = None,
+            instruments: Instruments | None = None):
+        '''
+        `auths` are by a name for each account. Without a `session`, the pool
+        opens one, and closes it when closed. Requests of every account are
+        reported to the same `instruments`.
+        '''
+        if not auths:
+            raise ValueError("A pool needs at least one account.")
+        self._owns_session = session is None
+        self.session = session if session is not None else TwitterSession()
+        self.instruments = instruments if instruments is not None else Instruments()
+        # rate limited requests fail over to another account instead of waiting
+        self.clients = { name: Twitter(auth, rate_limits=RateLimiter(max_retries=0),
+                session=self.session, instruments=self.instruments)
+            for name, auth in auths.items() }
+        self.requests = dict.fromkeys(self.clients, 0)
+        self._in_flight = dict.fromkeys(self.clients, 0)
+        self._last_used = dict.fromkeys(self.clients, 0)
+        self._order = itertools.count(1)
+
+    def account(self, name: str) -> Twitter:
+        '''The client of one account, such as for posting as it.'''
+        return self.clients[name]
+
+    def pick(self, family: str, exclude: Collection[str] = ()) -> str:
+        '''
+        Name of the account to make a request to an endpoint family with: the
+        soonest able to, then with the fewest requests in flight, then the
+        most budget left, then the least recently used.
+        '''
+        def key(name: str):
+            limits = self.clients[name].rate_limits
+            remaining = limits.remaining(family)
+            return (limits.wait_time(family), self._in_flight[name],
+                    -remaining if remaining is not None else -float('inf'), self._last_used[name])
+        candidates = [name for name in self.clients if name not in exclude] or list(self.clients)
+        return min(candidates, key=key)
+
+    async def run(self, family: str, call: Callable[[Twitter], Awaitable[T]]) -> T:
+        '''
+        Make a request with whichever account is best able to, trying each
+        other account in turn if it is rate limited.
+        '''
+        tried: set[str] = set()
+        while True:
+            name = self.pick(family, tried)
+            tried.add(name)
+            self._in_flight[name] += 1
+            self._last_used[name] = next(self._order)
+            self.requests[name] += 1
+            try:
+                return await call(self.clients[name])
+            except ApiError as e:
+                if e.status != 429 or len(tried) == len(self.clients):
+                    raise
+            finally:
+                self._in_flight[name] -= 1
+
+    async def check_follow(self, a: User | str, b: User | str) -> Following:
+        """ Get the relationship between two users, with any account. """
+        return await self.run(_family('friendships/show'), lambda client: client.check_follow(a, b))
+
+    async def user(self, user: User | int | str) -> User:
+        """ Get a user by ID, @, link or partial `User`, with any account. """
+        return await self.run(_family('users/show'), lambda client: client.user(user))
+
+    async def lookup_users(self, *users: User | int | str, concurrency: int = 4) -> list[User]:
+        """ Get many users, 100 to a request, up to `concurrency` requests at
+            once, each with any account. Users that do not exist are left out.
+        """
+        family = _family('users/lookup')
+        async def lookup(batch: Sequence[User | int | str]) -> list[User]:
+            return await self.run(family, lambda client: client.lookup_users(*batch))
+        return [user async for user in gather_batches(batched(users, USERS_PER_LOOKUP), lookup, concurrency)]
+
+    async def close(self):
+        '''Close the session, if the pool opened it.'''
+        if self._owns_session:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
@@ -0,0 +1,230 @@
+'''
+Tracking of media processing after upload
+'''
+import asyncio, heapq, random, time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from SlyAPI.web import ApiError, JsonMap
+
+import aiohttp
+
+from .common import TwitterError
+from .instrument import Instruments
+
+if TYPE_CHECKING:
+    from .twitter_upload import Media
+
+# when twitter does not say how long to wait
+DEFAULT_CHECK_AFTER_SECS = 1
+# give up on a media after this many STATUS checks fail in a row
+MAX_POLL_ERRORS = 5
+
+ProgressCallback = Callable[['Media', str, int|None], Any]
+
+class ProcessingMetrics:
+    '''Counters for media processing'''
+    tracked: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    polls: int = 0
+    poll_errors: int = 0
+    pending: int = 0
+    # total seconds from FINALIZE to success or failure, over all media
+    processing_secs: float = 0.0
+
+    def __str__(self) -> str:
+        return F"{self.pending} pending, {self.succeeded} succeeded, {self.failed} failed, {self.polls} polls ({self.poll_errors} errors)"
+
+class _Pending:
+    media: 'Media'
+    done: 'asyncio.Future[Media]'
+    started: float
+    wait: float
+    errors: int = 0
+
+    def __init__(self, media: 'Media', done: 'asyncio.Future[Media]', wait: float):
+        self.media = media
+        self.done = done
+        self.started = time.monotonic()
+        self.wait = wait
+
+class ProcessingTracker:
+    '''
+    Waits for media to finish processing after FINALIZE.
+    One background task polls every pending media when it is due,
+    rather than each upload sleeping and polling on its own.
+    '''
+    metrics: ProcessingMetrics
+    instruments: Instruments
+
+    _poll: Callable[['Media'], Awaitable[JsonMap]]
+    _pending: dict[int, _Pending]
+    _schedule: list[tuple[float, int]]
+    _wakeup: asyncio.Event | None
+    _task: 'asyncio.Task[None] | None'
+    _callbacks: list[ProgressCallback]
+
+    def __init__(self, poll: Callable[['Media'], Awaitable[JsonMap]], jitter: float = 0.2, backoff: float = 1.5, max_wait: float = 60,
+            instruments: Instruments | None = None):
+        '''
+        `poll` gets the STATUS of a media. Waits follow twitter's
+        `check_after_secs`, plus up to `jitter` of it again at random so that
+        media finalized together do not all poll together. When twitter gives
+        no wait, the last one is multiplied by `backoff`, up to `max_wait`.
+        Each wait is reported to `instruments`.
+        '''
+        self.metrics = ProcessingMetrics()
+        self.instruments = instruments if instruments is not None else Instruments()
+        self._poll = poll
+        self._jitter = jitter
+        self._backoff = backoff
+        self._max_wait = max_wait
+        self._pending = {}
+        self._schedule = []
+        self._wakeup = None
+        self._task = None
+        self._callbacks = []
+
+    def on_progress(self, callback: ProgressCallback):
+        '''Call `callback(media, state, progress_percent)` on every status update.'''
+        self._callbacks.append(callback)
+        return callback
+
+    def _next_wait(self, entry: _Pending, status: JsonMap) -> float:
+        match status:
+            case { 'processing_info': { 'check_after_secs': int(secs) } }:
+                wait = float(secs)
+            case _:
+                wait = entry.wait * self._backoff
+        wait = min(wait, self._max_wait)
+        entry.wait = wait
+        return wait * (1 + random.uniform(0, self._jitter))
+
+    def _report(self, media: 'Media', status: JsonMap):
+        match status:
+            case { 'processing_info': { 'state': str(state), **info } }:
+                progress = info.get('progress_percent')
+                if not isinstance(progress, int):
+                    progress = None
+            case _:
+                state, progress = 'succeeded', 100
+        # every callback is called, even if one before it raises
+        error = None
+        for callback in self._callbacks:
+            try:
+                callback(media, state, progress)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def _fail(self, entry: _Pending, error: BaseException):
+        if not entry.done.done():
+            self.metrics.failed += 1
+            entry.done.set_exception(error)
+
+    def _resolve(self, entry: _Pending, status: JsonMap) -> bool:
+        '''Finish tracking a media if its status is final. Returns whether it was.'''
+        match status:
+            case { 'processing_info': { 'state': 'failed' } }:
+                self._fail(entry, TwitterError(status))
+            case { 'processing_info': { 'state': 'pending' | 'in_progress' } }:
+                return False
+            case _: # success
+                if not entry.done.done(): # unless the waiter gave up
+                    self.metrics.succeeded += 1
+                    entry.done.set_result(entry.media)
+        self.metrics.processing_secs += time.monotonic() - entry.started
+        return True
+
+    def track(self, media: 'Media', status: JsonMap) -> 'asyncio.Future[Media]':
+        '''
+        Start tracking a media given its FINALIZE response.
+        The returned future resolves to the media once processing succeeds,
+        or raises a `TwitterError` if it fails.
+        '''
+        if media.id in self._pending:
+            return self._pending[media.id].done
+
+        loop = asyncio.get_running_loop()
+        entry = _Pending(media, loop.create_future(), DEFAULT_CHECK_AFTER_SECS)
+        self.metrics.tracked += 1
+        self._report(media, status)
+        if self._resolve(entry, status):
+            return entry.done
+
+        self._pending[media.id] = entry
+        self.metrics.pending = len(self._pending)
+        # stop polling if the waiter gives up
+        entry.done.add_done_callback(lambda _: self._forget(media.id))
+        self._schedule_poll(entry, status)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        return entry.done
+
+    async def wait(self, media: 'Media', status: JsonMap) -> 'Media':
+        '''Wait for a media to finish processing, given its FINALIZE response.'''
+        return await self.track(media, status)
+
+    def _forget(self, media_id: int):
+        self._pending.pop(media_id, None)
+        self.metrics.pending = len(self._pending)
+
+    def _schedule_poll(self, entry: _Pending, status: JsonMap):
+        wait = self._next_wait(entry, status)
+        if self.instruments:
+            self.instruments.processing_wait(entry.media.id, wait)
+        due = time.monotonic() + wait
+        heapq.heappush(self._schedule, (due, entry.media.id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _poll_one(self, entry: _Pending):
+        '''Poll one media. Any error fails only that media, never the other pending ones.'''
+        self.metrics.polls += 1
+        try:
+            status = await self._poll(entry.media)
+        except (ApiError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.metrics.poll_errors += 1
+            entry.errors += 1
+            if entry.errors >= MAX_POLL_ERRORS:
+                self._fail(entry, e)
+            else:
+                self._schedule_poll(entry, {})
+            return
+        except Exception as e: # such as a malformed response
+            self.metrics.poll_errors += 1
+            self._fail(entry, e)
+            return
+        if entry.done.done(): # cancelled while polling
+            return
+        entry.errors = 0
+        try:
+            self._report(entry.media, status)
+            if not self._resolve(entry, status):
+                self._schedule_poll(entry, status)
+        except Exception as e: # from a progress callback, or a malformed status
+            self._fail(entry, e)
+
+    async def _run(self):
+        assert self._wakeup is not None
+        while self._pending:
+            now = time.monotonic()
+            due: list[_Pending] = []
+            while self._schedule and self._schedule[0][0] <= now:
+                _, media_id = heapq.heappop(self._schedule)
+                if (entry := self._pending.get(media_id)) is not None:
+                    due.append(entry)
+            if due:
+                await asyncio.gather(*(self._poll_one(entry) for entry in due))
+                continue
+            if not self._schedule:
+                break
+            # sleep until the next poll is due, or until something new is tracked
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._schedule[0][0] - now)
+            except asyncio.TimeoutError:
+                pass
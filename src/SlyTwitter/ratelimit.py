@@ -0,0 +1,115 @@
+'''
+Scheduling requests around twitter's rate limits
+'''
+import asyncio, re, time
+from typing import Mapping
+from urllib.parse import urlparse
+
+# wait this much past the reset time, in case clocks disagree
+RESET_MARGIN_SECS = 1.0
+# when a 429 does not say when the limit resets
+DEFAULT_RESET_SECS = 60
+
+RE_NUMERIC = re.compile(r'\d+')
+
+def endpoint_family(url: str) -> str:
+    '''
+    The rate-limited endpoint a URL belongs to, with ids and usernames replaced:
+    `https://api.twitter.com/2/users/123/followers` -> `2/users/:id/followers`
+    '''
+    path = urlparse(url).path.strip('/').removesuffix('.json')
+    parts = path.split('/')
+    for i, part in enumerate(parts[1:], 1): # after the API version
+        if RE_NUMERIC.fullmatch(part):
+            parts[i] = ':id'
+        elif parts[i-1] == 'username':
+            parts[i] = ':username'
+    return '/'.join(parts)
+
+class RateLimit:
+    '''Known rate limit state of one endpoint'''
+    limit: int
+    remaining: int
+    reset: float # unix time
+
+    def __init__(self, limit: int, remaining: int, reset: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+    def __repr__(self) -> str:
+        return F"RateLimit({self.remaining}/{self.limit}, resets in {self.reset - time.time():.0f}s)"
+
+class RateLimiter:
+    '''
+    Tracks `x-rate-limit-*` headers by endpoint, and delays requests that
+    would go over the limit until it resets. Requests to endpoints that
+    have not responded yet are never delayed.
+    '''
+    max_retries: int
+    _limits: dict[str, RateLimit]
+
+    def __init__(self, max_retries: int = 3):
+        '''`max_retries` is how many times a request is retried after a 429 response.'''
+        self.max_retries = max_retries
+        self._limits = {}
+
+    def budget(self, family: str) -> RateLimit | None:
+        '''Current limit of an endpoint family, such as `1.1/statuses/update`, if known.'''
+        limit = self._limits.get(family)
+        if limit is not None and limit.reset <= time.time():
+            # a new window started
+            limit.remaining = limit.limit
+            limit.reset = time.time() + DEFAULT_RESET_SECS
+        return limit
+
+    def budgets(self) -> dict[str, RateLimit]:
+        '''Current limit of every endpoint family with a known limit.'''
+        return { family: limit for family in list(self._limits)
+                if (limit := self.budget(family)) is not None }
+
+    def remaining(self, family: str) -> int | None:
+        '''Requests left to an endpoint family before it resets, if known.'''
+        limit = self.budget(family)
+        return None if limit is None else limit.remaining
+
+    def wait_time(self, family: str) -> float:
+        '''Seconds until a request to an endpoint family can be sent.'''
+        limit = self.budget(family)
+        if limit is None or limit.remaining > 0:
+            return 0.0
+        return max(0.0, limit.reset - time.time() + RESET_MARGIN_SECS)
+
+    async def acquire(self, family: str) -> float:
+        '''
+        Wait until a request to an endpoint family fits in its limit, and count it.
+        Returns how long it waited.
+        '''
+        waited = 0.0
+        while (wait := self.wait_time(family)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        if (limit := self._limits.get(family)) is not None:
+            limit.remaining -= 1
+        return waited
+
+    def update(self, family: str, status: int, headers: Mapping[str, str]):
+        '''Record the rate limit headers of a response.'''
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = float(headers['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            if status == 429: # limited without saying until when
+                self._limits[family] = RateLimit(
+                    self._limits[family].limit if family in self._limits else 1,
+                    0, time.time() + DEFAULT_RESET_SECS)
+            return
+        if status == 429:
+            remaining = 0
+        known = self._limits.get(family)
+        if known is not None and known.reset == reset:
+            # same window: responses can arrive out of order, so keep the lowest
+            known.remaining = min(known.remaining, remaining)
+        else:
+            self._limits[family] = RateLimit(limit, remaining, reset)
@@ -0,0 +1,50 @@
+'''
+HTTP connection pools to share between clients
+'''
+import aiohttp
+
+class TwitterSession:
+    '''
+    Pool of HTTP connections to share between `Twitter`, `TwitterV2` and
+    `TwitterUpload` clients, for example one for each of many accounts, so
+    they reuse connections to the same hosts instead of each opening their own.
+    Connections are kept alive between requests, and DNS lookups are cached.
+    Like clients, it must be created while an event loop is running.
+
+    Clients do not close a session given to them. Close it with `close`,
+    or by using it with `async with`.
+
+    NOTE: aiohttp only speaks HTTP/1.1, so connections are not multiplexed.
+    '''
+    client: aiohttp.ClientSession
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30.0,
+            dns_cache_ttl: int | None = 300, timeout: float | None = None):
+        '''
+        At most `limit` connections are open at once, and at most
+        `limit_per_host` to each host. Idle connections are closed after
+        `keepalive_timeout` seconds. DNS results are reused for
+        `dns_cache_ttl` seconds, or forever if None. Requests give up after
+        `timeout` seconds in total, or never if None.
+        '''
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_cache_ttl)
+        self.client = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+    @property
+    def closed(self) -> bool:
+        return self.client.closed
+
+    async def close(self):
+        '''Close every connection. Clients using the session can no longer make requests.'''
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
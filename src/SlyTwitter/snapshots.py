@@ -0,0 +1,178 @@
+'''
+Storing follow snapshots on disk, and syncing them incrementally
+'''
+import sqlite3, time
+from array import array
+from typing import Any, Literal, Sequence
+
+from .graph import FollowSnapshot, sorted_ids
+from .pagination import Paginated
+from .twitter import Twitter, User
+from .twitter_v2 import TwitterV2, User as UserV2
+
+FollowKind = Literal['followers', 'following']
+
+# an incremental sync stops after this many IDs in a row that are already known
+KNOWN_RUN = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS follows (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, kind, member_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_by_time ON changes (user_id, kind, at);
+CREATE TABLE IF NOT EXISTS syncs (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    at REAL NOT NULL,
+    full INTEGER NOT NULL,
+    fetched INTEGER NOT NULL
+);
+'''
+
+class Churn:
+    '''Users who started or stopped following, or being followed, as sorted arrays of IDs'''
+    gained: array
+    lost: array
+
+    def __init__(self, gained: array, lost: array):
+        self.gained = gained
+        self.lost = lost
+
+    def __bool__(self) -> bool:
+        return bool(self.gained or self.lost)
+
+class SnapshotStore:
+    '''
+    The latest known followers and followed users of each user, and every
+    change to them, in an SQLite database.
+    '''
+    path: str
+    _db: sqlite3.Connection
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def ids(self, user_id: int, kind: FollowKind) -> array:
+        '''Stored IDs of a user's followers or followed users, sorted.'''
+        rows = self._db.execute(
+            'SELECT member_id FROM follows WHERE user_id = ? AND kind = ? ORDER BY member_id', (user_id, kind))
+        return array('q', (member_id for member_id, in rows))
+
+    def snapshot(self, user: User) -> FollowSnapshot:
+        '''Stored followers and followed users of a user, as a snapshot as of its last sync.'''
+        return FollowSnapshot(user, self.ids(user.id, 'followers'), self.ids(user.id, 'following'),
+            self.last_synced(user.id) or 0.0)
+
+    def last_synced(self, user_id: int, kind: FollowKind | None = None, full: bool = False) -> float | None:
+        '''Unix time of the last sync of a user, of one kind or either, and only full ones if `full`.'''
+        query = 'SELECT MAX(at) FROM syncs WHERE user_id = ?'
+        params: list[Any] = [user_id]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        if full:
+            query += ' AND full = 1'
+        return self._db.execute(query, params).fetchone()[0]
+
+    def merge(self, user_id: int, kind: FollowKind, fetched: Sequence[int], full: bool, at: float | None = None) -> Churn:
+        '''
+        Record IDs fetched by a sync. IDs not stored yet are added. A `full`
+        sync has every ID, so stored IDs it did not fetch are removed.
+        '''
+        at = time.time() if at is None else at
+        known = self.ids(user_id, kind)
+        known_set = set(known)
+        gained = array('q', (id_ for id_ in fetched if id_ not in known_set))
+        lost = array('q')
+        if full:
+            fetched_set = set(fetched)
+            lost = array('q', (id_ for id_ in known if id_ not in fetched_set))
+        with self._db:
+            self._db.executemany('INSERT INTO follows VALUES (?, ?, ?)', ((user_id, kind, id_) for id_ in gained))
+            self._db.executemany('DELETE FROM follows WHERE user_id = ? AND kind = ? AND member_id = ?',
+                ((user_id, kind, id_) for id_ in lost))
+            self._db.executemany('INSERT INTO changes VALUES (?, ?, ?, ?, ?)',
+                [(user_id, kind, id_, 1, at) for id_ in gained] + [(user_id, kind, id_, 0, at) for id_ in lost])
+            self._db.execute('INSERT INTO syncs VALUES (?, ?, ?, ?, ?)', (user_id, kind, at, int(full), len(fetched)))
+        return Churn(gained, lost)
+
+    def churn(self, user_id: int, kind: FollowKind, since: float = 0.0, until: float | None = None) -> Churn:
+        '''
+        Net changes to a user's followers or followed users between two times.
+        A user who left and came back in that time is in neither.
+        '''
+        query = 'SELECT member_id, added FROM changes WHERE user_id = ? AND kind = ? AND at > ?'
+        params: list[Any] = [user_id, kind, since]
+        if until is not None:
+            query += ' AND at <= ?'
+            params.append(until)
+        net: dict[int, int] = {}
+        for member_id, added in self._db.execute(query + ' ORDER BY at', params):
+            net[member_id] = net.get(member_id, 0) + (1 if added else -1)
+        return Churn(
+            sorted_ids(id_ for id_, n in net.items() if n > 0),
+            sorted_ids(id_ for id_, n in net.items() if n < 0))
+
+async def _fetch_ids(paginated: Paginated[Any], known: set[int], known_run: int | None) -> tuple[array, bool]:
+    '''IDs from pages, stopping after `known_run` known IDs in a row. Returns whether every page was read.'''
+    fetched = array('q')
+    run = 0
+    async for page in paginated.pages():
+        for item in page:
+            id_ = item if isinstance(item, int) else item.id
+            fetched.append(id_)
+            run = run + 1 if id_ in known else 0
+        if known_run is not None and run >= known_run:
+            return fetched, False
+    return fetched, True
+
+async def sync_follows(store: SnapshotStore, api: Twitter | TwitterV2, user: User | UserV2, kind: FollowKind,
+        full: bool = False, known_run: int = KNOWN_RUN, page_size: int | None = None) -> Churn:
+    '''
+    Fetch a user's followers or followed users, and merge them into a store.
+    The user must have an ID.
+
+    Both lists come back newest first, so unless `full` is set, fetching stops
+    at the end of the first page with `known_run` already stored IDs in a row,
+    and only new IDs are fetched, without fetching pages ahead that would be
+    thrown away. Incremental syncs cannot see removals, so
+    lost users are only found by full syncs. The first sync of a user is
+    always full.
+    '''
+    known = set(store.ids(user.id, kind))
+    incremental = not full and bool(known)
+    options: dict[str, Any] = { 'prefetch': not incremental }
+    if page_size is not None:
+        options['page_size'] = page_size
+    match api, kind:
+        case Twitter(), 'followers':
+            paginated = api.follower_ids(user.id, **options)
+        case Twitter(), 'following':
+            paginated = api.following_ids(user.id, **options)
+        case TwitterV2(), 'followers':
+            paginated = await api.all_followers_of(user, **options) # type: ignore
+        case TwitterV2(), _:
+            paginated = await api.all_followed_by(user, **options) # type: ignore
+    fetched, complete = await _fetch_ids(paginated, known, known_run if incremental else None)
+    return store.merge(user.id, kind, sorted_ids(fetched), complete)
@@ -0,0 +1,330 @@
+'''
+Consuming v2 filtered and sampled streams
+https://developer.twitter.com/en/docs/twitter-api/tweets/filtered-stream/integrate/handling-disconnections
+'''
+import asyncio
+from collections import deque
+from contextlib import AbstractAsyncContextManager
+from enum import Enum
+from typing import Any, AsyncGenerator, Callable
+
+import aiohttp
+from SlyAPI.web import ApiError
+
+from .common import TwitterError, loads
+
+# twitter sends a blank line every 20 seconds when there are no tweets
+HEARTBEAT_TIMEOUT = 30.0
+# for opening the connection, separate from waiting for data once open
+CONNECT_TIMEOUT = 10.0
+# waits before reconnecting: increasing linearly after network errors,
+NETWORK_BACKOFF_STEP = 0.25
+NETWORK_BACKOFF_MAX = 16.0
+# doubling after HTTP errors,
+HTTP_BACKOFF_START = 5.0
+HTTP_BACKOFF_MAX = 320.0
+# and doubling from a minute after being rate limited, up to a rate limit window
+RATE_LIMITED_BACKOFF_START = 60.0
+RATE_LIMITED_BACKOFF_MAX = 960.0
+# IDs of this many recent tweets are remembered, to skip them if repeated after reconnecting
+RECENT_IDS = 1000
+
+class StreamRule:
+    '''A filtered stream rule, with its ID once it has been added'''
+    __slots__ = ('value', 'tag', 'id')
+    value: str
+    tag: str | None
+    id: int | None
+
+    def __init__(self, value: str, tag: str | None = None, id: int | None = None):
+        self.value = value
+        self.tag = tag
+        self.id = id
+
+    @classmethod
+    def from_json(cls, source: Any) -> 'StreamRule':
+        return cls(source.get('value', ''), source.get('tag'), int(source['id']) if 'id' in source else None)
+
+    def to_json(self) -> dict[str, str]:
+        rule = { 'value': self.value }
+        if self.tag is not None:
+            rule['tag'] = self.tag
+        return rule
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StreamRule):
+            return NotImplemented
+        return (self.value, self.tag, self.id) == (other.value, other.tag, other.id)
+
+    def __hash__(self) -> int:
+        return hash((self.value, self.tag, self.id))
+
+    def __repr__(self) -> str:
+        return F"StreamRule({self.value!r}, tag={self.tag!r}, id={self.id})"
+
+class OverflowPolicy(Enum):
+    '''What a stream does with a new tweet when its buffer is full'''
+    # stop reading until there is room, slowing the connection.
+    # twitter disconnects readers that fall too far behind
+    BLOCK = 'block'
+    DROP_NEWEST = 'drop_newest'
+    DROP_OLDEST = 'drop_oldest'
+
+class StreamDisconnected(Exception):
+    '''Twitter ended a stream with a message, such as for maintenance'''
+    errors: Any
+
+    def __init__(self, errors: Any):
+        super().__init__(errors)
+        self.errors = errors
+
+class NDJSONDecoder:
+    '''
+    Decodes newline-delimited JSON as it arrives, in chunks that may end
+    partway through a line. Blank lines are counted as heartbeats.
+    '''
+    heartbeats: int
+    _buffer: bytearray
+    _loads: Callable[[bytes], Any]
+
+    def __init__(self, loads: Callable[[bytes], Any] = loads):
+        self.heartbeats = 0
+        self._buffer = bytearray()
+        self._loads = loads
+
+    def feed(self, data: bytes) -> list[Any]:
+        '''Values of every line completed by `data`.'''
+        buffer = self._buffer
+        end = data.rfind(b'\n')
+        if end < 0:
+            buffer += data
+            return []
+        if buffer:
+            buffer += data[:end]
+            lines = buffer.split(b'\n')
+            buffer.clear()
+        else:
+            lines = data[:end].split(b'\n')
+        buffer += data[end+1:]
+        values: list[Any] = []
+        for line in lines:
+            if line.strip():
+                values.append(self._loads(line))
+            else:
+                self.heartbeats += 1
+        return values
+
+    def reset(self):
+        '''Forget a partial line, such as after a disconnect.'''
+        self._buffer.clear()
+
+def reconnect_delay(error: BaseException, failures: int) -> float:
+    '''Seconds to wait before reconnecting after `failures` failed attempts in a row, the last with `error`.'''
+    if isinstance(error, ApiError):
+        if error.status == 429:
+            return min(RATE_LIMITED_BACKOFF_START * 2**failures, RATE_LIMITED_BACKOFF_MAX)
+        return min(HTTP_BACKOFF_START * 2**failures, HTTP_BACKOFF_MAX)
+    return min(NETWORK_BACKOFF_STEP * (failures + 1), NETWORK_BACKOFF_MAX)
+
+def is_fatal(error: BaseException) -> bool:
+    '''Whether reconnecting after an error would not help, such as bad credentials.'''
+    return isinstance(error, ApiError) and 400 <= error.status < 500 and error.status not in (420, 429)
+
+Connect = Callable[[bool], AbstractAsyncContextManager[aiohttp.ClientResponse]]
+
+class TweetStream:
+    '''
+    Tweets from a long-lived streaming connection, as an async iterator.
+    Tweets are read into a buffer of up to `buffer_size` as they arrive, and
+    when it is full, handled by `overflow`. If no data, not even a heartbeat,
+    arrives for `heartbeat_timeout` seconds, or the connection drops, it
+    reconnects with backoff, keeping buffered tweets and skipping repeated
+    ones. Errors that reconnecting would not fix, or running out of
+    `max_reconnects`, end the iteration by raising.
+
+    Reading starts with iteration or `async with`. Close the stream with
+    `close` or by leaving `async with`.
+    '''
+    buffer_size: int
+    overflow: OverflowPolicy
+    heartbeat_timeout: float
+    max_reconnects: int | None
+    dropped: int
+    reconnects: int
+    connected: bool
+
+    _connect: Connect
+    _parse: Callable[[Any], Any]
+    _decoder: NDJSONDecoder
+    _buffer: 'deque[Any]'
+    _ready: asyncio.Event
+    _room: asyncio.Event
+    _recent: 'deque[int]'
+    _recent_set: set[int]
+    _task: 'asyncio.Task[None] | None'
+    _error: BaseException | None
+    _closed: bool
+
+    def __init__(self, connect: Connect, parse: Callable[[Any], Any], buffer_size: int = 1000,
+            overflow: OverflowPolicy = OverflowPolicy.BLOCK, heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+            max_reconnects: int | None = None):
+        '''
+        `connect(reconnecting)` opens the connection, and `parse` builds an
+        item from each message with data.
+        '''
+        if buffer_size < 1:
+            raise ValueError("Stream buffer size must be at least 1.")
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_reconnects = max_reconnects
+        self.dropped = 0
+        self.reconnects = 0
+        self.connected = False
+        self._connect = connect
+        self._parse = parse
+        self._decoder = NDJSONDecoder()
+        self._buffer = deque()
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._recent = deque()
+        self._recent_set = set()
+        self._task = None
+        self._error = None
+        self._closed = False
+
+    @property
+    def heartbeats(self) -> int:
+        return self._decoder.heartbeats
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        '''Start reading, if not already.'''
+        if self._task is None and not self._closed:
+            self._task = asyncio.create_task(self._run())
+
+    def _seen(self, id_: int) -> bool:
+        if id_ in self._recent_set:
+            return True
+        self._recent.append(id_)
+        self._recent_set.add(id_)
+        if len(self._recent) > RECENT_IDS:
+            self._recent_set.discard(self._recent.popleft())
+        return False
+
+    async def _offer(self, item: Any):
+        while len(self._buffer) >= self.buffer_size:
+            match self.overflow:
+                case OverflowPolicy.BLOCK:
+                    self._room.clear()
+                    await self._room.wait()
+                case OverflowPolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                case OverflowPolicy.DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+        self._buffer.append(item)
+        self._ready.set()
+
+    async def _read(self, resp: aiohttp.ClientResponse):
+        self._decoder.reset()
+        while chunk := await asyncio.wait_for(resp.content.readany(), self.heartbeat_timeout):
+            for message in self._decoder.feed(chunk):
+                match message:
+                    case { 'data': { 'id': str(id_) } }:
+                        if not self._seen(int(id_)):
+                            await self._offer(self._parse(message))
+                    case { 'errors': errors }:
+                        raise StreamDisconnected(errors)
+                    case _:
+                        pass
+
+    async def _run(self):
+        failures = 0
+        try:
+            while True:
+                try:
+                    async with self._connect(self.reconnects > 0) as resp:
+                        self.connected = True
+                        failures = 0
+                        await self._read(resp)
+                    error: BaseException = StreamDisconnected("Connection closed")
+                except (ApiError, StreamDisconnected, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if is_fatal(e):
+                        raise
+                    error = e
+                finally:
+                    self.connected = False
+                if self.max_reconnects is not None and self.reconnects >= self.max_reconnects:
+                    raise error
+                await asyncio.sleep(reconnect_delay(error, failures))
+                failures += 1
+                self.reconnects += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            self._closed = True
+            self._ready.set()
+
+    async def next_match(self) -> tuple[Any, list[StreamRule]]:
+        '''The next item, with the rules it matched.'''
+        self.start()
+        while not self._buffer:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        item = self._buffer.popleft()
+        self._room.set()
+        return item
+
+    async def matches(self) -> AsyncGenerator[tuple[Any, list[StreamRule]], None]:
+        '''Iterate over items with the rules each matched.'''
+        while True:
+            try:
+                yield await self.next_match()
+            except StopAsyncIteration:
+                return
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        item, _ = await self.next_match()
+        return item
+
+    async def close(self):
+        '''Disconnect. Tweets already buffered can still be read.'''
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._ready.set()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+def parse_matching_rules(message: Any) -> list[StreamRule]:
+    return [StreamRule.from_json(rule) for rule in message.get('matching_rules', ())]
+
+def rules_result(result: Any) -> list[StreamRule]:
+    '''Rules of a rules response, raising `TwitterError` if any were invalid'''
+    if 'errors' in result:
+        raise TwitterError(result['errors'])
+    return [StreamRule.from_json(rule) for rule in result.get('data', [])]
@@ -0,0 +1,295 @@
+'''
+Fetching only new tweets from timelines, and polling many of them
+'''
+import asyncio, heapq, sqlite3, time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+from .twitter import TWEETS_PER_PAGE, Twitter, User
+from .twitter_v2 import MAX_TWEETS_PAGE_SIZE, TwitterV2, User as UserV2
+
+# most pages fetched by one poll, while catching up on many new tweets
+MAX_PAGES_PER_POLL = 5
+# weight of the latest poll in a timeline's estimated tweets per second
+RATE_SMOOTHING = 0.3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS watermarks (
+    source TEXT PRIMARY KEY,
+    since_id INTEGER,
+    max_id INTEGER,
+    newest_id INTEGER,
+    rate REAL,
+    polled_at REAL
+);
+'''
+
+class Watermark:
+    '''
+    How far a timeline has been read. Every tweet up to `since_id` has been
+    returned. While catching up over several polls, `max_id` is the oldest
+    tweet returned so far, tweets between the two are still to fetch, and
+    `newest_id` becomes `since_id` once they are.
+    '''
+    __slots__ = ('since_id', 'max_id', 'newest_id', 'rate', 'polled_at')
+    since_id: int | None
+    max_id: int | None
+    newest_id: int | None
+    rate: float | None # estimated new tweets per second, once polled twice
+    polled_at: float | None # unix time
+
+    def __init__(self, since_id: int | None = None, max_id: int | None = None, newest_id: int | None = None,
+            rate: float | None = None, polled_at: float | None = None):
+        self.since_id = since_id
+        self.max_id = max_id
+        self.newest_id = newest_id
+        self.rate = rate
+        self.polled_at = polled_at
+
+    @property
+    def catching_up(self) -> bool:
+        return self.max_id is not None
+
+    def __repr__(self) -> str:
+        return F"Watermark(since_id={self.since_id}, max_id={self.max_id}, newest_id={self.newest_id}, rate={self.rate})"
+
+class WatermarkStore:
+    '''The `Watermark` of each timeline, by key, in an SQLite database.'''
+    path: str
+    _db: sqlite3.Connection
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get(self, source: str) -> Watermark:
+        '''The watermark of a timeline, empty if it was never polled.'''
+        row = self._db.execute(
+            'SELECT since_id, max_id, newest_id, rate, polled_at FROM watermarks WHERE source = ?', (source,)).fetchone()
+        return Watermark() if row is None else Watermark(*row)
+
+    def put(self, source: str, watermark: Watermark):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?, ?, ?)', (source,
+                watermark.since_id, watermark.max_id, watermark.newest_id, watermark.rate, watermark.polled_at))
+
+    def sources(self) -> list[str]:
+        return [source for source, in self._db.execute('SELECT source FROM watermarks ORDER BY source')]
+
+# (since_id, before_id, count) -> tweets newer than since_id and older than before_id, newest first,
+# and whether there may be older ones. pages can be short before the end, such as when deleted tweets are left out
+FetchPage = Callable[[int | None, int | None, int], Awaitable[tuple[list[Any], bool]]]
+
+class Timeline:
+    '''A timeline of tweets, fetched newest first, known by a key for its watermark'''
+    key: str
+    fetch: FetchPage
+    page_size: int
+
+    def __init__(self, key: str, fetch: FetchPage, page_size: int):
+        self.key = key
+        self.fetch = fetch
+        self.page_size = page_size
+
+    def __repr__(self) -> str:
+        return F"Timeline({self.key!r})"
+
+def user_timeline(api: Twitter | TwitterV2, user: User | UserV2 | int | str) -> Timeline:
+    '''A user's tweets. With v2, the user must be a `User` with an ID.'''
+    match api, user:
+        case Twitter(), _:
+            user_ = user if isinstance(user, User) else User(user) # type: ignore
+            who = user_.id if hasattr(user_, 'id') else user_.at.lower()
+            async def fetch_v1(since_id: int | None, before_id: int | None, count: int):
+                # max_id includes the tweet with that ID. v1.1 does not say if there are more, so only an empty page ends
+                page = await api.user_timeline(user_, since_id, None if before_id is None else before_id - 1, count)
+                return page, bool(page)
+            return Timeline(F'1.1/statuses/user_timeline/{who}', fetch_v1, TWEETS_PER_PAGE)
+        case TwitterV2(), UserV2():
+            async def fetch_v2(since_id: int | None, before_id: int | None, count: int):
+                page, next_token = await api._timeline(F'users/{user.id}/tweets', since_id, before_id, count, {})
+                return page, next_token is not None
+            return Timeline(F'2/users/{user.id}/tweets', fetch_v2, MAX_TWEETS_PAGE_SIZE)
+        case _:
+            raise TypeError(F"{user} is not a v2 User")
+
+def mentions_timeline(api: Twitter | TwitterV2, user: User | UserV2 | int | str) -> Timeline:
+    '''
+    Tweets mentioning a user. With v1.1 these are always of the
+    authenticated user, who `user` names. With v2, `user` must be a
+    `User` with an ID.
+    '''
+    match api, user:
+        case Twitter(), _:
+            user_ = user if isinstance(user, User) else User(user) # type: ignore
+            who = user_.id if hasattr(user_, 'id') else user_.at.lower()
+            async def fetch_v1(since_id: int | None, before_id: int | None, count: int):
+                page = await api.mentions_timeline(since_id, None if before_id is None else before_id - 1, count)
+                return page, bool(page)
+            return Timeline(F'1.1/statuses/mentions_timeline/{who}', fetch_v1, TWEETS_PER_PAGE)
+        case TwitterV2(), UserV2():
+            async def fetch_v2(since_id: int | None, before_id: int | None, count: int):
+                page, next_token = await api._timeline(F'users/{user.id}/mentions', since_id, before_id, count, {})
+                return page, next_token is not None
+            return Timeline(F'2/users/{user.id}/mentions', fetch_v2, MAX_TWEETS_PAGE_SIZE)
+        case _:
+            raise TypeError(F"{user} is not a v2 User")
+
+async def poll(store: WatermarkStore, timeline: Timeline, max_pages: int = MAX_PAGES_PER_POLL,
+        at: float | None = None) -> list[Any]:
+    '''
+    Tweets of a timeline that are new since the last poll, oldest first,
+    moving its watermark past them. The first poll of a timeline only
+    returns its latest page.
+
+    Pages are fetched newest first, so if there are more than `max_pages`
+    of new tweets, the newest are returned, and the older ones are fetched
+    by the next polls before any newer than them. Short pages do not end a
+    poll, only an empty one or the timeline saying there are no more.
+    If a request fails, nothing is returned and the watermark stays put.
+    '''
+    at = time.time() if at is None else at
+    mark = store.get(timeline.key)
+    first = mark.since_id is None and not mark.catching_up
+    before = mark.max_id
+    newest = mark.newest_id
+    tweets: list[Any] = []
+    done = False
+    for _ in range(1 if first else max_pages):
+        page, more = await timeline.fetch(mark.since_id, before, timeline.page_size)
+        tweets += page
+        if page:
+            before = min(tweet.id for tweet in page)
+            newest = max(newest or 0, max(tweet.id for tweet in page))
+        if not page or not more:
+            done = True
+            break
+
+    if done or first:
+        mark.since_id = newest if newest is not None else mark.since_id
+        mark.max_id = mark.newest_id = None
+    else:
+        mark.max_id, mark.newest_id = before, newest
+    if mark.polled_at is not None and at > mark.polled_at:
+        observed = len(tweets) / (at - mark.polled_at)
+        mark.rate = observed if mark.rate is None else RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * mark.rate
+    mark.polled_at = at
+    store.put(timeline.key, mark)
+    tweets.sort(key=lambda tweet: tweet.id)
+    return tweets
+
+class TimelinePoller:
+    '''
+    Polls many timelines in one loop, each at its own interval between
+    `min_interval` and `max_interval` seconds, aiming for about `target`
+    new tweets a poll: busy accounts are polled often, quiet ones rarely.
+    Timelines catching up on many new tweets are polled again at the
+    shortest interval. Iterate to get each poll's new tweets.
+
+    Failed polls are retried at the longest interval, and their last
+    error is kept in `errors`.
+    '''
+    store: WatermarkStore
+    min_interval: float
+    max_interval: float
+    target: float
+    max_pages: int
+    errors: dict[str, BaseException]
+    _timelines: dict[str, Timeline]
+    _due: list[tuple[float, str]] # heap, with stale entries skipped
+    _scheduled: dict[str, float] # when each timeline not being polled is due
+    _semaphore: asyncio.Semaphore
+
+    def __init__(self, store: WatermarkStore, timelines: Iterable[Timeline] = (), min_interval: float = 60,
+            max_interval: float = 900, target: float = 5, concurrency: int = 4, max_pages: int = MAX_PAGES_PER_POLL):
+        '''Up to `concurrency` timelines are polled at once.'''
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Poll intervals must be positive, and the minimum no more than the maximum.")
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target
+        self.max_pages = max_pages
+        self.errors = {}
+        self._timelines = {}
+        self._due = []
+        self._scheduled = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        for timeline in timelines:
+            self.add(timeline)
+
+    def add(self, timeline: Timeline):
+        '''
+        Start polling a timeline, due now if it has not been polled recently.
+        Adding one already polled replaces it, keeping its schedule.
+        '''
+        known = timeline.key in self._timelines
+        self._timelines[timeline.key] = timeline
+        if not known:
+            mark = self.store.get(timeline.key)
+            self._schedule(timeline.key, 0.0 if mark.polled_at is None else mark.polled_at + self.interval(mark))
+
+    def remove(self, key: str):
+        '''Stop polling a timeline. Its watermark is kept.'''
+        self._timelines.pop(key, None)
+        self._scheduled.pop(key, None)
+
+    def _schedule(self, key: str, due: float):
+        self._scheduled[key] = due
+        heapq.heappush(self._due, (due, key))
+
+    def interval(self, mark: Watermark) -> float:
+        '''Seconds until a timeline is next polled.'''
+        if mark.catching_up or mark.rate is None:
+            return self.min_interval
+        if mark.rate <= 0:
+            return self.max_interval
+        return max(self.min_interval, min(self.max_interval, self.target / mark.rate))
+
+    def next_due(self) -> float | None:
+        '''Unix time the next poll is due, if any timelines are polled.'''
+        while self._due and self._scheduled.get(self._due[0][1]) != self._due[0][0]:
+            heapq.heappop(self._due)
+        return self._due[0][0] if self._due else None
+
+    async def _poll_one(self, timeline: Timeline, now: float) -> tuple[Timeline, list[Any]]:
+        async with self._semaphore:
+            try:
+                tweets = await poll(self.store, timeline, self.max_pages, now)
+            except Exception as e:
+                # one timeline failing, however it fails, must not stop the others
+                self.errors[timeline.key] = e
+                if timeline.key in self._timelines:
+                    self._schedule(timeline.key, now + self.max_interval)
+                return timeline, []
+        self.errors.pop(timeline.key, None)
+        if timeline.key in self._timelines:
+            self._schedule(timeline.key, now + self.interval(self.store.get(timeline.key)))
+        return timeline, tweets
+
+    async def poll_due(self, now: float | None = None) -> list[tuple[Timeline, list[Any]]]:
+        '''Poll every timeline that is due, returning each one's new tweets.'''
+        now = time.time() if now is None else now
+        due: dict[str, Timeline] = {}
+        while (next_due := self.next_due()) is not None and next_due <= now:
+            _, key = heapq.heappop(self._due)
+            del self._scheduled[key]
+            due[key] = self._timelines[key]
+        return await asyncio.gather(*(self._poll_one(timeline, now) for timeline in due.values()))
+
+    async def __aiter__(self) -> AsyncIterator[tuple[Timeline, list[Any]]]:
+        '''Poll forever, yielding each timeline with its new tweets whenever it has any.'''
+        while (next_due := self.next_due()) is not None:
+            await asyncio.sleep(max(0.0, next_due - time.time()))
+            for timeline, tweets in await self.poll_due():
+                if tweets:
+                    yield timeline, tweets
@@ -3,31 +3,53 @@ Twitter API v1.1
 '''
 import re
 from datetime import datetime
-from typing import Any
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Sequence
 from SlyAPI import *
+from SlyAPI.web import ApiError
 
-from .twitter_upload import Media, TwitterUpload
+from .cache import ResponseCache
+from .common import BulkResult, TwitterError, TwitterWebAPI, batched, gather_batches, run_bulk
+from .instrument import Instruments
+from .loader import BatchLoader
+from .media_cache import MediaCache
+from .pagination import Paginated
+from .processing import ProcessingTracker
+from .ratelimit import RateLimiter
+from .session import TwitterSession
+from .twitter_upload import CHUNK_SIZE, AppendEncoding, Media, MediaSource, TwitterUpload
+
+if TYPE_CHECKING:
+    from .graph import FollowSnapshot
 
 RE_TWEET_LINK = re.compile(r'https://twitter\.com/(?P<user>[a-z0-9_]+)/status/(?P<tweet_id>\d+)', re.IGNORECASE)
 RE_USER_LINK = re.compile(r'https://twitter\.com/(?P<user>[a-z0-9_]+)', re.IGNORECASE)
 
+# most users in one users/lookup request
+USERS_PER_LOOKUP = 100
+# most IDs in one page of followers/ids or friends/ids
+IDS_PER_PAGE = 5000
+# most tweets in one page of a timeline
+TWEETS_PER_PAGE = 200
+
 class User:
     '''Twitter user, can be hydrated from a variety of sources'''
+    __slots__ = ('id', 'at', 'display_name', 'location', 'website', '_extended', '_created_at')
     # TODO: consider garunteeing that these three are always hydrated
     id: int
     at: str
     display_name: str
 
     # hydratable fields
-    description: str|None = None
-    location: str|None = None
-    website: str|None = None
-    is_verified: bool|None = None
-    is_private: bool|None = None
-    created_at: datetime|None = None
-    profile_image: str|None = None
+    location: str|None
+    website: str|None
+    # extended fields, as they were in the response until read
+    # (description, verified, protected, created_at, profile_image_url_https)
+    _extended: tuple[str, bool, bool, str, str] | None
+    _created_at: datetime | None
 
-    def __init__(self, source: dict[str, Any]):
+    def __init__(self, source: int | str | dict[str, Any]):
+        self.location = self.website = None
+        self._extended = self._created_at = None
         match source:
             case int():
                 self.id = source
@@ -43,7 +65,7 @@ class User:
                 'screen_name': str(at),
                 'name': str(display_name),
                 'location': str(location),
-                'url': str(website),
+                'url': str() | None as website,
                 **extended
             }:
                 self.id = id
@@ -51,13 +73,13 @@ class User:
                 self.display_name = display_name
                 self.location = location
                 self.website = website
-                if extended:
-                    self.description = extended['description']
-                    self.is_verified = extended['verified']
-                    self.is_private = extended['protected']
-                    self.created_at = datetime.strptime(
-                        extended['created_at'], '%a %b %d %H:%M:%S %z %Y')
-                    self.profile_image = extended['profile_image_url_https']
+                if 'description' in extended:
+                    self._extended = (
+                        extended['description'],
+                        extended['verified'],
+                        extended['protected'],
+                        extended['created_at'],
+                        extended['profile_image_url_https'])
             case { # from following response
                 'followed_by': _,
                 'id': int(id),
@@ -68,24 +90,121 @@ class User:
             case _:
                 raise TypeError(F'Invalid source type for tweet: {type(source)}')
 
+    @classmethod
+    def from_page(cls, items: list[dict[str, Any]]) -> list['User']:
+        '''
+        Users of a response, such as users/lookup. If the first is a full user
+        object, every one is built by reading its keys directly instead of
+        matching it, much faster for large pages.
+        '''
+        if not items:
+            return []
+        first = items[0]
+        if not (isinstance(first, dict) and isinstance(first.get('id'), int) and 'location' in first):
+            return [cls(item) for item in items]
+        users: list[User] = []
+        new = cls.__new__
+        try:
+            for item in items:
+                user = new(cls)
+                user.id = item['id']
+                user.at = item['screen_name']
+                user.display_name = item['name']
+                user.location = item['location']
+                user.website = item['url']
+                user._created_at = None
+                user._extended = None if 'description' not in item else (
+                    item['description'],
+                    item['verified'],
+                    item['protected'],
+                    item['created_at'],
+                    item['profile_image_url_https'])
+                users.append(user)
+        except (KeyError, TypeError):
+            # not all the same shape: match each, for their errors
+            return [cls(item) for item in items]
+        return users
+
+    @property
+    def description(self) -> str|None:
+        return None if self._extended is None else self._extended[0]
+
+    @property
+    def is_verified(self) -> bool|None:
+        return None if self._extended is None else self._extended[1]
+
+    @property
+    def is_private(self) -> bool|None:
+        return None if self._extended is None else self._extended[2]
+
+    @property
+    def created_at(self) -> datetime|None:
+        # parsed on first read, since most users are never asked
+        if self._created_at is None and self._extended is not None:
+            self._created_at = datetime.strptime(self._extended[3], '%a %b %d %H:%M:%S %z %Y')
+        return self._created_at
+
+    @property
+    def profile_image(self) -> str|None:
+        return None if self._extended is None else self._extended[4]
+
+    def __eq__(self, other: object) -> bool:
+        '''Users are equal by ID, or by @ if neither has an ID.'''
+        if not isinstance(other, User):
+            return NotImplemented
+        match hasattr(self, 'id'), hasattr(other, 'id'):
+            case True, True:
+                return self.id == other.id
+            case False, False:
+                return self.at.lower() == other.at.lower()
+            case _:
+                return False
+
+    def __hash__(self) -> int:
+        if hasattr(self, 'id'):
+            return hash(self.id)
+        return hash(self.at.lower())
+
     def __str__(self):
         return F'@{self.at}'
 
 class Following:
     '''Following relationship between two users, four possible states'''
+    __slots__ = ('a', 'b', 'a_follows_b', 'b_follows_a')
     a: User
     b: User
-    mutual: bool
     a_follows_b: bool
     b_follows_a: bool
 
     def __init__(self, source: dict[str, Any]):
         self.a_follows_b = source['relationship']['source']['following']
         self.b_follows_a = source['relationship']['target']['following']
-        self.mutual = self.a_follows_b and self.b_follows_a
         self.a = User(source['relationship']['source'])
         self.b = User(source['relationship']['target'])
 
+    @classmethod
+    def between(cls, a: User, b: User, a_follows_b: bool, b_follows_a: bool) -> 'Following':
+        '''Relationship known without asking twitter, such as from a `FollowSnapshot`'''
+        following = cls.__new__(cls)
+        following.a = a
+        following.b = b
+        following.a_follows_b = a_follows_b
+        following.b_follows_a = b_follows_a
+        return following
+
+    @property
+    def mutual(self) -> bool:
+        return self.a_follows_b and self.b_follows_a
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Following):
+            return NotImplemented
+        return (self.a, self.b, self.a_follows_b, self.b_follows_a) == \
+            (other.a, other.b, other.a_follows_b, other.b_follows_a)
+
+    def __hash__(self) -> int:
+        return hash((self.a, self.b))
+
     def __str__(self) -> str:
         if self.mutual:
             rel_str = 'mutually follows'
@@ -99,6 +218,7 @@ class Following:
 
 
 class Tweet:
+    __slots__ = ('id', 'author_at', 'body')
     id: int
     author_at: str # twitter user @
     body: str
@@ -120,9 +240,43 @@ class Tweet:
                 self.id = id_
                 self.body = text
                 self.author_at = user
+            case { 'id': id_, 'full_text': text, 'user': { 'screen_name': user } }: # tweet_mode=extended
+                self.id = id_
+                self.body = text
+                self.author_at = user
             case _:
                 raise TypeError(F"{source} is not a valid source for Tweet")
 
+    @classmethod
+    def from_page(cls, items: list[dict[str, Any]]) -> list['Tweet']:
+        '''
+        Tweets of a response, such as a timeline, built by reading their
+        keys directly instead of matching each one.
+        '''
+        tweets: list[Tweet] = []
+        new = cls.__new__
+        try:
+            for item in items:
+                tweet = new(cls)
+                tweet.id = item['id']
+                tweet.author_at = item['user']['screen_name']
+                if (extended := item.get('extended_tweet')) is not None:
+                    tweet.body = extended['full_text']
+                else:
+                    tweet.body = item['text'] if 'text' in item else item['full_text']
+                tweets.append(tweet)
+        except (KeyError, TypeError, AttributeError):
+            return [cls(item) for item in items]
+        return tweets
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Tweet):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
     def link(self) -> str:
         return F"https://twitter.com/{self.author_at}/status/{self.id}"
 
@@ -139,44 +293,192 @@ def get_tweet_id(tweet: Tweet | int | str) -> int:
             raise TypeError(F"{tweet} is not a valid tweet, ID, or URL")
 
 
-class Twitter(WebAPI):
+class Twitter(TwitterWebAPI):
     '''Twitter V1.1 API Client'''
     base_url = 'https://api.twitter.com/1.1'
     _upload_api: TwitterUpload
+    response_cache: ResponseCache | None
+    _id_loader: BatchLoader[int, User] | None
+    _at_loader: BatchLoader[str, User] | None
     
-    def __init__(self, auth: OAuth1):
-
-        super().__init__(auth)
-        self._upload_api = TwitterUpload(auth)
+    def __init__(self, auth: OAuth1, media_cache: MediaCache | None = None, response_cache: ResponseCache | None = None,
+            rate_limits: RateLimiter | None = None, batch_window: float | None = None, max_batch_size: int = USERS_PER_LOOKUP,
+            session: TwitterSession | None = None, instruments: Instruments | None = None):
+        '''
+        With a `media_cache`, media attached to tweets by file, URL or bytes is
+        only uploaded the first time, then reused while it is unexpired.
+        With a `response_cache`, relationships from `check_follow` are reused.
+        Rate limits are tracked in `rate_limits`, shared with media uploads.
+        With a `batch_window` in seconds, `user` lookups made within it of
+        each other are merged into one request of up to `max_batch_size`.
+        A window of 0 merges lookups made in the same event loop iteration.
+        Requests go through `session` if given, and media uploads always
+        share connections with the rest of the client.
+        Requests, including media uploads, are reported to `instruments`.
+        '''
+        super().__init__(auth, rate_limits, session, instruments)
+        self._upload_api = TwitterUpload(auth, media_cache, self.rate_limits, session or self._client, self.instruments)
+        self.response_cache = response_cache
+        self._id_loader = self._at_loader = None
+        if batch_window is not None:
+            max_batch_size = min(max_batch_size, USERS_PER_LOOKUP)
+            self._id_loader = BatchLoader(self._load_users_by_id, max_batch_size, batch_window)
+            self._at_loader = BatchLoader(self._load_users_by_at, max_batch_size, batch_window)
 
     def get_full_url(self, path: str) -> str:
         return super().get_full_url(path) +'.json'
 
-    async def tweet(self, body: str, media: list[Media] | str | tuple[bytes, str] | None = None):
-        """ Post a tweet.
+    @property
+    def processing(self) -> ProcessingTracker:
+        '''Tracks uploaded media until twitter finishes processing it'''
+        return self._upload_api.processing
+
+    async def tweet(self, body: str, media: list[Media] | MediaSource | None = None,
+            in_reply_to: Tweet | int | str | None = None):
+        """ Post a tweet, optionally as a reply.
             Media can be:
             - a file path
             - a URL
             - some media already uploaded
             - a bytes-like obj a tupled with a file extension
+            - an async iterator of bytes tupled with a file extension and total size
         """
         data = { 'status': body }
         if media is not None and not isinstance(media, list):
             media = [await self._upload_api.upload(media)]
         if media:
             data |= { 'media_ids': ','.join(str(m.id) for m in media) }
+        if in_reply_to is not None:
+            data |= {
+                'in_reply_to_status_id': str(get_tweet_id(in_reply_to)),
+                'auto_populate_reply_metadata': 'true'
+            }
         return Tweet(await self.post_form( '/statuses/update',
             data = data
         ))
 
-    async def check_follow(self, a: User | str, b: User | str):
-        """ Get the relationship between two users. """
+    async def check_follow(self, a: User | str, b: User | str, snapshot: 'FollowSnapshot | None' = None):
+        """ Get the relationship between two users.
+            If a `snapshot` of either user is given, and the other has an ID,
+            the relationship is answered from it without a request.
+        """
+        if snapshot is not None and isinstance(a, User) and isinstance(b, User):
+            if snapshot.covers(a) and hasattr(b, 'id'):
+                return snapshot.check_follow(b)
+            if snapshot.covers(b) and hasattr(a, 'id'):
+                reverse = snapshot.check_follow(a)
+                return Following.between(reverse.b, reverse.a, reverse.b_follows_a, reverse.a_follows_b)
         if isinstance(a, User): a = a.at
         if isinstance(b, User): b = b.at
-        return Following(await self.get_json( '/friendships/show', {
-            'source_screen_name': a,
-            'target_screen_name': b
-        }))
+        async def fetch():
+            return Following(await self.get_json( '/friendships/show', {
+                'source_screen_name': a,
+                'target_screen_name': b
+            }))
+        if self.response_cache is None:
+            return await fetch()
+        return await self.response_cache.get('friendships/show', (a.lower(), b.lower()), fetch)
+
+    def _paginated_ids(self, path: str, user: User | int | str, page_size: int,
+            resume_token: str | None, prefetch: bool) -> Paginated[int]:
+        if not isinstance(user, User):
+            user = User(user)
+        # OAuth1 signs parameters as strings
+        params = { 'user_id': str(user.id) } if hasattr(user, 'id') else { 'screen_name': user.at }
+        params['count'] = str(min(page_size, IDS_PER_PAGE))
+        async def fetch_page(cursor: str | None) -> tuple[list[int], str | None]:
+            page = await self.get_json(path, params | { 'cursor': cursor or '-1' })
+            next_cursor = page['next_cursor_str'] # '0' on the last page
+            return page['ids'], None if next_cursor == '0' else next_cursor # type: ignore
+        return Paginated(fetch_page, resume_token, prefetch=prefetch)
+
+    def follower_ids(self, user: User | int | str, page_size: int = IDS_PER_PAGE,
+            resume_token: str | None = None, prefetch: bool = True) -> Paginated[int]:
+        """ Get the IDs of the users following a user, up to 5000 to a request.
+            See `Paginated` for `resume_token` and `prefetch`.
+        """
+        return self._paginated_ids('/followers/ids', user, page_size, resume_token, prefetch)
+
+    def following_ids(self, user: User | int | str, page_size: int = IDS_PER_PAGE,
+            resume_token: str | None = None, prefetch: bool = True) -> Paginated[int]:
+        """ Get the IDs of the users followed by a user, up to 5000 to a request.
+            See `Paginated` for `resume_token` and `prefetch`.
+        """
+        return self._paginated_ids('/friends/ids', user, page_size, resume_token, prefetch)
+
+    async def _timeline(self, path: str, params: dict[str, str], since_id: int | None, max_id: int | None,
+            count: int) -> list[Tweet]:
+        params = params | { 'count': str(min(count, TWEETS_PER_PAGE)), 'tweet_mode': 'extended' }
+        if since_id is not None: params['since_id'] = str(since_id)
+        if max_id is not None: params['max_id'] = str(max_id)
+        return Tweet.from_page(await self.get_json(path, params)) # type: ignore
+
+    async def user_timeline(self, user: User | int | str, since_id: int | None = None, max_id: int | None = None,
+            count: int = TWEETS_PER_PAGE, include_retweets: bool = True, exclude_replies: bool = False) -> list[Tweet]:
+        """ Get a page of up to 200 of a user's tweets, newest first, newer
+            than `since_id` and no newer than `max_id`.
+            See `SlyTwitter.timelines` for fetching only new tweets.
+        """
+        if not isinstance(user, User):
+            user = User(user)
+        params = { 'user_id': str(user.id) } if hasattr(user, 'id') else { 'screen_name': user.at }
+        params['include_rts'] = 'true' if include_retweets else 'false'
+        params['exclude_replies'] = 'true' if exclude_replies else 'false'
+        return await self._timeline('/statuses/user_timeline', params, since_id, max_id, count)
+
+    async def mentions_timeline(self, since_id: int | None = None, max_id: int | None = None,
+            count: int = TWEETS_PER_PAGE) -> list[Tweet]:
+        """ Get a page of up to 200 tweets mentioning the authenticated user,
+            newest first, newer than `since_id` and no newer than `max_id`.
+        """
+        return await self._timeline('/statuses/mentions_timeline', {}, since_id, max_id, count)
+
+    async def _lookup_batch(self, key: str, batch: Sequence[int | str]) -> list[User]:
+        try:
+            return User.from_page(await self.get_json('/users/lookup', { key: batch })) # type: ignore
+        except ApiError as e:
+            if e.status == 404: # none of them exist
+                return []
+            raise
+
+    async def _load_users_by_id(self, ids: list[int]) -> dict[int, User]:
+        return {user.id: user for user in await self._lookup_batch('user_id', ids)}
+
+    async def _load_users_by_at(self, ats: list[str]) -> dict[str, User]:
+        return {user.at.lower(): user for user in await self._lookup_batch('screen_name', ats)}
+
+    async def user(self, user: User | int | str) -> User:
+        """ Get a user by ID, @, link or partial `User`. """
+        if not isinstance(user, User):
+            user = User(user)
+        if hasattr(user, 'id'):
+            if self._id_loader is not None:
+                return await self._id_loader.load(user.id)
+            return User(await self.get_json('/users/show', { 'user_id': str(user.id) }))
+        else:
+            if self._at_loader is not None:
+                return await self._at_loader.load(user.at.lower())
+            return User(await self.get_json('/users/show', { 'screen_name': user.at }))
+
+    @AsyncLazy.wrap
+    async def lookup_users(self, *users: User | int | str, concurrency: int = 4) -> AsyncGenerator[User, None]:
+        """ Get users by ID, @, link or partial `User`, 100 to a request, up to
+            `concurrency` requests at once. Users are yielded as each batch
+            arrives, not in order, and users that do not exist are left out.
+        """
+        ids: list[int] = []
+        ats: list[str] = []
+        for user in users:
+            if not isinstance(user, User):
+                user = User(user)
+            if hasattr(user, 'id'):
+                ids.append(user.id)
+            else:
+                ats.append(user.at)
+        batches = [('user_id', b) for b in batched(ids, USERS_PER_LOOKUP)] + \
+                  [('screen_name', b) for b in batched(ats, USERS_PER_LOOKUP)]
+        async for user in gather_batches(batches, lambda b: self._lookup_batch(*b), concurrency):
+            yield user
 
     async def delete(self, tweet: Tweet | int | str):
         'Delete a tweet.'
@@ -188,7 +490,81 @@ class Twitter(WebAPI):
         tweet_id = get_tweet_id(tweet)
         await self.post_json(F'/statuses/retweet/{tweet_id}')
 
-    async def quote_tweet(self, body: str, quoting: Tweet | str, media: list[Media] | str | tuple[bytes, str] | None = None) -> Tweet:
+    @AsyncLazy.wrap
+    async def tweet_many(self, bodies: Sequence[str], concurrency: int = 4,
+            ordered: bool = True) -> AsyncGenerator[BulkResult[str, Tweet], None]:
+        """ Post many tweets, up to `concurrency` at once.
+            Yields a `BulkResult` for each, in order unless `ordered` is False,
+            and keeps going after any fail.
+        """
+        async for result in run_bulk(bodies, self.tweet, concurrency, ordered):
+            yield result
+
+    @AsyncLazy.wrap
+    async def delete_many(self, tweets: Sequence[Tweet | int | str], concurrency: int = 4,
+            ordered: bool = True) -> AsyncGenerator[BulkResult[Tweet | int | str, None], None]:
+        """ Delete many tweets, up to `concurrency` at once.
+            Yields a `BulkResult` for each, in order unless `ordered` is False,
+            and keeps going after any fail.
+        """
+        async for result in run_bulk(tweets, self.delete, concurrency, ordered):
+            yield result
+
+    @AsyncLazy.wrap
+    async def retweet_many(self, tweets: Sequence[Tweet | int | str], concurrency: int = 4,
+            ordered: bool = True) -> AsyncGenerator[BulkResult[Tweet | int | str, None], None]:
+        """ Retweet many tweets, up to `concurrency` at once.
+            Yields a `BulkResult` for each, in order unless `ordered` is False,
+            and keeps going after any fail.
+        """
+        async for result in run_bulk(tweets, self.retweet, concurrency, ordered):
+            yield result
+
+    @AsyncLazy.wrap
+    async def post_thread(self, bodies: Sequence[str], media: Sequence[list[Media] | MediaSource | None] | None = None,
+            in_reply_to: Tweet | int | str | None = None, media_concurrency: int = 4
+            ) -> AsyncGenerator[BulkResult[str, Tweet], None]:
+        """ Post a thread, each tweet replying to the one before it, and the
+            first to `in_reply_to` if given. `media` has the media of each tweet.
+            Media is uploaded first, up to `media_concurrency` files at once.
+            Yields a `BulkResult` for each tweet. Once one fails, the rest
+            are not posted, and fail with a `TwitterError`.
+        """
+        if media is not None and len(media) != len(bodies):
+            raise ValueError("Threads need media for each tweet, or None.")
+        uploads: list[list[Media] | None] = [None] * len(bodies)
+        to_upload = [(i, m) for i, m in enumerate(media or []) if m is not None and not isinstance(m, list)]
+        upload_failed: dict[int, BaseException] = {}
+        async for upload in run_bulk(to_upload, lambda entry: self._upload_api.upload(entry[1]), media_concurrency):
+            index = upload.item[0]
+            if upload.error is not None:
+                upload_failed[index] = upload.error
+            else:
+                uploads[index] = [upload.value] # type: ignore
+        for i, m in enumerate(media or []):
+            if isinstance(m, list):
+                uploads[i] = m
+
+        previous = in_reply_to
+        failed = False
+        for i, body in enumerate(bodies):
+            if failed:
+                yield BulkResult(i, body, error=TwitterError({'detail': 'An earlier tweet in the thread failed', 'index': i}))
+                continue
+            if i in upload_failed:
+                failed = True
+                yield BulkResult(i, body, error=upload_failed[i])
+                continue
+            try:
+                tweet = await self.tweet(body, uploads[i], previous)
+            except Exception as e:
+                failed = True
+                yield BulkResult(i, body, error=e)
+            else:
+                previous = tweet
+                yield BulkResult(i, body, tweet)
+
+    async def quote_tweet(self, body: str, quoting: Tweet | str, media: list[Media] | MediaSource | None = None) -> Tweet:
         'Post a tweet quoting another tweet.'
         if isinstance(quoting, Tweet):
             quoting = quoting.link()
@@ -197,15 +573,30 @@ class Twitter(WebAPI):
         body += ' {quoting}'
         return await self.tweet(body, media)
 
-    async def upload_media(self, file_: str | tuple[bytes, str]) -> Media:
+    async def upload_media(self, file_: MediaSource, chunk_size: int = CHUNK_SIZE, concurrency: int = 1,
+            encoding: AppendEncoding = AppendEncoding.BASE64) -> Media:
         """ Upload a new media file to twitter for attaching to tweets.
             File can be:
             - a file path
             - a URL
             - a bytes-like obj a tupled with a file extension
+            - an async iterator of bytes tupled with a file extension and total size
+            The file is streamed in chunks rather than read into memory at once.
+            Large files can send up to `concurrency` chunks in parallel.
+            Chunks are base64 encoded, which holds several copies of each chunk
+            in memory; `AppendEncoding.MULTIPART` sends them as raw bytes instead.
         """
-        return await self._upload_api.upload(file_)
+        return await self._upload_api.upload(file_, chunk_size, concurrency, encoding=encoding)
     
+    async def upload_media_many(self, files: Sequence[MediaSource], concurrency: int = 4,
+            return_exceptions: bool = False) -> list[Media | BaseException]:
+        """ Upload several media files at once, up to `concurrency` at a time.
+            Returns the media in the same order as `files`.
+            If any fail, raises a `BatchError` after the rest have finished,
+            or returns the errors in place if `return_exceptions` is set.
+        """
+        return await self._upload_api.upload_many(files, concurrency, return_exceptions)
+
     async def add_alt_text(self, media: Media, text: str):
         """ Add alt text to a media file. """
         await self._upload_api.add_alt_text(media, text)
\ No newline at end of file
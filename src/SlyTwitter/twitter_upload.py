@@ -1,15 +1,23 @@
 '''
 Twitter API v1.1 for uploading media
 '''
-import asyncio, base64, os
-from io import BytesIO
+import asyncio, base64, hashlib, os, time
+from contextlib import aclosing, asynccontextmanager
+from enum import Enum
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Sequence
 from SlyAPI import *
 from SlyAPI.oauth1 import OAuth1
+from SlyAPI.web import ApiError
 from SlyAPI.webapi import JsonMap
 
-import aiofiles
+import aiofiles, aiohttp
 
-from .common import TwitterError, RE_FILE_URL
+from .common import BatchError, TwitterWebAPI, RE_FILE_URL
+from .media_cache import CONTENT_KEY_PREFIX, MediaCache, content_key, hash_chunks
+from .instrument import Instruments
+from .processing import ProcessingTracker
+from .ratelimit import RateLimiter
+from .session import TwitterSession
 
 IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
 VIDEO_EXTENSIONS = ['mp4', 'webm']
@@ -19,6 +27,24 @@ MEDIA_TYPES = {
     'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'
 }
 
+# size of each APPEND segment
+CHUNK_SIZE = 4*1024*1024
+# images up to this size can be uploaded in one request, without INIT/APPEND/FINALIZE
+SIMPLE_UPLOAD_MAX_SIZE = 5_000_000
+# seconds before the first retry of a failed APPEND segment, doubling after
+SEGMENT_RETRY_DELAY = 0.5
+
+# a file path, a URL, bytes with a file extension,
+# or an async iterator of bytes with a file extension and total size
+MediaSource = str | tuple[bytes, str] | tuple[AsyncIterable[bytes], str, int]
+
+class AppendEncoding(Enum):
+    '''How APPEND segments are sent'''
+    # base64 in a urlencoded form, about 33% larger. the encoded, then percent-encoded
+    # copies of each segment in flight are held in memory, several times the chunk size
+    BASE64 = 'base64'
+    MULTIPART = 'multipart' # raw bytes in a multipart/form-data body, sent straight from the chunk
+
 def get_upload_info(ext: str, is_dm: bool):
     prefix = "dm" if is_dm else "tweet"
     if ext == 'gif':
@@ -35,24 +61,65 @@ def get_upload_info(ext: str, is_dm: bool):
         category = prefix+'_video'
     return max_size, category
 
+async def read_chunks(f: 'aiofiles.threadpool.binary.AsyncBufferedReader', chunk_size: int) -> AsyncGenerator[bytes, None]:
+    '''Read an open file in chunks of `chunk_size` bytes'''
+    while chunk := await f.read(chunk_size):
+        yield chunk
+
+async def slice_chunks(view: memoryview, chunk_size: int) -> AsyncGenerator[memoryview, None]:
+    '''Split a buffer into chunks of `chunk_size` bytes, without copying'''
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start+chunk_size]
+
+async def rechunk(chunks: AsyncIterable[bytes], chunk_size: int) -> AsyncGenerator[bytes, None]:
+    '''Regroup an async iterator of arbitrarily sized bytes into chunks of `chunk_size` bytes'''
+    buffer = bytearray()
+    async for data in chunks:
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
 class Media:
+    __slots__ = ('id', 'expires_at')
     id: int
+    # unix time after which the media can no longer be attached, if known
+    expires_at: float|None
 
     def __init__(self, source: int | JsonMap):
+        self.expires_at = None
         match source:
             case int():
                 self.id = source
+            case {'media_id': int(id_), 'expires_after_secs': int(expires_after)}:
+                self.id = id_
+                self.expires_at = time.time() + expires_after
             case {'media_id': int(id_)}:
                 self.id = id_
             case _:
                 raise TypeError(F"{source} is not a valid source for Media")
 
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Media):
+            return NotImplemented
+        return self.id == other.id
 
-class TwitterUpload(WebAPI):
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class TwitterUpload(TwitterWebAPI):
     base_url = 'https://upload.twitter.com/1.1/'
+    processing: ProcessingTracker
+    media_cache: MediaCache | None
 
-    def __init__(self, auth: OAuth1) -> None:
-        super().__init__(auth)
+    def __init__(self, auth: OAuth1, media_cache: MediaCache | None = None, rate_limits: RateLimiter | None = None,
+            session: TwitterSession | aiohttp.ClientSession | None = None, instruments: Instruments | None = None) -> None:
+        super().__init__(auth, rate_limits, session, instruments)
+        self.processing = ProcessingTracker(self.check_upload_status, instruments=self.instruments)
+        self.media_cache = media_cache
 
     def get_full_url(self, path: str) -> str:
         return super().get_full_url(path) +'.json'
@@ -72,6 +139,15 @@ class TwitterUpload(WebAPI):
             }
         )
 
+    async def simple_upload(self, data: bytes | memoryview, category: str):
+        form = aiohttp.FormData()
+        form.add_field('media', memoryview(data),
+            filename='media', content_type='application/octet-stream')
+        return Media(await self.post_form(
+            'media/upload', params = {
+                'media_category': category,
+            }, data = form))
+
     async def init_upload(self, type_: str, size: int, category: str):
         return Media(await self.post_form(
             'media/upload', data = {
@@ -81,7 +157,17 @@ class TwitterUpload(WebAPI):
                 'total_bytes': str(size),
         }))
 
-    async def append_upload(self, media: Media, index: int, chunk: bytes):
+    async def append_upload(self, media: Media, index: int, chunk: bytes | memoryview, encoding: AppendEncoding = AppendEncoding.BASE64):
+        if encoding == AppendEncoding.MULTIPART:
+            form = aiohttp.FormData()
+            form.add_field('media', memoryview(chunk),
+                filename='media', content_type='application/octet-stream')
+            return await self.post_form_empty(
+                'media/upload', params = {
+                    'command': 'APPEND',
+                    'media_id': str(media.id),
+                    'segment_index': str(index),
+                }, data = form)
         return await self.post_form_empty(
             'media/upload', data = {
                 'command': 'APPEND',
@@ -104,77 +190,186 @@ class TwitterUpload(WebAPI):
                 'media_id': str(media.id)
             })
 
-    async def upload(self, file_: str | tuple[bytes, str]) -> Media:
+
+    @asynccontextmanager
+    async def _open_media(self, file_: MediaSource, maxsize: int, chunk_size: int) -> AsyncIterator[tuple[int, AsyncGenerator[bytes | memoryview, None]]]:
+        '''Open a media source, yielding its total size and its contents in chunks'''
+        match file_:
+            case str() if RE_FILE_URL.match(file_):
+                async with self._client.get(file_) as resp:
+                    if resp.content_length is None:
+                        raise ValueError(F"File {file_} did not report its size. Aborting download.")
+                    elif resp.content_length > maxsize:
+                        raise ValueError(F"File is too large to upload ({resp.content_length} bytes)")
+                    yield resp.content_length, rechunk(resp.content.iter_chunked(chunk_size), chunk_size)
+            case str() if os.path.isfile(file_):
+                sz = os.path.getsize(file_)
+                if sz > maxsize:
+                    raise ValueError(F"File is too large to upload ({sz} bytes)")
+                async with aiofiles.open(file_, 'rb') as f:
+                    yield sz, read_chunks(f, chunk_size)
+            case (bytes() | bytearray() | memoryview() as data, _):
+                view = memoryview(data)
+                yield len(view), slice_chunks(view, chunk_size)
+            case (chunks, _, int(sz)):
+                yield sz, rechunk(chunks, chunk_size)
+            case _: raise AssertionError("impossible branch")
+
+    async def _append_segment(self, media: Media, index: int, chunk: bytes | memoryview, retries: int, encoding: AppendEncoding):
+        '''Send one APPEND segment, retrying on server and connection errors'''
+        instruments = self.instruments
+        for attempt in range(retries+1):
+            start = time.perf_counter()
+            try:
+                await self.append_upload(media, index, chunk, encoding)
+            except (ApiError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == retries or (isinstance(e, ApiError) and e.status < 500 and e.status != 429):
+                    raise
+                if instruments:
+                    instruments.retry('1.1/media/upload', attempt+1, e)
+                await asyncio.sleep(SEGMENT_RETRY_DELAY * 2**attempt)
+            else:
+                if instruments:
+                    instruments.segment_sent(media.id, index, len(chunk), time.perf_counter() - start)
+                return
+
+    async def _append_all(self, media: Media, size: int, chunks: AsyncGenerator[bytes | memoryview, None], concurrency: int, retries: int, encoding: AppendEncoding):
+        '''
+        APPEND every chunk as soon as it is read, with up to `concurrency` segments in flight.
+        Returns once every segment has been acknowledged.
+        '''
+        sent = 0
+        in_flight = asyncio.Semaphore(concurrency)
+        segments: set[asyncio.Task[None]] = set()
+
+        def segment_done(task: asyncio.Task[None]):
+            in_flight.release()
+            if not task.cancelled() and task.exception() is None:
+                segments.discard(task)
+
+        try:
+            async with aclosing(chunks):
+                index = 0
+                async for chunk in chunks:
+                    sent += len(chunk)
+                    if sent > size:
+                        raise ValueError(F"Media source produced more than the {size} bytes declared.")
+                    await in_flight.acquire()
+                    # stop reading if an earlier segment failed for good
+                    for failed in [t for t in segments if t.done()]:
+                        failed.result()
+                    task = asyncio.create_task(self._append_segment(media, index, chunk, retries, encoding))
+                    task.add_done_callback(segment_done)
+                    segments.add(task)
+                    index += 1
+
+            if sent != size:
+                raise ValueError(F"Media source ended after {sent} of {size} bytes.")
+
+            await asyncio.gather(*segments)
+        finally:
+            for task in segments:
+                if task.done() and not task.cancelled():
+                    task.exception() # mark as retrieved
+                task.cancel()
+
+    async def upload(self, file_: MediaSource, chunk_size: int = CHUNK_SIZE, concurrency: int = 1, retries: int = 3,
+            encoding: AppendEncoding = AppendEncoding.BASE64) -> Media:
+        '''
+        Upload media, streaming it to twitter in segments of `chunk_size` bytes.
+        Images small enough are sent in a single request instead.
+        With a `media_cache`, files uploaded before are not uploaded again.
+        Up to `concurrency` segments are sent at once, so about that many
+        chunks are held in memory at a time. Failed segments are retried
+        up to `retries` times. Segments are base64 encoded, which is larger
+        and takes several times the memory of each chunk;
+        `AppendEncoding.MULTIPART` sends them as raw bytes instead.
+        '''
+        if concurrency < 1:
+            raise ValueError("Upload concurrency must be at least 1.")
+
         # get the file:
         if hasattr(file_, 'url'):
             file_ = getattr(file_, 'url')
 
         match file_:
             case str() if m := RE_FILE_URL.match(file_):
-                ext = m['ext']
+                ext = m['extension'].lower()
             case str() if os.path.isfile(file_):
                 ext = file_.split('.')[-1].lower()
-            case (_, ext_):
+            case (bytes() | bytearray() | memoryview(), str(ext_)):
+                ext = ext_
+            case (_, str(ext_), int()):
                 ext = ext_
             case _:
-                raise TypeError(F"{file_} is not a valid bytes object, file path, or URL")
+                raise TypeError(F"{file_} is not a valid bytes object, file path, URL, or async iterator")
             
         maxsize, category = get_upload_info(ext, False)
 
-        match file_:
-            case str() if RE_FILE_URL.match(file_):
-                async with self._client.get(file_) as resp:
-                    if resp.content_length is None:
-                        raise ValueError(F"File {file_} did not report its size. Aborting download.")
-                    elif resp.content_length > maxsize:
-                        raise ValueError(F"File is too large to upload ({resp.content_length} bytes)")
-                    raw = await resp.read()
-            case str() if os.path.isfile(file_):
-                async with aiofiles.open(file_, 'rb') as f:
-                    sz = os.path.getsize(file_)
-                    if sz > maxsize:
-                        raise ValueError(F"File is too large to upload ({sz} bytes)")
-                    raw = await f.read()
-            case (data, _):
-                raw = data
-            case _: raise AssertionError("impossible branch")
+        cache_keys: list[str] = []
+        if self.media_cache is not None:
+            cached, cache_keys = await self.media_cache.find(file_)
+            if cached is not None:
+                media = Media(cached[0])
+                media.expires_at = cached[1]
+                return media
 
-        size = len(raw)
+        async with self._open_media(file_, maxsize, chunk_size) as (size, chunks):
         
-        if size > maxsize:
-            raise ValueError(F"File {file_} is too large to upload ({size/1_000_000} mb > {maxsize/1_000_000} mb).")
+            if size > maxsize:
+                raise ValueError(F"File {file_} is too large to upload ({size/1_000_000} mb > {maxsize/1_000_000} mb).")
 
-        # start upload:
-        media = await self.init_upload(MEDIA_TYPES[ext], size, category)
-        sent = 0
-        index = 0
-        stream = BytesIO(raw)
-
-        # send chunks
-        while sent < size:
-            _append_result = await self.append_upload(
-                media, index,
-                stream.read(4*1024*1024) )
-            # print(_append_result)
-            sent = stream.tell()
-            index += 1
+            # hash sources that could not be hashed up front as they are sent
+            digest = None
+            if self.media_cache is not None and not any(k.startswith(CONTENT_KEY_PREFIX) for k in cache_keys):
+                digest = hashlib.sha256()
+                chunks = hash_chunks(chunks, digest)
+
+            is_simple = ext in IMAGE_EXTENSIONS and ext != 'gif' and size <= SIMPLE_UPLOAD_MAX_SIZE
+            if is_simple:
+                async with aclosing(chunks):
+                    parts = [chunk async for chunk in chunks]
+                media = await self.simple_upload(parts[0] if len(parts) == 1 else b''.join(parts), category)
+            else:
+                # start upload:
+                media = await self.init_upload(MEDIA_TYPES[ext], size, category)
+
+                # send chunks as they are read
+                await self._append_all(media, size, chunks, concurrency, retries, encoding)
         
-        # finalize upload and wait for twitter to confirm
-        status = await self.finalize_upload(media)
-
-        while True:
-            match status:
-                case { 'processing_info': { # pending
-                        'check_after_secs': int(wait_secs)
-                    } }:
-                    await asyncio.sleep(wait_secs)
-                    status = await self.check_upload_status(media)
-                case { 'processing_info': {
-                        'state': 'failed'
-                    } }:
-                    print('Upload failed:')
-                    print(status)
-                    raise TwitterError(status)
-                case _: break # success
-
-        return media
\ No newline at end of file
+        if not is_simple:
+            # finalize upload and wait for twitter to confirm
+            media = await self.processing.wait(media, await self.finalize_upload(media))
+
+        if self.media_cache is not None:
+            if digest is not None:
+                cache_keys.append(content_key(digest))
+            self.media_cache.remember(cache_keys, media.id, media.expires_at)
+
+        return media
+
+    async def upload_many(self, files: Sequence[MediaSource], concurrency: int = 4, return_exceptions: bool = False,
+            chunk_size: int = CHUNK_SIZE, segment_concurrency: int = 1,
+            encoding: AppendEncoding = AppendEncoding.BASE64) -> list[Media | BaseException]:
+        '''
+        Upload several files, up to `concurrency` at a time.
+        Returns the media in the same order as `files`.
+        If any upload fails, raises a `BatchError` once the rest have finished,
+        unless `return_exceptions` is set, in which case the errors are
+        returned in place of their media.
+        '''
+        if concurrency < 1:
+            raise ValueError("Upload concurrency must be at least 1.")
+
+        pool = asyncio.Semaphore(concurrency)
+
+        async def upload_one(file_: MediaSource) -> Media:
+            async with pool:
+                return await self.upload(file_, chunk_size, segment_concurrency, encoding=encoding)
+
+        results: list[Media | BaseException] = await asyncio.gather(
+            *(upload_one(f) for f in files), return_exceptions=True)
+
+        if not return_exceptions and any(isinstance(r, BaseException) for r in results):
+            raise BatchError(results)
+        return results
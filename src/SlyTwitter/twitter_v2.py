@@ -1,9 +1,20 @@
 '''
 Twitter API v2
 '''
+from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import Any, AsyncGenerator, Awaitable, Callable, Hashable, Iterable, Sequence
 from SlyAPI import *
+from SlyAPI.web import JsonMap, Method
+
+from .cache import ResponseCache
+from .common import TwitterError, TwitterWebAPI, T, batched, gather_batches
+from .instrument import Instruments
+from .loader import BatchLoader
+from .pagination import Paginated
+from .ratelimit import RateLimiter
+from .session import TwitterSession
+from .stream import CONNECT_TIMEOUT, HEARTBEAT_TIMEOUT, OverflowPolicy, StreamRule, TweetStream, parse_matching_rules, rules_result
 
 class Scope:
     USERS_READ = 'users.read'
@@ -49,49 +60,558 @@ class UserField(Enum):
     VERIFIED = 'verified'
     WITHHELD = 'withheld'
 
+class Expansion(Enum):
+    '''Related objects to include in a response, by the field that refers to them'''
+    # of users
+    PINNED_TWEET_ID = 'pinned_tweet_id'
+    # of tweets
+    AUTHOR_ID = 'author_id'
+    REFERENCED_TWEETS_ID = 'referenced_tweets.id'
+    REFERENCED_TWEETS_ID_AUTHOR_ID = 'referenced_tweets.id.author_id'
+    IN_REPLY_TO_USER_ID = 'in_reply_to_user_id'
+    ENTITIES_MENTIONS_USERNAME = 'entities.mentions.username'
+
+def parse_time(timestamp: str) -> datetime:
+    '''Parse a v2 ISO 8601 timestamp'''
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+class Includes:
+    '''Objects included in a response by expansions, by ID'''
+    users: dict[int, 'User']
+    tweets: dict[int, 'Tweet']
+
+    def __init__(self, source: JsonMap | None = None):
+        self.users = {}
+        self.tweets = {}
+        match source:
+            case { 'includes': dict(includes) }:
+                self.users = { user.id: user for user in User.from_page(includes.get('users', [])) } # type: ignore
+                # after users, so that included tweets can refer to them
+                for tweet in includes.get('tweets', []):
+                    self.tweets[int(tweet['id'])] = Tweet(tweet, self) # type: ignore
+            case _: pass
+
+# keys of requested fields read by the properties of users and tweets. only these are kept,
+# so that models do not hold on to the rest of their response objects
+USER_FIELD_KEYS = ('description', 'location', 'url', 'verified', 'protected', 'created_at',
+    'profile_image_url', 'pinned_tweet_id', 'public_metrics')
+TWEET_FIELD_KEYS = ('author_id', 'created_at', 'conversation_id', 'in_reply_to_user_id', 'lang',
+    'referenced_tweets', 'public_metrics')
+
+def _kept_fields(source: dict[str, Any], keys: tuple[str, ...]) -> dict[str, Any] | None:
+    return { key: source[key] for key in keys if key in source } or None
+
+def _metric(fields: dict[str, Any] | None, name: str) -> int | None:
+    if fields is None or 'public_metrics' not in fields:
+        return None
+    return fields['public_metrics'].get(name)
+
+def _id_field(fields: dict[str, Any] | None, name: str) -> int | None:
+    if fields is None or name not in fields:
+        return None
+    return int(fields[name])
+
 class User:
+    '''Twitter user, with only the requested fields hydrated, and parsed when read'''
+    __slots__ = ('id', 'at', 'display_name', 'pinned_tweet', '_fields', '_created_at')
     id: int # NOTE: represented as a string in the API
     at: str
     display_name: str
+    # with Expansion.PINNED_TWEET_ID
+    pinned_tweet: 'Tweet|None'
 
-    def __init__(self, source: Any):
+    # requested fields read by properties, as they were in the response
+    _fields: dict[str, Any] | None
+    _created_at: datetime | None
+
+    def __init__(self, source: Any, includes: Includes | None = None):
+        self.pinned_tweet = self._fields = self._created_at = None
         match source:
+            case int(): # from id
+                self.id = source
+            case str(): # from username
+                self.at = source.removeprefix('@')
             # v2 with default fields
-            case { 'id': str(id_), 'username': str(at), 'name': str(display_name) }:
+            case { 'id': str(id_), 'username': str(at), 'name': str(display_name), **fields }:
                 self.id = int(id_)
                 self.at = at
                 self.display_name = display_name
+                if fields:
+                    self._fields = _kept_fields(fields, USER_FIELD_KEYS)
+                    if includes is not None and (pinned := self.pinned_tweet_id) is not None:
+                        self.pinned_tweet = includes.tweets.get(pinned)
             case _:
                 raise ValueError(F'Unknown source for User: {source}')
 
+    @classmethod
+    def from_page(cls, items: list[Any], includes: Includes | None = None) -> list['User']:
+        '''
+        Users of a response, built by reading their keys directly instead of
+        matching each one.
+        '''
+        users: list[User] = []
+        new = cls.__new__
+        try:
+            for item in items:
+                user = new(cls)
+                user.id = int(item['id'])
+                user.at = item['username']
+                user.display_name = item['name']
+                user.pinned_tweet = user._created_at = None
+                user._fields = _kept_fields(item, USER_FIELD_KEYS) if len(item) > 3 else None
+                if includes is not None and (pinned := item.get('pinned_tweet_id')) is not None:
+                    user.pinned_tweet = includes.tweets.get(int(pinned))
+                users.append(user)
+        except (KeyError, TypeError, ValueError):
+            # not all the same shape: match each, for their errors
+            return [cls(item, includes) for item in items]
+        return users
+
+    # hydratable fields, see UserField
+
+    @property
+    def description(self) -> str|None:
+        return self._fields and self._fields.get('description')
+
+    @property
+    def location(self) -> str|None:
+        return self._fields and self._fields.get('location')
+
+    @property
+    def website(self) -> str|None:
+        return self._fields and self._fields.get('url')
+
+    @property
+    def is_verified(self) -> bool|None:
+        return self._fields and self._fields.get('verified')
+
+    @property
+    def is_private(self) -> bool|None:
+        return self._fields and self._fields.get('protected')
+
+    @property
+    def created_at(self) -> datetime|None:
+        if self._created_at is None and self._fields and 'created_at' in self._fields:
+            self._created_at = parse_time(self._fields['created_at'])
+        return self._created_at
+
+    @property
+    def profile_image(self) -> str|None:
+        return self._fields and self._fields.get('profile_image_url')
+
+    @property
+    def pinned_tweet_id(self) -> int|None:
+        return _id_field(self._fields, 'pinned_tweet_id')
+
+    @property
+    def followers_count(self) -> int|None:
+        return _metric(self._fields, 'followers_count')
+
+    @property
+    def following_count(self) -> int|None:
+        return _metric(self._fields, 'following_count')
+
+    @property
+    def tweet_count(self) -> int|None:
+        return _metric(self._fields, 'tweet_count')
+
+    @property
+    def listed_count(self) -> int|None:
+        return _metric(self._fields, 'listed_count')
+
+    def __eq__(self, other: object) -> bool:
+        '''Users are equal by ID, or by username if neither has an ID.'''
+        if not isinstance(other, User):
+            return NotImplemented
+        match hasattr(self, 'id'), hasattr(other, 'id'):
+            case True, True:
+                return self.id == other.id
+            case False, False:
+                return self.at.lower() == other.at.lower()
+            case _:
+                return False
+
+    def __hash__(self) -> int:
+        if hasattr(self, 'id'):
+            return hash(self.id)
+        return hash(self.at.lower())
+
     def __str__(self):
         return F'@{self.at}'
 
+class Tweet:
+    '''Tweet, with only the requested fields hydrated, and parsed when read'''
+    __slots__ = ('id', 'body', 'author', 'in_reply_to_user', 'referenced_tweets', '_fields', '_created_at')
+    id: int # NOTE: represented as a string in the API
+    body: str
+    # with expansions
+    author: User|None
+    in_reply_to_user: User|None
+    referenced_tweets: list[tuple[str, 'Tweet']]|None
+
+    # requested fields read by properties, as they were in the response
+    _fields: dict[str, Any] | None
+    _created_at: datetime | None
 
-class TwitterV2(WebAPI):
+    def __init__(self, source: Any, includes: Includes | None = None):
+        self.author = self.in_reply_to_user = self.referenced_tweets = None
+        self._fields = self._created_at = None
+        match source:
+            case int(): # from id
+                self.id = source
+            # v2 with default fields
+            case { 'id': str(id_), 'text': str(text), **fields }:
+                self.id = int(id_)
+                self.body = text
+                if fields:
+                    self._fields = _kept_fields(fields, TWEET_FIELD_KEYS)
+                    if includes is not None:
+                        self._resolve(includes)
+            case _:
+                raise ValueError(F'Unknown source for Tweet: {source}')
+
+    @classmethod
+    def from_page(cls, items: list[Any], includes: Includes | None = None) -> list['Tweet']:
+        '''
+        Tweets of a response, built by reading their keys directly instead of
+        matching each one.
+        '''
+        tweets: list[Tweet] = []
+        new = cls.__new__
+        try:
+            for item in items:
+                tweet = new(cls)
+                tweet.id = int(item['id'])
+                tweet.body = item['text']
+                tweet.author = tweet.in_reply_to_user = tweet.referenced_tweets = None
+                tweet._created_at = None
+                tweet._fields = _kept_fields(item, TWEET_FIELD_KEYS) if len(item) > 2 else None
+                if tweet._fields is not None and includes is not None:
+                    tweet._resolve(includes)
+                tweets.append(tweet)
+        except (KeyError, TypeError, ValueError):
+            return [cls(item, includes) for item in items]
+        return tweets
+
+    def _resolve(self, includes: Includes):
+        if (author_id := self.author_id) is not None:
+            self.author = includes.users.get(author_id)
+        if (reply_to := self.in_reply_to_user_id) is not None:
+            self.in_reply_to_user = includes.users.get(reply_to)
+        if (refs := self.referenced_tweet_ids) is not None:
+            self.referenced_tweets = [(kind, includes.tweets[id_])
+                for kind, id_ in refs if id_ in includes.tweets]
+
+    # hydratable fields, see TweetField
+
+    @property
+    def author_id(self) -> int|None:
+        return _id_field(self._fields, 'author_id')
+
+    @property
+    def created_at(self) -> datetime|None:
+        if self._created_at is None and self._fields and 'created_at' in self._fields:
+            self._created_at = parse_time(self._fields['created_at'])
+        return self._created_at
+
+    @property
+    def conversation_id(self) -> int|None:
+        return _id_field(self._fields, 'conversation_id')
+
+    @property
+    def in_reply_to_user_id(self) -> int|None:
+        return _id_field(self._fields, 'in_reply_to_user_id')
+
+    @property
+    def lang(self) -> str|None:
+        return self._fields and self._fields.get('lang')
+
+    @property
+    def referenced_tweet_ids(self) -> list[tuple[str, int]]|None:
+        '''(type, id) of each referenced tweet'''
+        if not self._fields or 'referenced_tweets' not in self._fields:
+            return None
+        return [(ref['type'], int(ref['id'])) for ref in self._fields['referenced_tweets']]
+
+    @property
+    def like_count(self) -> int|None:
+        return _metric(self._fields, 'like_count')
+
+    @property
+    def reply_count(self) -> int|None:
+        return _metric(self._fields, 'reply_count')
+
+    @property
+    def retweet_count(self) -> int|None:
+        return _metric(self._fields, 'retweet_count')
+
+    @property
+    def quote_count(self) -> int|None:
+        return _metric(self._fields, 'quote_count')
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Tweet):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def link(self) -> str:
+        return F"https://twitter.com/i/status/{self.id}"
+
+FieldsParams = dict[str, list[Enum]]
+
+def fields_params(user_fields: Iterable[UserField] | None, tweet_fields: Iterable[TweetField] | None,
+        expansions: Iterable[Expansion] | None) -> FieldsParams:
+    '''Query parameters selecting fields and expansions'''
+    params: FieldsParams = {}
+    if user_fields: params['user.fields'] = sorted(user_fields, key=lambda f: f.value)
+    if tweet_fields: params['tweet.fields'] = sorted(tweet_fields, key=lambda f: f.value)
+    if expansions: params['expansions'] = sorted(expansions, key=lambda e: e.value)
+    return params
+
+def fields_key(params: FieldsParams) -> tuple[tuple[str, tuple[str, ...]], ...]:
+    '''Hashable form of fields parameters, for caching'''
+    return tuple((k, tuple(e.value for e in v)) for k, v in sorted(params.items()))
+
+# most users in one users lookup request
+USERS_PER_LOOKUP = 100
+# most users in one page of followers or following
+MAX_FOLLOWS_PAGE_SIZE = 1000
+# most tweets in one page of a user's tweets or mentions
+MAX_TWEETS_PAGE_SIZE = 100
+
+def get_data(result: JsonMap) -> Any:
+    '''The data of a v2 response, which is missing if there were only errors'''
+    if 'data' not in result:
+        raise TwitterError(result.get('errors', result))
+    return result['data']
+
+class TwitterV2(TwitterWebAPI):
     base_url = 'https://api.twitter.com/2/'
+    response_cache: ResponseCache | None
+    batch_window: float | None
+    max_batch_size: int
+    _user_loaders: dict[tuple[Any, ...], BatchLoader[str, User]]
     
-    def __init__(self, auth: OAuth2):
-        super().__init__(auth)
+    def __init__(self, auth: OAuth2, response_cache: ResponseCache | None = None, rate_limits: RateLimiter | None = None,
+            batch_window: float | None = None, max_batch_size: int = USERS_PER_LOOKUP, session: TwitterSession | None = None,
+            instruments: Instruments | None = None):
+        '''
+        With a `response_cache`, users are reused rather than fetched every time.
+        Rate limits are tracked in `rate_limits`.
+        With a `batch_window` in seconds, `user` lookups made within it of
+        each other are merged into one request of up to `max_batch_size`.
+        A window of 0 merges lookups made in the same event loop iteration.
+        Requests go through `session` if given, and are reported to `instruments`.
+        '''
+        super().__init__(auth, rate_limits, session, instruments)
+        self.response_cache = response_cache
+        self.batch_window = batch_window
+        self.max_batch_size = min(max_batch_size, USERS_PER_LOOKUP)
+        self._user_loaders = {}
+
+    async def _cached(self, endpoint: str, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        if self.response_cache is None:
+            return await fetch()
+        return await self.response_cache.get(endpoint, key, fetch)
 
     @requires_scopes('users.read')
-    async def me(self) -> User:
+    async def me(self, user_fields: Iterable[UserField] | None = None, tweet_fields: Iterable[TweetField] | None = None,
+            expansions: Iterable[Expansion] | None = None) -> User:
         '''The currently authenticated user.'''
-        return User((await self.get_json('users/me'))['data'])
+        params = fields_params(user_fields, tweet_fields, expansions)
+        async def fetch():
+            result = await self.get_json('users/me', params)
+            return User(get_data(result), Includes(result))
+        return await self._cached('users/me', fields_key(params), fetch)
 
     @requires_scopes('users.read')
-    async def user(self, at: str|None=None) -> User:
-        '''Get a user by their @username.'''
+    async def user(self, at: str|None=None, user_fields: Iterable[UserField] | None = None,
+            tweet_fields: Iterable[TweetField] | None = None, expansions: Iterable[Expansion] | None = None) -> User:
+        '''Get a user by their @username, with any extra fields and expansions.'''
         if at is None:
-            return await self.me()
-        return User((await self.get_json(F'users/by/username/{at}'))['data'])
+            return await self.me(user_fields, tweet_fields, expansions)
+        at = at.removeprefix('@')
+        params = fields_params(user_fields, tweet_fields, expansions)
+        async def fetch():
+            if self.batch_window is not None:
+                return await self._user_loader(params).load(at.lower())
+            result = await self.get_json(F'users/by/username/{at}', params)
+            return User(get_data(result), Includes(result))
+        return await self._cached('users/by/username', (at.lower(), fields_key(params)), fetch)
+
+    def _user_loader(self, params: FieldsParams) -> BatchLoader[str, User]:
+        '''Batch loader for users by username, one for each selection of fields'''
+        key = fields_key(params)
+        if (loader := self._user_loaders.get(key)) is None:
+            async def load(ats: list[str]) -> dict[str, User]:
+                users = await self._users_batch(('usernames', ats), params)
+                return {user.at.lower(): user for user in users}
+            assert self.batch_window is not None
+            loader = self._user_loaders[key] = BatchLoader(load, self.max_batch_size, self.batch_window)
+        return loader
+
+    async def _users_batch(self, batch: tuple[str, Sequence[int | str]], params: FieldsParams) -> list[User]:
+        key, values = batch
+        result = await self.get_json('users' if key == 'ids' else 'users/by', params | { key: values })
+        includes = Includes(result)
+        # users that do not exist are only listed in 'errors'
+        return User.from_page(result.get('data', []), includes) # type: ignore
+
+    @requires_scopes('users.read')
+    @AsyncLazy.wrap
+    async def users(self, *users: User | int | str, concurrency: int = 4, user_fields: Iterable[UserField] | None = None,
+            tweet_fields: Iterable[TweetField] | None = None, expansions: Iterable[Expansion] | None = None
+            ) -> AsyncGenerator[User, None]:
+        '''
+        Get users by ID, @username or partial `User`, 100 to a request, up to
+        `concurrency` requests at once. Users are yielded as each batch
+        arrives, not in order, and users that do not exist are left out.
+        '''
+        params = fields_params(user_fields, tweet_fields, expansions)
+        ids: list[int] = []
+        ats: list[str] = []
+        for user in users:
+            if not isinstance(user, User):
+                user = User(user)
+            if hasattr(user, 'id'):
+                ids.append(user.id)
+            else:
+                ats.append(user.at)
+        batches = [('ids', b) for b in batched(ids, USERS_PER_LOOKUP)] + \
+                  [('usernames', b) for b in batched(ats, USERS_PER_LOOKUP)]
+        async for user in gather_batches(batches, lambda b: self._users_batch(b, params), concurrency):
+            yield user
+
+    @requires_scopes('tweet.read', 'users.read')
+    async def tweet(self, tweet: Tweet | int, tweet_fields: Iterable[TweetField] | None = None,
+            user_fields: Iterable[UserField] | None = None, expansions: Iterable[Expansion] | None = None) -> Tweet:
+        '''Get a tweet by ID, with any extra fields and expansions.'''
+        tweet_id = tweet.id if isinstance(tweet, Tweet) else tweet
+        result = await self.get_json(F'tweets/{tweet_id}', fields_params(user_fields, tweet_fields, expansions))
+        return Tweet(get_data(result), Includes(result))
+
+    def paginated_v2(self, path: str, params: dict[str, Any], parse: Callable[[Any, Includes], T],
+            page_size: int | None, resume_token: str | None, limit: int | None = None, prefetch: bool = True,
+            parse_page: Callable[[list[Any], Includes], list[T]] | None = None) -> Paginated[T]:
+        '''
+        Iterate over a v2 paginated endpoint, with `page_size` items to a request.
+        Items are parsed with the includes of their page, all at once by
+        `parse_page` if given, such as `User.from_page`.
+        See `Paginated` for `resume_token` and `prefetch`.
+        '''
+        async def fetch_page(token: str | None) -> tuple[list[T], str | None]:
+            page_params = params | { 'max_results': page_size, 'pagination_token': token }
+            page = await self.get_json(path, page_params)
+            includes = Includes(page)
+            next_token = page.get('meta', {}).get('next_token') # type: ignore
+            if parse_page is not None:
+                return parse_page(page.get('data', []), includes), next_token # type: ignore
+            return [parse(item, includes) for item in page.get('data', [])], next_token # type: ignore
+        return Paginated(fetch_page, resume_token, limit, prefetch)
 
     @requires_scopes('users.read', 'tweet.read', 'follows.read')
-    async def all_followers_of(self, user: User) -> AsyncTrans[User]:
-        """ Get the list of users following a user."""
-        return self.paginated(F'users/{user.id}/followers', {}, None).map(User)
+    async def all_followers_of(self, user: User, page_size: int = MAX_FOLLOWS_PAGE_SIZE,
+            resume_token: str | None = None, prefetch: bool = True, user_fields: Iterable[UserField] | None = None,
+            tweet_fields: Iterable[TweetField] | None = None, expansions: Iterable[Expansion] | None = None
+            ) -> Paginated[User]:
+        """ Get the list of users following a user.
+            Up to `page_size` users are fetched with each request, and the
+            next page is fetched while the current one is read if `prefetch`.
+            Pass `resume_token` from an interrupted iteration to continue it.
+        """
+        return self.paginated_v2(F'users/{user.id}/followers', fields_params(user_fields, tweet_fields, expansions),
+            User, min(page_size, MAX_FOLLOWS_PAGE_SIZE), resume_token, prefetch=prefetch, parse_page=User.from_page)
 
     @requires_scopes('users.read', 'tweet.read', 'follows.read')
-    async def all_followed_by(self, user: User) -> AsyncTrans[User]:
-        """ Get the list of followed users by a user."""
-        return self.paginated(F'users/{user.id}/following', {}, None).map(User)
\ No newline at end of file
+    async def all_followed_by(self, user: User, page_size: int = MAX_FOLLOWS_PAGE_SIZE,
+            resume_token: str | None = None, prefetch: bool = True, user_fields: Iterable[UserField] | None = None,
+            tweet_fields: Iterable[TweetField] | None = None, expansions: Iterable[Expansion] | None = None
+            ) -> Paginated[User]:
+        """ Get the list of followed users by a user.
+            Up to `page_size` users are fetched with each request, and the
+            next page is fetched while the current one is read if `prefetch`.
+            Pass `resume_token` from an interrupted iteration to continue it.
+        """
+        return self.paginated_v2(F'users/{user.id}/following', fields_params(user_fields, tweet_fields, expansions),
+            User, min(page_size, MAX_FOLLOWS_PAGE_SIZE), resume_token, prefetch=prefetch, parse_page=User.from_page)
+
+    async def _timeline(self, path: str, since_id: int | None, until_id: int | None, max_results: int,
+            params: FieldsParams) -> tuple[list[Tweet], str | None]:
+        '''A page of a timeline, and its `next_token` if there are older tweets.'''
+        query: dict[str, Any] = params | { 'max_results': max(5, min(max_results, MAX_TWEETS_PAGE_SIZE)) }
+        if since_id is not None: query['since_id'] = since_id
+        if until_id is not None: query['until_id'] = until_id
+        result = await self.get_json(path, query)
+        includes = Includes(result)
+        return Tweet.from_page(result.get('data', []), includes), result.get('meta', {}).get('next_token') # type: ignore
+
+    @requires_scopes('tweet.read', 'users.read')
+    async def user_tweets(self, user: User, since_id: int | None = None, until_id: int | None = None,
+            max_results: int = MAX_TWEETS_PAGE_SIZE, tweet_fields: Iterable[TweetField] | None = None,
+            user_fields: Iterable[UserField] | None = None, expansions: Iterable[Expansion] | None = None) -> list[Tweet]:
+        """ Get a page of 5 to 100 of a user's tweets, newest first, newer
+            than `since_id` and older than `until_id`.
+            See `SlyTwitter.timelines` for fetching only new tweets.
+        """
+        tweets, _ = await self._timeline(F'users/{user.id}/tweets', since_id, until_id, max_results,
+            fields_params(user_fields, tweet_fields, expansions))
+        return tweets
+
+    @requires_scopes('tweet.read', 'users.read')
+    async def mentions(self, user: User, since_id: int | None = None, until_id: int | None = None,
+            max_results: int = MAX_TWEETS_PAGE_SIZE, tweet_fields: Iterable[TweetField] | None = None,
+            user_fields: Iterable[UserField] | None = None, expansions: Iterable[Expansion] | None = None) -> list[Tweet]:
+        """ Get a page of 5 to 100 tweets mentioning a user, newest first,
+            newer than `since_id` and older than `until_id`.
+        """
+        tweets, _ = await self._timeline(F'users/{user.id}/mentions', since_id, until_id, max_results,
+            fields_params(user_fields, tweet_fields, expansions))
+        return tweets
+
+    async def stream_rules(self) -> list[StreamRule]:
+        '''The rules of the filtered stream.'''
+        return rules_result(await self.get_json('tweets/search/stream/rules'))
+
+    async def add_stream_rules(self, *rules: StreamRule | str, dry_run: bool = False) -> list[StreamRule]:
+        '''
+        Add rules to the filtered stream, returning them with their IDs.
+        With `dry_run`, they are only checked. Raises `TwitterError` if any are invalid.
+        '''
+        rules_ = [rule if isinstance(rule, StreamRule) else StreamRule(rule) for rule in rules]
+        result = await self.post_json('tweets/search/stream/rules', { 'dry_run': 'true' } if dry_run else None,
+            json={ 'add': [rule.to_json() for rule in rules_] })
+        return rules_result(result)
+
+    async def delete_stream_rules(self, *rules: StreamRule | int):
+        '''Remove rules from the filtered stream, by ID.'''
+        ids = [str(rule.id if isinstance(rule, StreamRule) else rule) for rule in rules]
+        rules_result(await self.post_json('tweets/search/stream/rules', json={ 'delete': { 'ids': ids } }))
+
+    def stream(self, sample: bool = False, tweet_fields: Iterable[TweetField] | None = None,
+            user_fields: Iterable[UserField] | None = None, expansions: Iterable[Expansion] | None = None,
+            buffer_size: int = 1000, overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+            heartbeat_timeout: float = HEARTBEAT_TIMEOUT, backfill_minutes: int | None = None,
+            max_reconnects: int | None = None, connect_timeout: float = CONNECT_TIMEOUT) -> TweetStream:
+        '''
+        Tweets matching the filtered stream rules as they are posted, or a
+        sample of all tweets if `sample`, with any extra fields and expansions.
+        Up to `buffer_size` tweets are kept until read, and when the buffer is
+        full, `overflow` decides whether to wait or which to drop.
+        Dropped connections are reconnected, asking for `backfill_minutes` of
+        missed tweets when given. Connecting gives up after `connect_timeout`
+        seconds, and a connection that sends nothing, not even its response
+        headers, for `heartbeat_timeout` is dropped. See `TweetStream`.
+        '''
+        path = 'tweets/sample/stream' if sample else 'tweets/search/stream'
+        params = fields_params(user_fields, tweet_fields, expansions)
+        def connect(reconnecting: bool):
+            query: dict[str, Any] = dict(params)
+            if reconnecting and backfill_minutes:
+                query['backfill_minutes'] = backfill_minutes
+            return self._open_stream(self._create_request(Method.GET, path, query), connect_timeout, heartbeat_timeout)
+        def parse(message: Any) -> tuple[Tweet, list[StreamRule]]:
+            return Tweet(message['data'], Includes(message)), parse_matching_rules(message)
+        return TweetStream(connect, parse, buffer_size, overflow, heartbeat_timeout, max_reconnects)
@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import AsyncGenerator, Awaitable, Callable
+
+import pytest
+from aiohttp import web
+
+from SlyTwitter import OAuth1, OAuth2
+from SlyAPI.oauth1 import OAuth1App, OAuth1User
+from SlyAPI.oauth2 import OAuth2App, OAuth2User
+
+# credentials for tests against local servers, which do not check them
+
+@pytest.fixture
+def v1_auth() -> OAuth1:
+    return OAuth1(
+        OAuth1App('key', 'secret', 'https://request', 'https://authorize', 'https://access'),
+        OAuth1User('key', 'secret'))
+
+@pytest.fixture
+def v2_auth() -> OAuth2:
+    return OAuth2(
+        OAuth2App('id', 'secret', 'https://authorize', 'https://token'),
+        OAuth2User('token', 'refresh', datetime.max))
+
+@pytest.fixture
+async def serve() -> AsyncGenerator[Callable[[web.Application], Awaitable[str]], None]:
+    '''Start serving an app locally, returning its base URL'''
+    runners: list[web.AppRunner] = []
+
+    async def start(app: web.Application) -> str:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        runners.append(runner)
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        return F'http://127.0.0.1:{runner.addresses[0][1]}'
+
+    yield start
+
+    for runner in runners:
+        await runner.cleanup()
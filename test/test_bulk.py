@@ -0,0 +1,59 @@
+import asyncio
+import itertools
+
+from aiohttp import web
+
+from SlyTwitter import Twitter
+from SlyTwitter.common import run_bulk
+
+async def test_run_bulk_orders_and_keeps_going():
+    async def action(n: int):
+        await asyncio.sleep(0.001 * (5 - n))
+        if n == 2:
+            raise ValueError(n)
+        return n * 10
+
+    results = [r async for r in run_bulk(range(5), action, concurrency=3)]
+
+    assert [r.index for r in results] == [0, 1, 2, 3, 4]
+    assert [r.value for r in results if r.ok] == [0, 10, 30, 40]
+    assert isinstance(results[2].error, ValueError)
+
+    unordered = [r async for r in run_bulk(range(5), action, concurrency=5, ordered=False)]
+    assert sorted(r.index for r in unordered) == [0, 1, 2, 3, 4]
+    assert unordered[0].index == 4
+
+async def test_delete_many_and_thread(v1_auth, serve):
+    ids = itertools.count(100)
+    replies: list[str | None] = []
+
+    async def destroy(request: web.Request):
+        tweet_id = int(request.match_info['id'])
+        if tweet_id == 3:
+            return web.json_response({'errors': [{'code': 144}]}, status=404)
+        return web.json_response({'id': tweet_id, 'text': '', 'user': {'screen_name': 'me'}})
+
+    async def update(request: web.Request):
+        form = await request.post()
+        replies.append(form.get('in_reply_to_status_id')) # type: ignore
+        if form['status'] == 'fail':
+            return web.json_response({'errors': [{'code': 187}]}, status=403)
+        return web.json_response({'id': next(ids), 'text': form['status'], 'user': {'screen_name': 'me'}})
+
+    app = web.Application()
+    app.router.add_post('/1.1/statuses/destroy/{id}.json', destroy)
+    app.router.add_post('/1.1/statuses/update.json', update)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    deleted = await twitter.delete_many([1, 2, 3, 4], concurrency=2)
+    assert [r.ok for r in deleted] == [True, True, False, True]
+
+    thread = await twitter.post_thread(['one', 'two', 'three'], in_reply_to=50)
+    assert [r.unwrap().body for r in thread] == ['one', 'two', 'three']
+    assert replies == ['50', '100', '101']
+
+    replies.clear()
+    broken = await twitter.post_thread(['first', 'fail', 'never'])
+    assert [r.ok for r in broken] == [True, False, False]
+    assert len(replies) == 2
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from SlyTwitter.cache import ResponseCache
+from SlyTwitter.common import TwitterError
+from SlyAPI.web import ApiError
+
+async def test_cache_hits_and_ttls():
+    cache = ResponseCache(ttls={'short': 0.05})
+    calls: list[str] = []
+
+    async def fetch(name: str):
+        calls.append(name)
+        return name.upper()
+
+    assert await cache.get('long', 'a', lambda: fetch('a')) == 'A'
+    assert await cache.get('long', 'a', lambda: fetch('a')) == 'A'
+    assert await cache.get('short', 'b', lambda: fetch('b')) == 'B'
+    await asyncio.sleep(0.06)
+    assert await cache.get('short', 'b', lambda: fetch('b')) == 'B'
+
+    assert calls == ['a', 'b', 'b']
+    assert (cache.hits, cache.misses) == (1, 3)
+
+async def test_cache_coalesces_concurrent_lookups():
+    cache = ResponseCache()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(cache.get('users/me', None, fetch) for _ in range(10)))
+
+    assert results == [1]*10
+    assert calls == 1
+    assert cache.coalesced == 9
+
+async def test_cache_first_caller_cancelled():
+    cache = ResponseCache()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return 'user'
+
+    first = asyncio.ensure_future(cache.get('users/me', None, fetch))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(cache.get('users/me', None, fetch))
+    await asyncio.sleep(0.005)
+    first.cancel()
+
+    assert await second == 'user'
+    assert first.cancelled()
+    assert await cache.get('users/me', None, fetch) == 'user' and cache.hits == 1
+
+async def test_cache_negative():
+    cache = ResponseCache()
+    calls = 0
+
+    async def missing():
+        nonlocal calls
+        calls += 1
+        raise TwitterError([{'title': 'Not Found Error'}])
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        raise ApiError(503, 'Service Unavailable', None)
+
+    async def suspended():
+        nonlocal calls
+        calls += 1
+        raise TwitterError([{'title': 'Forbidden', 'detail': 'User has been suspended: [someone].'}])
+
+    for _ in range(2):
+        with pytest.raises(TwitterError):
+            await cache.get('users/by/username', 'nobody', missing)
+    assert calls == 1
+
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            await cache.get('users/by/username', 'someone', failing)
+    assert calls == 3
+
+    for _ in range(2):
+        with pytest.raises(TwitterError):
+            await cache.get('users/by/username', 'suspended', suspended)
+    assert calls == 5
+
+async def test_cache_lru():
+    cache = ResponseCache(max_entries=2)
+
+    async def fetch():
+        return 0
+
+    for key in 'abc':
+        await cache.get('e', key, fetch)
+
+    assert len(cache) == 2
+    cache.invalidate('e', 'b')
+    assert len(cache) == 1
@@ -0,0 +1,46 @@
+import pytest
+
+from SlyTwitter.columnar import ColumnarWriter, load_columns, write_columns
+from SlyTwitter.pagination import Paginated
+from SlyTwitter.twitter_v2 import User
+from SlyAPI.web import ApiError
+
+def user_pages(n_pages: int, per_page: int, fail_at: int | None = None):
+    async def fetch(token: str | None):
+        index = int(token or 0)
+        if index == fail_at:
+            raise ApiError(429, 'Too Many Requests', None)
+        users = [User({'id': str(i), 'username': F'user{i}', 'name': F'Ünïcode {i}'})
+            for i in range(index*per_page, (index+1)*per_page)]
+        return users, str(index+1) if index+1 < n_pages else None
+    return fetch
+
+async def test_write_columns(tmp_path):
+    path = str(tmp_path / 'followers')
+
+    rows = await write_columns(Paginated(user_pages(3, 4)), path)
+
+    columns = load_columns(path)
+    assert rows == len(columns) == 12 and columns.done
+    assert list(columns.ids) == list(range(12))
+    assert columns.column('at')[5] == 'user5'
+    assert list(columns.column('display_name'))[-1] == 'Ünïcode 11'
+    assert columns.id_set() - {0, 1} == set(range(2, 12))
+
+async def test_write_columns_resumes(tmp_path):
+    path = str(tmp_path / 'followers')
+
+    with pytest.raises(ApiError):
+        await write_columns(Paginated(user_pages(4, 3, fail_at=2)), path)
+    partial = load_columns(path)
+    assert len(partial) == 6 and partial.resume_token == '2' and not partial.done
+
+    # a page written but not committed before the interruption is discarded
+    with ColumnarWriter(path, append=True) as writer:
+        writer.write([User({'id': '99', 'username': 'x', 'name': 'X'})])
+
+    await write_columns(Paginated(user_pages(4, 3), partial.resume_token), path, append=True)
+
+    columns = load_columns(path)
+    assert list(columns.ids) == list(range(12))
+    assert list(columns.column('at')) == [F'user{i}' for i in range(12)]
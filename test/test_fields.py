@@ -0,0 +1,49 @@
+from aiohttp import web
+
+from SlyTwitter import TwitterV2
+from SlyTwitter.twitter_v2 import Expansion, Includes, Tweet, TweetField, User, UserField
+
+def test_user_only_parses_present_fields():
+    user = User({'id': '1', 'username': 'a', 'name': 'A',
+        'public_metrics': {'followers_count': 5, 'following_count': 2}})
+
+    assert user.followers_count == 5 and user.following_count == 2
+    assert user.description is None and user.created_at is None
+
+def test_tweet_resolves_includes():
+    result = {
+        'data': {'id': '10', 'text': 'hi', 'author_id': '1', 'referenced_tweets': [{'type': 'quoted', 'id': '9'}]},
+        'includes': {
+            'users': [{'id': '1', 'username': 'a', 'name': 'A'}],
+            'tweets': [{'id': '9', 'text': 'quoted', 'author_id': '1'}]}}
+
+    tweet = Tweet(result['data'], Includes(result))
+
+    assert tweet.author is not None and tweet.author.at == 'a'
+    assert tweet.referenced_tweets is not None
+    kind, quoted = tweet.referenced_tweets[0]
+    assert kind == 'quoted' and quoted.body == 'quoted'
+    assert quoted.author is tweet.author
+
+async def test_user_fields_and_expansions(v2_auth, serve):
+    queries: list[dict[str, str]] = []
+
+    async def handle(request: web.Request):
+        queries.append(dict(request.query))
+        return web.json_response({
+            'data': {'id': '1', 'username': 'a', 'name': 'A',
+                'created_at': '2020-01-02T03:04:05.000Z', 'pinned_tweet_id': '7'},
+            'includes': {'tweets': [{'id': '7', 'text': 'pinned'}]}})
+
+    app = web.Application()
+    app.router.add_get('/2/users/by/username/{at}', handle)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = await serve(app) + '/2/'
+
+    user = await twitter.user('a',
+        user_fields=[UserField.PINNED_TWEET_ID, UserField.CREATED_AT],
+        tweet_fields=[TweetField.TEXT], expansions=[Expansion.PINNED_TWEET_ID])
+
+    assert queries == [{'user.fields': 'created_at,pinned_tweet_id', 'tweet.fields': 'text', 'expansions': 'pinned_tweet_id'}]
+    assert user.created_at is not None and user.created_at.year == 2020
+    assert user.pinned_tweet is not None and user.pinned_tweet.body == 'pinned'
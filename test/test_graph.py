@@ -0,0 +1,65 @@
+from aiohttp import web
+
+from SlyTwitter import Twitter
+from SlyTwitter.graph import FollowSnapshot, take_snapshot
+from SlyTwitter.twitter import User
+
+async def test_take_snapshot_v1(v1_auth, serve):
+    requests: list[tuple[str, str]] = []
+    ids = {'followers': list(range(0, 12)), 'friends': list(range(6, 20))}
+
+    async def handle(request: web.Request):
+        kind = request.match_info['kind']
+        cursor = int(request.query['cursor'])
+        requests.append((kind, request.query['cursor']))
+        count = int(request.query['count'])
+        start = 0 if cursor == -1 else cursor
+        page = ids[kind][start:start+count]
+        next_cursor = start+count if start+count < len(ids[kind]) else 0
+        return web.json_response({'ids': page, 'next_cursor_str': str(next_cursor)})
+
+    app = web.Application()
+    app.router.add_get('/1.1/{kind}/ids.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    snapshot = await take_snapshot(twitter, 99)
+    assert list(snapshot.followers) == list(range(12)) and list(snapshot.following) == list(range(6, 20))
+
+    snapshot = FollowSnapshot(User(99), snapshot.followers, snapshot.following)
+    assert list(snapshot.mutuals()) == list(range(6, 12))
+    assert list(snapshot.not_following_back()) == list(range(12, 20))
+    assert list(snapshot.not_followed_back()) == list(range(6))
+
+    requests.clear()
+    following = await twitter.check_follow(User(99), User(3), snapshot)
+    assert not following.a_follows_b and following.b_follows_a
+    reverse = await twitter.check_follow(User(8), User(99), snapshot)
+    assert reverse.mutual and reverse.a.id == 8
+    assert requests == []
+
+async def test_follower_ids_pages(v1_auth, serve):
+    async def handle(request: web.Request):
+        assert request.query['screen_name'] == 'someone'
+        if request.query['cursor'] == '-1':
+            return web.json_response({'ids': [3, 1], 'next_cursor_str': '123'})
+        return web.json_response({'ids': [2], 'next_cursor_str': '0'})
+
+    app = web.Application()
+    app.router.add_get('/1.1/followers/ids.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    assert await twitter.follower_ids('@someone') == [3, 1, 2]
+
+def test_snapshot_diff():
+    old = FollowSnapshot(User(1), [2, 3, 4], [5, 6])
+    new = FollowSnapshot(User(1), [3, 4, 7], [6, 8])
+
+    diff = old.diff(new)
+
+    assert list(diff.new_followers) == [7] and list(diff.lost_followers) == [2]
+    assert list(diff.followed) == [8] and list(diff.unfollowed) == [5]
+    assert not old.diff(old)
+    assert [(f.b.id, f.a_follows_b, f.b_follows_a) for f in new.relationships()] == \
+        [(3, False, True), (4, False, True), (6, True, False), (7, False, True), (8, True, False)]
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+from SlyAPI.web import ApiError
+
+from SlyTwitter import Instrument, Instruments, Metrics, Twitter, TwitterV2
+from SlyTwitter.instrument import Histogram, RequestEvent
+from SlyTwitter.mock import MockTwitter
+from SlyTwitter.twitter_upload import Media
+
+def test_histogram():
+    histogram = Histogram((1, 2, 5))
+    for value in [0.5, 1.5, 1.5, 3, 10]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5 and histogram.min == 0.5 and histogram.max == 10
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1.0) == 10
+    assert Histogram().quantile(0.5) is None
+
+async def test_metrics_of_requests_and_uploads(v1_auth, v2_auth):
+    events: list[RequestEvent] = []
+    class Recorder(Instrument):
+        def request_start(self, event: RequestEvent):
+            assert event.elapsed is None
+            events.append(event)
+
+    metrics = Metrics()
+    instruments = Instruments(metrics)
+    async with MockTwitter(processing_delay=0.2) as mock:
+        twitter = Twitter(v1_auth, instruments=instruments)
+        twitter_v2 = TwitterV2(v2_auth, instruments=instruments)
+        mock.point(twitter, twitter_v2)
+        instruments.add(Recorder())
+
+        await twitter.upload_media((os.urandom(200_000), 'mp4'), chunk_size=64*1024)
+        await twitter_v2.me()
+        with pytest.raises(ApiError):
+            await twitter._upload_api.check_upload_status(Media(12345)) # type: ignore
+
+    assert metrics.counters['segments'] == 4
+    assert metrics.counters['segment_bytes'] == 200_000
+    # base64 segments are larger than the media
+    assert metrics.counters['request_bytes'] > 200_000 * 4/3
+    assert metrics.counters['response_bytes'] > 0
+    assert metrics.counters['processing_waits'] >= 1
+    assert metrics.counters['requests'] == len(events) == mock.requests['1.1/media/upload'] + 1
+    assert metrics.counters['errors'] == 1
+    assert metrics.latency['1.1/media/upload'].count == mock.requests['1.1/media/upload']
+    assert all(event.elapsed is not None and event.elapsed >= 0 for event in events)
+    assert metrics.statuses[('2/users/me', 200)] == 1
+
+async def test_rate_limit_waits_and_retries(v2_auth):
+    metrics = Metrics()
+    async with MockTwitter(rate_limit=1, rate_window=0.5) as mock:
+        twitter_v2 = TwitterV2(v2_auth, instruments=Instruments(metrics))
+        mock.point(twitter_v2)
+        await twitter_v2.me()
+        await twitter_v2.me()
+    assert metrics.counters['rate_limit_waits'] == 1
+    assert metrics.counters['rate_limit_wait_secs'] > 0
+
+def test_no_instruments_is_falsy():
+    instruments = Instruments()
+    assert not instruments
+    metrics = instruments.add(Metrics())
+    assert instruments and len(instruments) == 1
+    instruments.remove(metrics)
+    assert not instruments
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from SlyTwitter import Twitter, TwitterV2
+from SlyTwitter.common import TwitterError
+from SlyTwitter.loader import BatchLoader
+
+async def test_loader_batches_and_dedupes():
+    batches: list[list[int]] = []
+
+    async def fetch(keys: list[int]):
+        batches.append(keys)
+        return {k: k*2 for k in keys if k != 13}
+
+    loader = BatchLoader(fetch, max_batch_size=4)
+
+    results = await asyncio.gather(*(loader.load(k) for k in [1, 2, 2, 3, 4, 5, 1]))
+    assert results == [2, 4, 4, 6, 8, 10, 2]
+    assert batches == [[1, 2, 3, 4], [5]]
+
+    with pytest.raises(TwitterError):
+        await loader.load(13)
+
+async def test_loader_window():
+    batches: list[list[str]] = []
+
+    async def fetch(keys: list[str]):
+        batches.append(keys)
+        return {k: k for k in keys}
+
+    loader = BatchLoader(fetch, window=0.02)
+
+    async def later(key: str):
+        await asyncio.sleep(0.005)
+        return await loader.load(key)
+
+    await asyncio.gather(loader.load('a'), later('b'))
+    assert batches == [['a', 'b']]
+
+async def test_loader_batch_cancelled():
+    calls = 0
+
+    async def fetch(keys: list[str]):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(10)
+        return {k: k for k in keys}
+
+    loader = BatchLoader(fetch)
+    waiting = asyncio.ensure_future(loader.load('a'))
+    await asyncio.sleep(0.01)
+    for task in loader._running:
+        task.cancel() # as at shutdown
+
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(waiting, 1)
+    assert await asyncio.wait_for(loader.load('a'), 1) == 'a'
+
+async def test_twitter_user_batching(v1_auth, v2_auth, serve):
+    requests: list[str] = []
+
+    async def v1_lookup(request: web.Request):
+        requests.append(request.path)
+        return web.json_response([
+            {'id': int(i), 'screen_name': F'user{i}', 'name': 'User', 'location': '', 'url': None}
+            for i in request.query['user_id'].split(',')])
+
+    async def v2_lookup(request: web.Request):
+        requests.append(request.path)
+        return web.json_response({'data': [
+            {'id': '1', 'username': name.capitalize(), 'name': 'User'}
+            for name in request.query['usernames'].split(',')]})
+
+    app = web.Application()
+    app.router.add_get('/1.1/users/lookup.json', v1_lookup)
+    app.router.add_get('/2/users/by', v2_lookup)
+    url = await serve(app)
+    twitter = Twitter(v1_auth, batch_window=0)
+    twitter.base_url = url + '/1.1'
+    twitter_v2 = TwitterV2(v2_auth, batch_window=0)
+    twitter_v2.base_url = url + '/2/'
+
+    users = await asyncio.gather(*(twitter.user(i) for i in range(10)))
+    users_v2 = await asyncio.gather(twitter_v2.user('a'), twitter_v2.user('@b'), twitter_v2.user('A'))
+
+    assert [u.id for u in users] == list(range(10))
+    assert [u.at for u in users_v2] == ['A', 'B', 'A']
+    assert requests == ['/1.1/users/lookup.json', '/2/users/by']
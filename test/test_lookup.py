@@ -0,0 +1,59 @@
+from aiohttp import web
+
+from SlyTwitter import Twitter, TwitterV2
+
+def v1_user(id_: int):
+    return {'id': id_, 'screen_name': F'user{id_}', 'name': F'User {id_}', 'location': '', 'url': None}
+
+async def test_lookup_users_batches(v1_auth, serve):
+    batches: list[tuple[str, int]] = []
+
+    async def handle(request: web.Request):
+        [(key, value)] = request.query.items()
+        values = value.split(',')
+        batches.append((key, len(values)))
+        if key == 'user_id':
+            return web.json_response([v1_user(int(v)) for v in values])
+        return web.json_response([v1_user(int(v.removeprefix('user'))) for v in values if v != 'missing'])
+
+    app = web.Application()
+    app.router.add_get('/1.1/users/lookup.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    users = await twitter.lookup_users(*range(250), '@user1000', 'https://twitter.com/user1001', 'missing')
+
+    assert sorted(batches) == [('screen_name', 3), ('user_id', 50), ('user_id', 100), ('user_id', 100)]
+    assert sorted(u.id for u in users) == [*range(250), 1000, 1001]
+
+async def test_lookup_users_all_missing(v1_auth, serve):
+    async def handle(request: web.Request):
+        if request.query.get('screen_name') == 'missing1,missing2':
+            return web.json_response({'errors': [{'code': 17, 'message': 'No user matches for specified terms.'}]}, status=404)
+        return web.json_response([v1_user(int(v)) for v in request.query['user_id'].split(',')])
+
+    app = web.Application()
+    app.router.add_get('/1.1/users/lookup.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    assert await twitter.lookup_users('@missing1', '@missing2') == []
+    assert [u.id for u in await twitter.lookup_users(1, '@missing1', '@missing2')] == [1]
+
+async def test_users_v2(v2_auth, serve):
+    async def handle(request: web.Request):
+        assert request.headers['Authorization'] == 'Bearer token'
+        if 'ids' in request.query:
+            return web.json_response({'data': [
+                {'id': v, 'username': F'user{v}', 'name': F'User {v}'} for v in request.query['ids'].split(',')]})
+        return web.json_response({'errors': [{'title': 'Not Found Error'}]})
+
+    app = web.Application()
+    app.router.add_get('/2/users', handle)
+    app.router.add_get('/2/users/by', handle)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = await serve(app) + '/2/'
+
+    users = [u async for u in twitter.users(1, 2, 3, 'nobody')]
+
+    assert sorted(u.id for u in users) == [1, 2, 3]
@@ -0,0 +1,36 @@
+import os
+
+from SlyTwitter import Twitter, TwitterV2
+from SlyTwitter.mock import MockTwitter, user_id_of
+from SlyTwitter.twitter_upload import AppendEncoding
+
+async def test_mock_upload_and_tweet(v1_auth):
+    async with MockTwitter(processing_delay=0.5, rate_limit=100) as mock:
+        twitter = Twitter(v1_auth)
+        mock.point(twitter)
+        states: list[str] = []
+        twitter.processing.on_progress(lambda media, state, percent: states.append(state))
+
+        for encoding in AppendEncoding:
+            media = await twitter.upload_media((os.urandom(300_000), 'mp4'), chunk_size=64*1024, concurrency=3, encoding=encoding)
+            assert media.id > 0
+        tweet = await twitter.tweet('hello', [media])
+
+        assert tweet.body == 'hello'
+        assert states[-1] == 'succeeded'
+        assert mock.requests['1.1/media/upload'] >= 2 * (1 + 5 + 1)
+        assert twitter.rate_limits.remaining('1.1/statuses/update') == 99
+
+async def test_mock_follows(v1_auth, v2_auth):
+    async with MockTwitter(followers=2500, following=300) as mock:
+        twitter, twitter_v2 = Twitter(v1_auth), TwitterV2(v2_auth)
+        mock.point(twitter, twitter_v2)
+
+        follower_ids = await twitter.follower_ids(5, page_size=1000)
+        followers = await (await twitter_v2.all_followers_of(await twitter_v2.user('user5')))
+        following = await (await twitter_v2.all_followed_by(await twitter_v2.me(), page_size=100))
+
+        assert follower_ids == [user.id for user in followers] == list(range(2500, 0, -1))
+        assert len(following) == 300 and mock.requests['2/users/:id/following'] == 3
+        relationship = await twitter.check_follow('@user1', '@someone')
+        assert relationship.b.id == user_id_of('someone')
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from SlyTwitter import twitter, twitter_v2
+from SlyTwitter.twitter_upload import Media
+
+def v1_user(id_: int, at: str):
+    return {'id': id_, 'screen_name': at, 'name': at.title(), 'location': '', 'url': None,
+        'description': 'hello', 'verified': False, 'protected': True,
+        'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'profile_image_url_https': 'https://pbs.twimg.com/a.png'}
+
+def test_models_have_no_dict():
+    models = [twitter.User(v1_user(1, 'a')), twitter.Tweet(1), twitter_v2.User(1), twitter_v2.Tweet(1), Media(1)]
+    for model in models:
+        assert not hasattr(model, '__dict__')
+
+def test_v1_user_extended_fields():
+    user = twitter.User(v1_user(1, 'a'))
+
+    assert user._created_at is None # not parsed until read
+    assert user.created_at == datetime.fromisoformat('2018-10-10T20:19:24+00:00')
+    assert user.description == 'hello' and user.is_private and not user.is_verified
+
+    partial = twitter.User('@a')
+    assert partial.created_at is None and partial.location is None
+
+def test_models_dedupe():
+    users = {twitter.User(v1_user(1, 'a')), twitter.User(1), twitter.User('A'), twitter.User('@a')}
+    assert len(users) == 2
+
+    v2_users = {twitter_v2.User({'id': '5', 'username': 'b', 'name': 'B'}), twitter_v2.User(5)}
+    assert len(v2_users) == 1
+
+    tweets = {twitter.Tweet(3), twitter.Tweet('https://twitter.com/a/status/3')}
+    assert len(tweets) == 1
+
+V1_USER_ATTRS = ['id', 'at', 'display_name', 'location', 'website', 'description', 'is_verified', 'is_private', 'created_at', 'profile_image']
+V2_USER_ATTRS = ['id', 'at', 'display_name', 'description', 'location', 'pinned_tweet_id', 'pinned_tweet', 'followers_count', 'created_at']
+V2_TWEET_ATTRS = ['id', 'body', 'author_id', 'author', 'lang', 'referenced_tweets', 'like_count', 'created_at']
+
+def same(a: object, b: object, attrs: list[str]) -> bool:
+    return type(a) is type(b) and all(getattr(a, attr) == getattr(b, attr) for attr in attrs)
+
+def test_v1_from_page_matches_constructors():
+    items = [v1_user(1, 'a'), {'id': 2, 'screen_name': 'b', 'name': 'B', 'location': 'here', 'url': 'https://b'},
+        # an extra key that is not an extended field
+        {'id': 4, 'screen_name': 'd', 'name': 'D', 'location': '', 'url': None, 'id_str': '4'}]
+    for fast, slow in zip(twitter.User.from_page(items), map(twitter.User, items), strict=True):
+        assert same(fast, slow, V1_USER_ATTRS)
+    assert [u.description for u in twitter.User.from_page(items)] == ['hello', None, None]
+    # mixed shapes fall back to matching each
+    following = {'followed_by': True, 'id': 3, 'screen_name': 'c'}
+    assert [u.id for u in twitter.User.from_page([*items, following])] == [1, 2, 4, 3]
+
+    tweets = [{'id': 1, 'text': 'a', 'user': {'screen_name': 'a'}},
+              {'id': 2, 'full_text': 'b', 'user': {'screen_name': 'b'}},
+              {'id': 3, 'text': 'c…', 'extended_tweet': {'full_text': 'c!'}, 'user': {'screen_name': 'c'}}]
+    for fast, slow in zip(twitter.Tweet.from_page(tweets), map(twitter.Tweet, tweets), strict=True):
+        assert same(fast, slow, ['id', 'body', 'author_at'])
+
+def test_v2_from_page_matches_constructors():
+    page = {
+        'data': [
+            {'id': '1', 'username': 'a', 'name': 'A', 'pinned_tweet_id': '10', 'description': 'hi',
+                'public_metrics': {'followers_count': 4}, 'created_at': '2020-01-01T00:00:00.000Z',
+                'entities': {'description': {'hashtags': [{'tag': 'hi'}]}}},
+            {'id': '2', 'username': 'b', 'name': 'B'},
+        ],
+        'includes': {
+            'users': [{'id': '3', 'username': 'c', 'name': 'C'}],
+            'tweets': [{'id': '10', 'text': 'pinned', 'author_id': '3', 'lang': 'en', 'edit_history_tweet_ids': ['10'],
+                'referenced_tweets': [{'type': 'quoted', 'id': '11'}], 'public_metrics': {'like_count': 2}}],
+        }
+    }
+    includes = twitter_v2.Includes(page)
+    for fast, slow in zip(twitter_v2.User.from_page(page['data'], includes),
+            [twitter_v2.User(u, includes) for u in page['data']], strict=True):
+        assert same(fast, slow, V2_USER_ATTRS)
+        assert not hasattr(fast, '__dict__')
+        assert fast._fields is None or 'entities' not in fast._fields # only fields that are read are kept
+
+    tweets = page['includes']['tweets'] + [{'id': '12', 'text': 'plain'}]
+    for fast, slow in zip(twitter_v2.Tweet.from_page(tweets, includes),
+            [twitter_v2.Tweet(t, includes) for t in tweets], strict=True):
+        assert same(fast, slow, V2_TWEET_ATTRS)
+        assert fast._fields is None or 'edit_history_tweet_ids' not in fast._fields
+    assert twitter_v2.Tweet.from_page(tweets, includes)[0].author.at == 'c'
+
+    try:
+        twitter_v2.User.from_page([{'id': '1', 'username': 'a', 'name': 'A'}, {'id': '2'}])
+    except ValueError as e:
+        assert 'Unknown source for User' in str(e)
+    else:
+        assert False, "a malformed user should fail as it would alone"
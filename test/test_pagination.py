@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from SlyTwitter import TwitterV2
+from SlyTwitter.pagination import Paginated
+from SlyTwitter.twitter_v2 import User
+from SlyAPI.web import ApiError
+
+def pages_of(n_pages: int, per_page: int, fail_at: int | None = None):
+    '''Fetcher for fake pages, which records when each is fetched'''
+    log: list[str] = []
+
+    async def fetch(token: str | None):
+        index = int(token or 0)
+        log.append(F'fetch {index}')
+        if index == fail_at:
+            raise ApiError(429, 'Too Many Requests', None)
+        await asyncio.sleep(0.01)
+        items = list(range(index*per_page, (index+1)*per_page))
+        return items, str(index+1) if index+1 < n_pages else None
+    return fetch, log
+
+@pytest.mark.parametrize('prefetch', [True, False])
+async def test_paginated_prefetches(prefetch: bool):
+    fetch, log = pages_of(3, 2)
+    paginated = Paginated(fetch, prefetch=prefetch)
+
+    async for page in paginated.pages():
+        log.append(F'start {page[0]}')
+        await asyncio.sleep(0.01)
+        log.append(F'end {page[0]}')
+
+    if prefetch:
+        assert log[:4] == ['fetch 0', 'start 0', 'fetch 1', 'end 0']
+    else:
+        assert log[:4] == ['fetch 0', 'start 0', 'end 0', 'fetch 1']
+    assert paginated.done and paginated.pages_fetched == 3
+
+async def test_paginated_resumes():
+    fetch, _ = pages_of(4, 2, fail_at=2)
+    paginated = Paginated(fetch)
+    items: list[int] = []
+
+    with pytest.raises(ApiError):
+        async for item in paginated:
+            items.append(item)
+    assert paginated.resume_token == '2'
+
+    fetch, _ = pages_of(4, 2)
+    items += await Paginated(fetch, paginated.resume_token)
+    assert items == list(range(8))
+
+async def test_paginated_limit():
+    fetch, log = pages_of(10, 3)
+
+    assert await Paginated(fetch, limit=5) == [0, 1, 2, 3, 4]
+    assert log == ['fetch 0', 'fetch 1']
+
+async def test_followers_pages(v2_auth, serve):
+    queries: list[dict[str, str]] = []
+
+    async def handle(request: web.Request):
+        queries.append(dict(request.query))
+        page = int(request.query.get('pagination_token', 0))
+        return web.json_response({
+            'data': [{'id': str(page*10 + i), 'username': 'u', 'name': 'U'} for i in range(10)],
+            'meta': {'result_count': 10} | ({'next_token': str(page+1)} if page < 2 else {})
+        })
+
+    app = web.Application()
+    app.router.add_get('/2/users/{id}/followers', handle)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = await serve(app) + '/2/'
+
+    followers = await (await twitter.all_followers_of(User(5)))
+
+    assert [u.id for u in followers] == list(range(30))
+    assert queries[0] == {'max_results': '1000'}
+    assert queries[2] == {'max_results': '1000', 'pagination_token': '2'}
@@ -0,0 +1,45 @@
+import time
+
+from aiohttp import web
+
+from SlyTwitter import OAuth1, TwitterPool
+from SlyAPI.oauth1 import OAuth1App, OAuth1User
+
+def account(token: str) -> OAuth1:
+    return OAuth1(
+        OAuth1App('key', 'secret', 'https://request', 'https://authorize', 'https://access'),
+        OAuth1User(token, 'secret'))
+
+def user_json(id_: int):
+    return {'id': id_, 'screen_name': F'user{id_}', 'name': F'User {id_}', 'location': '', 'url': None}
+
+async def test_pool_spreads_and_fails_over(serve):
+    tokens: list[str] = []
+
+    async def handle(request: web.Request):
+        token = request.headers['Authorization'].split('oauth_token="')[1].split('"')[0]
+        tokens.append(token)
+        if token == 'limited':
+            return web.json_response({'errors': []}, status=429, headers={
+                'x-rate-limit-limit': '900', 'x-rate-limit-remaining': '0',
+                'x-rate-limit-reset': str(int(time.time()) + 900)})
+        return web.json_response(user_json(int(request.query['user_id'])), headers={
+            'x-rate-limit-limit': '900', 'x-rate-limit-remaining': '899',
+            'x-rate-limit-reset': str(int(time.time()) + 900)})
+
+    app = web.Application()
+    app.router.add_get('/1.1/users/show.json', handle)
+    url = await serve(app)
+
+    async with TwitterPool({'a': account('a'), 'b': account('b'), 'limited': account('limited')}) as pool:
+        for client in pool.clients.values():
+            client.base_url = url + '/1.1'
+
+        users = [await pool.user(i) for i in range(6)]
+
+        assert [u.id for u in users] == list(range(6))
+        # the limited account is tried once, then avoided
+        assert tokens.count('limited') == 1
+        assert abs(tokens.count('a') - tokens.count('b')) <= 1
+        assert pool.pick('1.1/users/show') != 'limited'
+    assert pool.session.closed
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from aiohttp import web
+
+from SlyTwitter import Twitter
+from SlyTwitter.ratelimit import RateLimiter, endpoint_family
+
+def test_endpoint_family():
+    assert endpoint_family('https://api.twitter.com/1.1/statuses/update.json') == '1.1/statuses/update'
+    assert endpoint_family('https://api.twitter.com/1.1/statuses/destroy/123.json') == '1.1/statuses/destroy/:id'
+    assert endpoint_family('https://api.twitter.com/2/users/by/username/dunkyl_') == '2/users/by/username/:username'
+    assert endpoint_family('https://api.twitter.com/2/users/42/followers?max_results=10') == '2/users/:id/followers'
+
+async def test_limiter_waits_for_reset():
+    limiter = RateLimiter()
+    reset = time.time() + 0.2
+    limiter.update('x', 200, {'x-rate-limit-limit': '2', 'x-rate-limit-remaining': '1', 'x-rate-limit-reset': str(reset)})
+
+    assert await limiter.acquire('x') == 0
+    assert limiter.remaining('x') == 0
+    assert limiter.wait_time('x') > 0
+    assert limiter.remaining('unknown') is None
+
+async def test_retries_429(monkeypatch: pytest.MonkeyPatch, v1_auth, serve):
+    monkeypatch.setattr('SlyTwitter.ratelimit.RESET_MARGIN_SECS', 0)
+    requests = 0
+
+    async def handle(request: web.Request):
+        nonlocal requests
+        requests += 1
+        headers = {
+            'x-rate-limit-limit': '300',
+            'x-rate-limit-remaining': '0' if requests == 1 else '299',
+            'x-rate-limit-reset': str(time.time() + 0.1),
+        }
+        if requests == 1:
+            return web.Response(status=429, headers=headers)
+        return web.json_response({
+            'relationship': {
+                'source': {'id': 1, 'screen_name': 'a', 'following': True, 'followed_by': False},
+                'target': {'id': 2, 'screen_name': 'b', 'following': False, 'followed_by': True},
+            }}, headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/1.1/friendships/show.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+
+    follow = await twitter.check_follow('a', 'b')
+
+    assert str(follow) == '@a follows @b'
+    assert requests == 2
+    assert twitter.rate_limits.remaining('1.1/friendships/show') == 299
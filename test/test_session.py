@@ -0,0 +1,29 @@
+from aiohttp import web
+
+from SlyTwitter import Twitter, TwitterSession, TwitterV2
+
+async def test_clients_share_session(v1_auth, v2_auth, serve):
+    async def handle(request: web.Request):
+        return web.json_response({'data': {'id': '1', 'username': 'a', 'name': 'A'}})
+
+    app = web.Application()
+    app.router.add_get('/2/users/me', handle)
+    url = await serve(app)
+
+    async with TwitterSession(limit_per_host=4) as session:
+        accounts = [TwitterV2(v2_auth, session=session) for _ in range(3)]
+        twitter = Twitter(v1_auth, session=session)
+        assert twitter._upload_api._client is session.client # type: ignore
+        assert all(account._client is session.client for account in accounts) # type: ignore
+        assert session.client.connector is not None and session.client.connector.limit_per_host == 4
+
+        for account in accounts:
+            account.base_url = url + '/2/'
+            assert (await account.me()).at == 'a'
+        del accounts # clients do not close the shared session
+        assert not session.closed
+    assert session.closed
+
+async def test_upload_shares_client(v1_auth):
+    twitter = Twitter(v1_auth)
+    assert twitter._upload_api._client is twitter._client # type: ignore
@@ -0,0 +1,38 @@
+import base64
+
+from SlyAPI.oauth1 import _hmac_sign, percentEncode
+from SlyAPI.web import Method, Request
+
+from SlyTwitter.signing import OAuth1Signer, percent_encode
+
+def test_percent_encode_matches():
+    for value in ['abc-._~', 'a b+c/d=e&f', 'ünïcödé ☃', '']:
+        assert percent_encode(value) == percentEncode(value)
+
+def test_signature_matches(v1_auth):
+    request = Request(Method.POST, 'https://upload.twitter.com/1.1/media/upload.json',
+        {'command': 'APPEND', 'segment_index': 3},
+        data={'media_id': '123', 'media': base64.b64encode(bytes(range(256))*16).decode('ascii')})
+    signing_params = {
+        'oauth_consumer_key': v1_auth.app.key,
+        'oauth_nonce': 'n0nce',
+        'oauth_signature_method': 'HMAC-SHA1',
+        'oauth_timestamp': '1234567890',
+        'oauth_version': '1.0',
+        'oauth_token': v1_auth.user.key,
+    }
+    # SlyAPI only signs string query parameters
+    expected_request = Request(request.method, request.url, {'command': 'APPEND', 'segment_index': '3'}, data=request.data)
+    expected = _hmac_sign(expected_request, signing_params, v1_auth.app.secret, v1_auth.user.secret)
+
+    signer = OAuth1Signer(v1_auth)
+    assert signer.signature(request, 'n0nce', '1234567890') == expected
+
+    # new credentials are picked up
+    v1_auth.user.secret = 'other'
+    assert signer.signature(request, 'n0nce', '1234567890') != expected
+
+def test_sign_sets_header(v1_auth):
+    request = OAuth1Signer(v1_auth).sign(Request(Method.GET, 'https://api.twitter.com/1.1/users/show.json', {'user_id': 1}))
+    header = request.headers['Authorization']
+    assert header.startswith('OAuth ') and 'oauth_signature="' in header and 'oauth_token="key"' in header
@@ -0,0 +1,63 @@
+from aiohttp import web
+
+from SlyTwitter import Twitter, TwitterV2
+from SlyTwitter.mock import MockTwitter
+from SlyTwitter.snapshots import SnapshotStore, sync_follows
+from SlyTwitter.twitter import User
+
+def test_store_merge_and_churn(tmp_path):
+    path = str(tmp_path / 'follows.db')
+    with SnapshotStore(path) as store:
+        store.merge(1, 'followers', [2, 3, 4], full=True, at=100)
+        churn = store.merge(1, 'followers', [3, 4, 5], full=True, at=200)
+        assert list(churn.gained) == [5] and list(churn.lost) == [2]
+        # incremental syncs only add
+        store.merge(1, 'followers', [6], full=False, at=300)
+
+    with SnapshotStore(path) as store:
+        assert list(store.ids(1, 'followers')) == [3, 4, 5, 6]
+        assert store.last_synced(1) == 300 and store.last_synced(1, full=True) == 200
+        since_first = store.churn(1, 'followers', since=100)
+        assert list(since_first.gained) == [5, 6] and list(since_first.lost) == [2]
+        assert list(store.snapshot(User(1)).followers) == [3, 4, 5, 6]
+
+async def test_incremental_sync_stops_at_known(v1_auth, serve):
+    followers = list(range(1000, 0, -1)) # newest first
+    cursors: list[str] = []
+
+    async def handle(request: web.Request):
+        cursor = int(request.query['cursor'])
+        cursors.append(request.query['cursor'])
+        count = int(request.query['count'])
+        start = 0 if cursor == -1 else cursor
+        next_cursor = start+count if start+count < len(followers) else 0
+        return web.json_response({'ids': followers[start:start+count], 'next_cursor_str': str(next_cursor)})
+
+    app = web.Application()
+    app.router.add_get('/1.1/followers/ids.json', handle)
+    twitter = Twitter(v1_auth)
+    twitter.base_url = await serve(app) + '/1.1'
+    store = SnapshotStore()
+
+    first = await sync_follows(store, twitter, User(1), 'followers', page_size=100)
+    assert len(first.gained) == 1000 and len(cursors) == 10
+
+    cursors.clear()
+    followers[:0] = [1002, 1001]
+    second = await sync_follows(store, twitter, User(1), 'followers', page_size=100, known_run=50)
+    assert list(second.gained) == [1001, 1002] and not second.lost
+    assert len(cursors) == 1
+    assert len(store.ids(1, 'followers')) == 1002
+
+async def test_incremental_sync_fetches_no_pages_ahead(v1_auth, v2_auth):
+    async with MockTwitter(followers=5000) as mock:
+        twitter, twitter_v2 = Twitter(v1_auth), TwitterV2(v2_auth)
+        mock.point(twitter, twitter_v2)
+        store, store_v2 = SnapshotStore(), SnapshotStore()
+        user_v2 = await twitter_v2.user('user5')
+
+        for _ in range(2):
+            await sync_follows(store, twitter, User(user_v2.id), 'followers', page_size=1000)
+            await sync_follows(store_v2, twitter_v2, user_v2, 'followers', page_size=1000)
+        # 5 pages at first, then only the first page
+        assert mock.requests['1.1/followers/ids'] == mock.requests['2/users/:id/followers'] == 6
@@ -0,0 +1,163 @@
+import asyncio, json, time
+
+import pytest
+from aiohttp import web
+from SlyAPI.web import ApiError
+
+from SlyTwitter import TwitterV2
+from SlyTwitter import stream
+from SlyTwitter.stream import NDJSONDecoder, OverflowPolicy, StreamRule
+
+def tweet_line(id_: int) -> bytes:
+    return json.dumps({'data': {'id': str(id_), 'text': F'tweet {id_}', 'author_id': '1'},
+        'includes': {'users': [{'id': '1', 'username': 'a', 'name': 'A'}]},
+        'matching_rules': [{'id': '10', 'tag': 'cats'}]}).encode() + b'\r\n'
+
+def test_decoder_splits_lines_across_chunks():
+    decoder = NDJSONDecoder()
+    data = tweet_line(1) + b'\r\n' + tweet_line(2)
+    values = []
+    for i in range(0, len(data), 7):
+        values += decoder.feed(data[i:i+7])
+    assert [v['data']['id'] for v in values] == ['1', '2']
+    assert decoder.heartbeats == 1
+    assert decoder.feed(b'{"data": ') == []
+    decoder.reset()
+    assert decoder.feed(b'{}\n') == [{}]
+
+def test_reconnect_delays():
+    assert [stream.reconnect_delay(asyncio.TimeoutError(), n) for n in (0, 1, 100)] == [0.25, 0.5, 16.0]
+    assert [stream.reconnect_delay(ApiError(503, None, None), n) for n in (0, 1, 100)] == [5.0, 10.0, 320.0]
+    assert [stream.reconnect_delay(ApiError(429, None, None), n) for n in (0, 1, 100)] == [60.0, 120.0, 960.0]
+
+async def test_stream_rules(v2_auth, serve):
+    rules = {'1': {'id': '1', 'value': 'cats', 'tag': 'cats'}}
+
+    async def get_rules(request: web.Request):
+        return web.json_response({'data': list(rules.values()), 'meta': {}})
+
+    async def post_rules(request: web.Request):
+        body = await request.json()
+        if 'add' in body:
+            if any(not r['value'] for r in body['add']):
+                return web.json_response({'errors': [{'title': 'Invalid Rule'}], 'meta': {}})
+            added = [{'id': str(len(rules) + i + 1), **r} for i, r in enumerate(body['add'])]
+            if request.query.get('dry_run') != 'true':
+                rules.update((r['id'], r) for r in added)
+            return web.json_response({'data': added, 'meta': {}})
+        for id_ in body['delete']['ids']:
+            del rules[id_]
+        return web.json_response({'meta': {}})
+
+    app = web.Application()
+    app.router.add_get('/2/tweets/search/stream/rules', get_rules)
+    app.router.add_post('/2/tweets/search/stream/rules', post_rules)
+    url = await serve(app)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = url + '/2/'
+
+    assert await twitter.add_stream_rules('dogs', dry_run=True) == [StreamRule('dogs', id=2)]
+    added = await twitter.add_stream_rules(StreamRule('dogs', 'dogs'))
+    assert added == [StreamRule('dogs', 'dogs', 2)]
+    assert {r.value for r in await twitter.stream_rules()} == {'cats', 'dogs'}
+    await twitter.delete_stream_rules(added[0], 1)
+    assert await twitter.stream_rules() == []
+    with pytest.raises(Exception):
+        await twitter.add_stream_rules('')
+
+async def test_stream_reconnects_without_losing_tweets(v2_auth, serve, monkeypatch):
+    monkeypatch.setattr(stream, 'NETWORK_BACKOFF_STEP', 0.01)
+    connections: list[dict[str, str]] = []
+
+    async def handle(request: web.Request):
+        connections.append(dict(request.query))
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        match len(connections):
+            case 1: # tweets split across writes, then dropped partway through a line
+                data = tweet_line(1) + b'\r\n' + tweet_line(2)
+                await resp.write(data[:20])
+                await resp.write(data[20:] + tweet_line(3)[:10])
+            case 2: # silent, until the heartbeat timeout
+                await asyncio.sleep(1)
+            case _: # backfill repeats a tweet
+                await resp.write(tweet_line(2) + tweet_line(3) + tweet_line(4))
+                await asyncio.sleep(1)
+        return resp
+
+    app = web.Application()
+    app.router.add_get('/2/tweets/search/stream', handle)
+    url = await serve(app)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = url + '/2/'
+
+    async with twitter.stream(expansions=[], heartbeat_timeout=0.2, backfill_minutes=2) as tweets:
+        received = []
+        async for tweet, rules in tweets.matches():
+            received.append(tweet)
+            assert tweet.author.at == 'a' and rules[0].tag == 'cats'
+            if len(received) == 4:
+                break
+
+    assert [t.id for t in received] == [1, 2, 3, 4]
+    assert tweets.reconnects == 2
+    assert 'backfill_minutes' not in connections[0] and connections[2]['backfill_minutes'] == '2'
+
+async def test_stream_gives_up_on_stalled_server(v2_auth, serve):
+    async def handle(request: web.Request):
+        await asyncio.sleep(1) # accepts the connection, but does not answer
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_get('/2/tweets/sample/stream', handle)
+    url = await serve(app)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = url + '/2/'
+
+    tweets = twitter.stream(sample=True, heartbeat_timeout=0.2, max_reconnects=0)
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await tweets.__anext__()
+    assert time.monotonic() - started < 0.8 and not tweets.connected
+
+async def test_stream_overflow_and_fatal_errors(v2_auth, serve):
+    async def handle(request: web.Request):
+        if request.query.get('tweet.fields') == 'lang':
+            return web.json_response({'title': 'Unauthorized'}, status=401)
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        await resp.write(b''.join(tweet_line(i) for i in range(1, 6)))
+        return resp
+
+    app = web.Application()
+    app.router.add_get('/2/tweets/sample/stream', handle)
+    url = await serve(app)
+    twitter = TwitterV2(v2_auth)
+    twitter.base_url = url + '/2/'
+
+    for overflow, expected in [(OverflowPolicy.DROP_OLDEST, [4, 5]), (OverflowPolicy.DROP_NEWEST, [1, 2])]:
+        tweets = twitter.stream(sample=True, buffer_size=2, overflow=overflow, max_reconnects=0)
+        tweets.start()
+        while tweets.dropped < 3:
+            await asyncio.sleep(0.01)
+        with pytest.raises(stream.StreamDisconnected):
+            async for tweet in tweets:
+                assert tweet.id == expected.pop(0)
+        assert not expected
+
+    tweets = twitter.stream(sample=True, buffer_size=1, max_reconnects=0)
+    assert [tweet.id async for tweet in _until_closed(tweets, 5)] == [1, 2, 3, 4, 5]
+
+    from SlyTwitter.twitter_v2 import TweetField
+    with pytest.raises(ApiError) as error:
+        async for _ in twitter.stream(sample=True, tweet_fields=[TweetField.LANG]):
+            pass
+    assert error.value.status == 401
+
+async def _until_closed(tweets: stream.TweetStream, count: int):
+    async with tweets:
+        async for tweet in tweets:
+            yield tweet
+            count -= 1
+            if not count:
+                return
@@ -0,0 +1,138 @@
+import asyncio
+
+from aiohttp import web
+
+from SlyTwitter import Twitter, TwitterV2, WatermarkStore
+from SlyTwitter.timelines import Timeline, TimelinePoller, mentions_timeline, poll, user_timeline
+from SlyTwitter.twitter_v2 import User as UserV2
+
+class FakeTweet:
+    def __init__(self, id_: int):
+        self.id = id_
+
+class FakeTimeline:
+    '''Tweets with IDs 1 to `count`, fetched like twitter does, leaving out `hidden` ones after counting'''
+    def __init__(self, count: int = 0):
+        self.ids = list(range(1, count + 1))
+        self.hidden: set[int] = set()
+        self.requests: list[tuple[int | None, int | None]] = []
+
+    async def fetch(self, since_id: int | None, before_id: int | None, count: int):
+        self.requests.append((since_id, before_id))
+        ids = [i for i in reversed(self.ids) if (since_id is None or i > since_id) and (before_id is None or i < before_id)]
+        return [FakeTweet(i) for i in ids[:count] if i not in self.hidden], len(ids) > count
+
+def ids(tweets) -> list[int]:
+    return [tweet.id for tweet in tweets]
+
+async def test_poll_fetches_only_new_tweets(tmp_path):
+    fake = FakeTimeline(25)
+    timeline = Timeline('fake', fake.fetch, 10)
+    path = str(tmp_path / 'marks.db')
+    with WatermarkStore(path) as store:
+        assert ids(await poll(store, timeline, at=0)) == list(range(16, 26)) # only the latest page at first
+        assert ids(await poll(store, timeline, at=10)) == []
+        fake.ids += range(26, 61)
+        # 35 new tweets, 2 pages at a time: the newest 20, then the rest
+        assert ids(await poll(store, timeline, max_pages=2, at=20)) == list(range(41, 61))
+        assert store.get('fake').catching_up
+    with WatermarkStore(path) as store:
+        fake.ids += [61]
+        assert ids(await poll(store, timeline, max_pages=2, at=30)) == list(range(26, 41))
+        mark = store.get('fake')
+        assert mark.since_id == 60 and not mark.catching_up and mark.rate > 0
+        assert ids(await poll(store, timeline, at=40)) == [61]
+    assert fake.requests[-1] == (60, None)
+
+async def test_poll_reads_past_short_pages():
+    fake = FakeTimeline(5)
+    timeline = Timeline('fake', fake.fetch, 10)
+    store = WatermarkStore()
+    await poll(store, timeline, at=0)
+    fake.ids += range(6, 31)
+    fake.hidden = {28, 29}
+    # the first page has 8 tweets, but older ones are still new
+    assert ids(await poll(store, timeline, at=10)) == [i for i in range(6, 31) if i not in (28, 29)]
+    assert store.get('fake').since_id == 30 and len(fake.requests) == 4
+
+async def test_poller_adapts_to_activity():
+    busy, quiet = FakeTimeline(3), FakeTimeline(3)
+    store = WatermarkStore()
+    poller = TimelinePoller(store, [Timeline('busy', busy.fetch, 10), Timeline('quiet', quiet.fetch, 10)],
+        min_interval=10, max_interval=1000, target=5)
+    for now in range(0, 500, 10):
+        busy.ids.append(len(busy.ids) + 1)
+        await poller.poll_due(now)
+    assert poller.interval(store.get('quiet')) == 1000
+    assert poller.interval(store.get('busy')) < 100
+    assert len(busy.requests) > 3 * len(quiet.requests)
+
+    results = []
+    async def collect():
+        async for timeline, tweets in poller:
+            results.append((timeline.key, ids(tweets)))
+    poller.min_interval = poller.max_interval = 0.01
+    poller.remove('quiet')
+    poller.add(Timeline('busy', busy.fetch, 10))
+    busy.ids.append(len(busy.ids) + 1)
+    unseen = busy.ids[store.get('busy').since_id:] # type: ignore
+    task = asyncio.create_task(collect())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    assert results == [('busy', unseen)]
+
+async def test_poller_survives_errors_and_repeated_adds():
+    good = FakeTimeline(3)
+    async def broken(since_id: int | None, before_id: int | None, count: int):
+        raise KeyError('data')
+    store = WatermarkStore()
+    poller = TimelinePoller(store, [Timeline('good', good.fetch, 10), Timeline('broken', broken, 10)],
+        min_interval=10, max_interval=100)
+    poller.add(Timeline('good', good.fetch, 10))
+    results = await poller.poll_due(0)
+    assert sorted((timeline.key, ids(tweets)) for timeline, tweets in results) == [('broken', []), ('good', [1, 2, 3])]
+    assert isinstance(poller.errors['broken'], KeyError)
+    assert len(good.requests) == 1 and len(poller._due) == 2
+    assert poller.next_due() == 10
+    await poller.poll_due(100)
+    assert 'broken' in poller.errors and len(good.requests) == 2
+
+def tweet_v1(id_: int):
+    return {'id': id_, 'full_text': F'tweet {id_}', 'user': {'screen_name': 'a'}}
+
+async def test_timeline_endpoints(v1_auth, v2_auth, serve):
+    queries: list[dict[str, str]] = []
+
+    async def user_timeline_v1(request: web.Request):
+        queries.append(dict(request.query))
+        since, max_ = int(request.query.get('since_id', 0)), int(request.query.get('max_id', 10**9))
+        return web.json_response([tweet_v1(i) for i in range(12, 0, -1) if since < i <= max_][:int(request.query['count'])])
+
+    async def mentions_v2(request: web.Request):
+        queries.append(dict(request.query))
+        return web.json_response({'data': [{'id': '7', 'text': '@a hi', 'author_id': '2'}],
+            'includes': {'users': [{'id': '2', 'username': 'b', 'name': 'B'}]}, 'meta': {}})
+
+    app = web.Application()
+    app.router.add_get('/1.1/statuses/user_timeline.json', user_timeline_v1)
+    app.router.add_get('/1.1/statuses/mentions_timeline.json', user_timeline_v1)
+    app.router.add_get('/2/users/1/mentions', mentions_v2)
+    url = await serve(app)
+    twitter, twitter_v2 = Twitter(v1_auth), TwitterV2(v2_auth)
+    twitter.base_url, twitter_v2.base_url = url + '/1.1', url + '/2/'
+
+    page = await twitter.user_timeline('@a', since_id=3, max_id=9, count=4)
+    assert ids(page) == [9, 8, 7, 6] and page[0].body == 'tweet 9'
+    assert queries[-1]['screen_name'] == 'a' and queries[-1]['tweet_mode'] == 'extended'
+
+    store = WatermarkStore()
+    timeline = user_timeline(twitter, 5)
+    assert timeline.key == '1.1/statuses/user_timeline/5'
+    assert ids(await poll(store, timeline)) == list(range(1, 13))
+    assert await poll(store, mentions_timeline(twitter, '@a')) != []
+
+    me = UserV2({'id': '1', 'username': 'a', 'name': 'A'})
+    mentions = await poll(store, mentions_timeline(twitter_v2, me))
+    assert ids(mentions) == [7] and mentions[0].author.at == 'b'
+    await poll(store, mentions_timeline(twitter_v2, me))
+    assert queries[-1]['since_id'] == '7' and queries[-1]['max_results'] == '100'
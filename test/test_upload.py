@@ -0,0 +1,282 @@
+import asyncio, os, time
+from pathlib import Path
+
+import pytest
+from aiohttp import web, BodyPartReader
+
+from SlyTwitter import OAuth1
+from SlyTwitter.common import BatchError, TwitterError
+from SlyTwitter.media_cache import FileMediaStore, MediaCache, MemoryMediaStore
+from SlyTwitter.processing import ProcessingTracker
+from SlyTwitter.twitter_upload import AppendEncoding, Media, TwitterUpload
+from SlyAPI.web import ApiError
+
+class RecordingUpload(TwitterUpload):
+    '''Upload API that records chunked upload commands instead of sending them'''
+
+    def __init__(self, auth: OAuth1):
+        super().__init__(auth)
+        self.segments: dict[int, bytes] = {}
+        self.total = 0
+        self.simple: list[bytes] = []
+
+    async def simple_upload(self, data: bytes | memoryview, category: str):
+        self.simple.append(bytes(data))
+        return Media(len(self.simple))
+
+    async def init_upload(self, type_: str, size: int, category: str):
+        self.total = size
+        return Media(1)
+
+    async def append_upload(self, media: Media, index: int, chunk: bytes | memoryview, encoding: AppendEncoding = AppendEncoding.BASE64):
+        self.segments[index] = bytes(chunk)
+
+    async def finalize_upload(self, media: Media):
+        return {'media_id': media.id}
+
+async def test_upload_bytes_chunked(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+    data = os.urandom(10_000)
+
+    media = await uploader.upload((data, 'mp4'), chunk_size=4096)
+
+    assert media.id == 1
+    assert sorted(uploader.segments) == [0, 1, 2]
+    assert b''.join(uploader.segments[i] for i in range(3)) == data
+
+async def test_upload_file_chunked(v1_auth, tmp_path: Path):
+    uploader = RecordingUpload(v1_auth)
+    with open('test/test.jpg', 'rb') as f:
+        expected = f.read()
+    video = tmp_path / 'test.mp4'
+    video.write_bytes(expected)
+
+    await uploader.upload(str(video), chunk_size=16*1024)
+
+    assert uploader.total == len(expected)
+    assert all(len(uploader.segments[i]) == 16*1024 for i in range(len(uploader.segments)-1))
+    assert b''.join(uploader.segments[i] for i in range(len(uploader.segments))) == expected
+
+async def test_upload_async_iterator(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+    parts = [b'a'*3000, b'b'*5000, b'c'*100]
+
+    async def source():
+        for part in parts:
+            yield part
+
+    await uploader.upload((source(), 'webm', 8100), chunk_size=4096)
+
+    assert [len(uploader.segments[i]) for i in range(len(uploader.segments))] == [4096, 4004]
+    assert b''.join(uploader.segments.values()) == b''.join(parts)
+
+async def test_upload_async_iterator_wrong_size(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+
+    async def source():
+        yield b'a'*100
+
+    with pytest.raises(ValueError):
+        await uploader.upload((source(), 'mp4', 200))
+
+class FlakyUpload(RecordingUpload):
+    '''Upload API whose APPENDs fail once per segment, and tracks how many run at once'''
+
+    def __init__(self, auth: OAuth1):
+        super().__init__(auth)
+        self.attempts: dict[int, int] = {}
+        self.running = 0
+        self.max_running = 0
+        self.finalized_with = -1
+
+    async def append_upload(self, media: Media, index: int, chunk: bytes | memoryview, encoding: AppendEncoding = AppendEncoding.BASE64):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            self.attempts[index] = self.attempts.get(index, 0) + 1
+            if self.attempts[index] == 1:
+                raise ApiError(503, 'Service Unavailable', None)
+            await super().append_upload(media, index, chunk, encoding)
+        finally:
+            self.running -= 1
+
+    async def finalize_upload(self, media: Media):
+        self.finalized_with = len(self.segments)
+        return await super().finalize_upload(media)
+
+async def test_upload_parallel_retries(v1_auth, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr('SlyTwitter.twitter_upload.SEGMENT_RETRY_DELAY', 0)
+    uploader = FlakyUpload(v1_auth)
+    data = os.urandom(10*1024)
+
+    await uploader.upload((data, 'mp4'), chunk_size=1024, concurrency=4)
+
+    assert uploader.max_running == 4
+    assert uploader.finalized_with == 10
+    assert b''.join(uploader.segments[i] for i in range(10)) == data
+
+async def test_append_multipart(v1_auth, serve):
+    received: list[tuple[dict[str, str], bytes, str]] = []
+
+    async def handle(request: web.Request):
+        reader = await request.multipart()
+        part = await reader.next()
+        assert isinstance(part, BodyPartReader)
+        received.append((dict(request.query), await part.read(), request.headers['Authorization']))
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post('/media/upload.json', handle)
+    uploader = TwitterUpload(v1_auth)
+    uploader.base_url = await serve(app) + '/'
+    data = os.urandom(3000)
+
+    await uploader.append_upload(Media(7), 2, memoryview(data)[1000:], AppendEncoding.MULTIPART)
+
+    [(query, body, authorization)] = received
+    assert query == {'command': 'APPEND', 'media_id': '7', 'segment_index': '2'}
+    assert body == data[1000:]
+    assert authorization.startswith('OAuth ')
+
+async def test_upload_many_simple_images(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+    images = [(os.urandom(100+i), 'png') for i in range(5)]
+
+    media = await uploader.upload_many(images, concurrency=2)
+
+    assert len(media) == 5
+    for m, (data, _) in zip(media, images):
+        assert isinstance(m, Media)
+        assert uploader.simple[m.id-1] == data
+    assert not uploader.segments
+
+async def test_upload_many_errors(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+    files = [(b'a', 'png'), ('not a file', 'png', 'nor a size'), (b'b', 'png')]
+
+    with pytest.raises(BatchError) as e:
+        await uploader.upload_many(files) # type: ignore
+
+    assert list(e.value.errors) == [1]
+    assert isinstance(e.value.results[0], Media)
+    assert isinstance(e.value.results[2], Media)
+
+async def test_processing_tracker():
+    statuses = {
+        1: [('in_progress', 10), ('in_progress', 60), ('succeeded', 100)],
+        2: [('succeeded', 100)],
+        3: [('in_progress', 50), ('failed', 50)],
+    }
+    progress: list[tuple[int, str, int | None]] = []
+
+    async def poll(media: Media):
+        state, percent = statuses[media.id].pop(0)
+        return {'processing_info': {'state': state, 'check_after_secs': 0, 'progress_percent': percent}}
+
+    tracker = ProcessingTracker(poll)
+    tracker.on_progress(lambda media, state, percent: progress.append((media.id, state, percent)))
+    pending = {'processing_info': {'state': 'pending', 'check_after_secs': 0}}
+
+    results = await asyncio.gather(
+        *(tracker.wait(Media(i), pending) for i in (1, 2, 3)), return_exceptions=True)
+
+    assert isinstance(results[0], Media) and isinstance(results[1], Media)
+    assert isinstance(results[2], TwitterError)
+    assert all(not s for s in statuses.values())
+    assert (1, 'succeeded', 100) in progress
+    assert tracker.metrics.succeeded == 2
+    assert tracker.metrics.failed == 1
+    assert tracker.metrics.polls == 6
+    assert tracker.metrics.pending == 0
+
+async def test_processing_errors_fail_only_their_media():
+    async def poll(media: Media):
+        match media.id:
+            case 1: # malformed STATUS
+                raise KeyError('processing_info')
+            case 4:
+                await asyncio.sleep(0.05)
+        return {'processing_info': {'state': 'succeeded', 'progress_percent': 100}}
+
+    def callback(media: Media, state: str, percent: int | None):
+        if media.id == 2 and state == 'succeeded':
+            raise ValueError('callback failed')
+    seen: list[int] = []
+
+    tracker = ProcessingTracker(poll)
+    tracker.on_progress(callback)
+    tracker.on_progress(lambda media, state, percent: seen.append(media.id))
+    pending = {'processing_info': {'state': 'pending', 'check_after_secs': 0}}
+
+    cancelled = tracker.track(Media(4), pending)
+    waiting = asyncio.ensure_future(asyncio.gather(
+        *(tracker.wait(Media(i), pending) for i in (1, 2, 3)), return_exceptions=True))
+    await asyncio.sleep(0.01)
+    cancelled.cancel() # while it is being polled
+    results = await asyncio.wait_for(waiting, 5)
+
+    assert isinstance(results[0], KeyError)
+    assert isinstance(results[1], ValueError) and 2 in seen[4:]
+    assert isinstance(results[2], Media)
+    assert tracker.metrics.failed == 2 and tracker.metrics.succeeded == 1
+    # the tracker still works after errors
+    assert (await asyncio.wait_for(tracker.wait(Media(5), pending), 5)).id == 5
+
+async def test_media_cache_reuses_uploads(v1_auth, tmp_path: Path):
+    store_path = str(tmp_path / 'media.json')
+    uploader = RecordingUpload(v1_auth)
+    uploader.media_cache = MediaCache(FileMediaStore(store_path))
+    image = os.urandom(1000)
+    image_file = tmp_path / 'same.png'
+    image_file.write_bytes(image)
+
+    first = await uploader.upload((image, 'png'))
+    again = await uploader.upload((image, 'png'))
+    from_file = await uploader.upload(str(image_file))
+
+    assert first.id == again.id == from_file.id
+    assert len(uploader.simple) == 1
+    assert uploader.media_cache.hits == 2
+
+    # survives restarts
+    restarted = RecordingUpload(v1_auth)
+    restarted.media_cache = MediaCache(FileMediaStore(store_path))
+    assert (await restarted.upload(str(image_file))).id == first.id
+    assert not restarted.simple
+
+async def test_media_cache_hashes_streams(v1_auth):
+    uploader = RecordingUpload(v1_auth)
+    uploader.media_cache = MediaCache()
+    video = os.urandom(5000)
+
+    async def source():
+        yield video
+
+    first = await uploader.upload((source(), 'mp4', len(video)), chunk_size=1024)
+    again = await uploader.upload((video, 'mp4'))
+
+    assert first.id == again.id
+    assert len(uploader.segments) == 5
+
+def test_media_cache_saves_once_and_expires(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    store = FileMediaStore(str(tmp_path / 'media.json'))
+    saves: list[str] = []
+    monkeypatch.setattr(store, '_save', lambda: saves.append('save'))
+    cache = MediaCache(store)
+
+    cache.remember(['url:https://a/b.png', 'sha256:ab'], 7, None)
+    media_id, expires_at = cache.lookup('url:https://a/b.png') # type: ignore
+    assert media_id == 7 and expires_at is not None and expires_at - time.time() > 23*60*60
+    assert saves == ['save']
+
+def test_media_store_lru():
+    store = MemoryMediaStore(max_entries=2)
+    store.put('a', 1, None)
+    store.put('b', 2, None)
+    store.get('a')
+    store.put('c', 3, None)
+
+    assert store.get('b') is None
+    assert store.get('a') == (1, None)
+    assert len(store) == 2